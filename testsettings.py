@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 import django.conf.global_settings as DEFAULT_SETTINGS
 
 SECRET_KEY = 'workflow'
@@ -6,6 +9,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
+        # A file backed test database so that threads share it (see
+        # workflow.unit_tests.test_concurrency)
+        'TEST': {
+            'NAME': os.path.join(tempfile.gettempdir(), 'workflow_test_%d.sqlite3' % os.getpid()),
+        },
     },
 }
 
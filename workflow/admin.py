@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
+"""
+The admin of the workflow models.
+
+The changelists of the tables growing with the work done (activities and
+their history) render with a constant number of queries: the foreign keys
+shown are loaded with list_select_related, edited with raw id widgets instead
+of selects listing whole tables, and counted with an EstimatedCountPaginator
+instead of a COUNT(*) over the table.
+"""
 from __future__ import unicode_literals
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from .models import (
     Workflow, State, Transition, WorkflowActivity, WorkflowHistory,
@@ -9,44 +21,105 @@ from .models import (
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that doesn't count the rows of huge tables.
+
+    An unfiltered queryset is counted from the statistics of the database
+    (or, without any, from its highest primary key), a filtered one is only
+    counted up to MAX_COUNT rows: the pages beyond aren't linked, narrow the
+    filters down to reach them.
+    """
+    MAX_COUNT = 10000
+
+    def _estimate(self):
+        model = self.object_list.model
+        connection = connections[self.object_list.db]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT table_rows FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+                )
+            else:
+                cursor.execute('SELECT MAX(%s) FROM %s' % (
+                    connection.ops.quote_name(model._meta.pk.column),
+                    connection.ops.quote_name(table)
+                ))
+            row = cursor.fetchone()
+        return int(row[0] or 0) if row else 0
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where and not query.distinct:
+            return self._estimate()
+        return self.object_list.order_by()[:self.MAX_COUNT].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    The options shared by the admins of the huge tables
+    """
+    paginator = EstimatedCountPaginator
+    # "x results (y total)" would count the whole table
+    show_full_result_count = False
+    list_per_page = 50
+
+
 @admin.register(Workflow)
 class WorkflowAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'status', 'slug', 'created_by', 'created_on']
+    list_select_related = ['created_by']
     search_fields = ['name', 'description']
     save_on_top = True
     list_filter = ['status']
+    raw_id_fields = ['created_by']
 
 
 @admin.register(State)
 class StateAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description']
+    list_display = ['name', 'description', 'workflow']
+    list_select_related = ['workflow']
     search_fields = ['name', 'description']
     save_on_top = True
+    raw_id_fields = ['workflow']
 
 
 @admin.register(Transition)
 class TransitionAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'from_state', 'to_state']
+    list_select_related = ['from_state__workflow', 'to_state__workflow']
     search_fields = ['name', 'description']
     save_on_top = True
+    raw_id_fields = ['workflow', 'from_state', 'to_state']
 
 
 @admin.register(WorkflowActivity)
-class WorkflowActivityAdmin(admin.ModelAdmin):
-    list_display = ['id', 'workflow']
+class WorkflowActivityAdmin(LargeTableAdmin):
+    list_display = ['id', 'workflow', 'state', 'created_on', 'completed_on', 'deadline']
+    list_select_related = ['workflow', 'state__workflow']
     save_on_top = True
-    search_fields = ['id']
+    search_fields = ['=id']
+    raw_id_fields = ['workflow', 'created_by']
+    date_hierarchy = 'created_on'
 
 
 @admin.register(WorkflowHistory)
-class WorkflowHistoryAdmin(admin.ModelAdmin):
+class WorkflowHistoryAdmin(LargeTableAdmin):
     list_display = [
         'id', 'workflowactivity', 'log_type', 'state', 'transition',
-        'note', 'deadline', 'created_by', 'created_on'
+        'note', 'deadline', 'participant', 'created_on'
     ]
+    list_select_related = ['workflowactivity', 'state__workflow', 'transition', 'participant__user']
     save_on_top = True
-    search_fields = ['id']
+    search_fields = ['=id', '=workflowactivity__id']
     list_filter = ['log_type']
+    raw_id_fields = ['workflowactivity', 'state', 'transition', 'participant']
+    date_hierarchy = 'created_on'
 
 
 @admin.register(WorkflowObjectRelation)
@@ -54,6 +127,8 @@ class WorkflowObjectRelationAdmin(admin.ModelAdmin):
     list_display = [
         'id', 'content_type', 'workflow'
     ]
+    list_select_related = ['content_type', 'workflow']
+    raw_id_fields = ['workflow']
 
 
 @admin.register(WorkflowModelRelation)
@@ -61,3 +136,5 @@ class WorkflowModelRelationAdmin(admin.ModelAdmin):
     list_display = [
         'id', 'content_type', 'workflow'
     ]
+    list_select_related = ['content_type', 'workflow']
+    raw_id_fields = ['workflow']
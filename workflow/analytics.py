@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Dwell time and lead time analytics computed by the database.
+
+The time an activity dwelt in a state is the time between the transition
+into it and the next transition of the activity, found with the LEAD window
+function over the (live and archived) transitions partitioned by activity.
+state_dwell_times() aggregates them per State and compares them with its
+estimation; workflow_lead_times() aggregates the time from creation to
+completion of the activities of every Workflow.
+
+Each function runs a single query whatever the size of the history,
+percentiles (nearest rank) included. Django 1.8 has no window expressions so
+the SQL is written by hand; it needs a database with window functions and
+common table expressions (PostgreSQL, SQLite 3.25+, MySQL 8).
+"""
+from __future__ import unicode_literals
+
+from django.db import connections
+
+from workflow.models import (
+    Workflow, State, WorkflowActivity, WorkflowHistory, ArchivedWorkflowHistory
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+class Stats(object):
+    """
+    The statistics of a set of durations in seconds: their count, mean,
+    minimum, maximum and percentiles (a dict keyed by percent) plus, for the
+    dwell time in a state, its estimation (None if it has none) and the
+    number of durations longer than the estimation
+    """
+
+    def __init__(self, key, count, mean, minimum, maximum, percentiles,
+                 estimate=None, over_estimate=0):
+        self.key = key
+        self.count = count
+        self.mean = mean
+        self.minimum = minimum
+        self.maximum = maximum
+        self.percentiles = percentiles
+        self.estimate = estimate
+        self.over_estimate = over_estimate
+
+    def __repr__(self):
+        return '<Stats %s: %d, mean %.1fs>' % (self.key, self.count, self.mean)
+
+    @property
+    def mean_to_estimate(self):
+        """
+        The ratio of the mean to the estimation or None without estimation
+        """
+        return self.mean / self.estimate if self.estimate else None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.minimum,
+            'max': self.maximum,
+            'percentiles': dict(('p%d' % p, value) for p, value in self.percentiles.items()),
+            'estimate': self.estimate,
+            'over_estimate': self.over_estimate,
+        }
+
+
+def _seconds(connection, start, end):
+    """
+    The SQL expression of the number of seconds between two datetime columns
+    """
+    if connection.vendor == 'sqlite':
+        return '((julianday(%s) - julianday(%s)) * 86400.0)' % (end, start)
+    if connection.vendor == 'postgresql':
+        return 'EXTRACT(EPOCH FROM (%s - %s))' % (end, start)
+    if connection.vendor == 'mysql':
+        return '(TIMESTAMPDIFF(MICROSECOND, %s, %s) / 1000000.0)' % (start, end)
+    raise NotImplementedError('Workflow analytics are not supported on %s' % connection.vendor)
+
+
+def _ranked_aggregates(key, percentiles):
+    """
+    The aggregates of the "ranked" CTE (with its seconds, row number rn and
+    row count n columns) grouped by key, and their parameters. The p-th
+    percentile is the duration ranked ceil(p * n / 100), compared in
+    integers so that it doesn't depend on the division of the database.
+    """
+    columns = ['%s' % key, 'COUNT(*)', 'AVG(seconds)', 'MIN(seconds)', 'MAX(seconds)']
+    params = []
+    for percent in percentiles:
+        columns.append(
+            'MAX(CASE WHEN rn * 100 >= %s * n AND (rn - 1) * 100 < %s * n THEN seconds END)'
+        )
+        params.extend([percent, percent])
+    return columns, params
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _stats(row, percentiles, **kwargs):
+    key, count, mean, minimum, maximum = row[:5]
+    return Stats(
+        key, count, _float(mean), _float(minimum), _float(maximum),
+        dict(zip(percentiles, [_float(value) for value in row[5:5 + len(percentiles)]])),
+        **kwargs
+    )
+
+
+def state_dwell_times(workflow=None, since=None, until=None, percentiles=PERCENTILES, using='default'):
+    """
+    Returns a dict mapping the state ids to the Stats of the time the
+    activities (of the given workflow or workflow id, or of all of them)
+    dwelt in them, for the transitions into the state recorded from since
+    (included) until (excluded). The time spent in the current state of an
+    activity isn't counted until it leaves it.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    params = []
+
+    history = []
+    for model in (WorkflowHistory, ArchivedWorkflowHistory):
+        sql = 'SELECT workflowactivity_id, state_id, created_on, id FROM %s WHERE log_type = %%s' % (
+            qn(model._meta.db_table))
+        params.append(WorkflowHistory.TRANSITION)
+        if workflow is not None:
+            sql += ' AND workflowactivity_id IN (SELECT id FROM %s WHERE workflow_id = %%s)' % (
+                qn(WorkflowActivity._meta.db_table))
+            params.append(getattr(workflow, 'pk', workflow))
+        history.append(sql)
+
+    conditions = ['d.left_on IS NOT NULL']
+    if since is not None:
+        conditions.append('d.created_on >= %s')
+        params.append(since)
+    if until is not None:
+        conditions.append('d.created_on < %s')
+        params.append(until)
+
+    columns, percentile_params = _ranked_aggregates('state_id', percentiles)
+    columns.extend([
+        'MAX(estimate)',
+        'SUM(CASE WHEN estimate > 0 AND seconds > estimate THEN 1 ELSE 0 END)',
+    ])
+    params.extend(percentile_params)
+    sql = '''
+        WITH history AS (%(history)s),
+        dwell AS (
+            SELECT state_id, created_on, LEAD(created_on) OVER (
+                PARTITION BY workflowactivity_id ORDER BY created_on, id
+            ) AS left_on
+            FROM history
+        ),
+        timed AS (
+            SELECT d.state_id, %(seconds)s AS seconds,
+                s.estimation_value * s.estimation_unit AS estimate
+            FROM dwell d INNER JOIN %(state)s s ON s.id = d.state_id
+            WHERE %(conditions)s
+        ),
+        ranked AS (
+            SELECT state_id, seconds, estimate,
+                ROW_NUMBER() OVER (PARTITION BY state_id ORDER BY seconds) AS rn,
+                COUNT(*) OVER (PARTITION BY state_id) AS n
+            FROM timed
+        )
+        SELECT %(columns)s FROM ranked GROUP BY state_id
+    ''' % {
+        'history': ' UNION ALL '.join(history),
+        'seconds': _seconds(connection, 'd.created_on', 'd.left_on'),
+        'state': qn(State._meta.db_table),
+        'conditions': ' AND '.join(conditions),
+        'columns': ', '.join(columns),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    n = len(percentiles)
+    return dict(
+        (row[0], _stats(row, percentiles, estimate=row[5 + n] or None, over_estimate=row[6 + n] or 0))
+        for row in rows
+    )
+
+
+def workflow_lead_times(workflow=None, since=None, until=None, percentiles=PERCENTILES,
+                        using='default'):
+    """
+    Returns a dict mapping the workflow ids to the Stats of the time their
+    activities (those of the given workflow or workflow id, or of all of
+    them) completed from since (included) until (excluded) took from their
+    creation to their completion
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    conditions = ['completed_on IS NOT NULL']
+    params = []
+    if workflow is not None:
+        conditions.append('workflow_id = %s')
+        params.append(getattr(workflow, 'pk', workflow))
+    if since is not None:
+        conditions.append('completed_on >= %s')
+        params.append(since)
+    if until is not None:
+        conditions.append('completed_on < %s')
+        params.append(until)
+
+    columns, percentile_params = _ranked_aggregates('workflow_id', percentiles)
+    params.extend(percentile_params)
+    sql = '''
+        WITH timed AS (
+            SELECT workflow_id, %(seconds)s AS seconds FROM %(activity)s WHERE %(conditions)s
+        ),
+        ranked AS (
+            SELECT workflow_id, seconds,
+                ROW_NUMBER() OVER (PARTITION BY workflow_id ORDER BY seconds) AS rn,
+                COUNT(*) OVER (PARTITION BY workflow_id) AS n
+            FROM timed
+        )
+        SELECT %(columns)s FROM ranked GROUP BY workflow_id
+    ''' % {
+        'seconds': _seconds(connection, 'created_on', 'completed_on'),
+        'activity': qn(WorkflowActivity._meta.db_table),
+        'conditions': ' AND '.join(conditions),
+        'columns': ', '.join(columns),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return dict((row[0], _stats(row, percentiles)) for row in rows)
+
+
+def report(workflow=None, since=None, until=None, percentiles=PERCENTILES):
+    """
+    Returns the dwell times per state and the lead times per workflow with
+    the names of the states and workflows as a JSON serializable dict (four
+    queries)
+    """
+    dwell = state_dwell_times(workflow, since, until, percentiles)
+    lead = workflow_lead_times(workflow, since, until, percentiles)
+    states = dict(State.objects.filter(pk__in=list(dwell)).values_list('pk', 'name'))
+    workflows = dict(Workflow.objects.filter(pk__in=list(lead)).values_list('pk', 'name'))
+    result = {'states': [], 'workflows': []}
+    for state_id, stats in sorted(dwell.items()):
+        item = stats.as_dict()
+        item.update({'id': state_id, 'name': states.get(state_id)})
+        result['states'].append(item)
+    for workflow_id, stats in sorted(lead.items()):
+        item = stats.as_dict()
+        item.update({'id': workflow_id, 'name': workflows.get(workflow_id)})
+        del item['estimate'], item['over_estimate']
+        result['workflows'].append(item)
+    return result
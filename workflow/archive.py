@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Moves the history and participants of completed WorkflowActivity instances
+out of the hot WorkflowHistory and Participant tables.
+
+Activities completed before a cutoff are archived in chunks, each in its own
+transaction: their WorkflowHistory items and Participants are copied (keeping
+their ids) into ArchivedWorkflowHistory and ArchivedParticipant and deleted
+from the hot tables. The activity itself stays where it is with its final
+state and a summary (archived_on and archived_history_count) so the hot
+tables only grow with the work in flight.
+
+WorkflowActivity.get_history(include_archived=True) and current_state()
+serve the history of an archived activity from the archive.
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import transaction
+from django.db.models import Count
+
+from workflow.models import (
+    WorkflowActivity, WorkflowHistory, Participant, ArchivedWorkflowHistory,
+    ArchivedParticipant
+)
+
+PARTICIPANT_FIELDS = ('id', 'user', 'workflowactivity', 'disabled', 'created_on')
+HISTORY_FIELDS = (
+    'id', 'workflowactivity', 'log_type', 'state', 'transition', 'note',
+    'participant', 'created_on', 'deadline', 'subject', 'subject_disabled'
+)
+
+
+def archivable(before, workflow=None):
+    """
+    Returns the queryset of the not yet archived activities completed before
+    the given datetime, optionally limited to a single workflow
+    """
+    queryset = WorkflowActivity.objects.filter(
+        completed_on__lt=before, archived_on__isnull=True
+    )
+    if workflow is not None:
+        queryset = queryset.filter(workflow=workflow)
+    return queryset
+
+
+def _copy(source, target, fields, ids):
+    """
+    Copies the rows of the source model belonging to the given activities
+    into the target model
+    """
+    attnames = [target._meta.get_field(name).attname for name in fields]
+    rows = (source.objects.filter(workflowactivity__in=ids)
+            .order_by().values_list(*fields).iterator())
+    target.objects.bulk_create([target(**dict(zip(attnames, row))) for row in rows])
+
+
+def archive_activities(ids):
+    """
+    Archives the history and participants of the given (completed) activities
+    in a single transaction and returns the number of activities archived.
+    Activities that were archived in the meantime are skipped.
+    """
+    with transaction.atomic():
+        ids = list(WorkflowActivity.objects.select_for_update().filter(
+            pk__in=ids, archived_on__isnull=True
+        ).values_list('pk', flat=True))
+        if not ids:
+            return 0
+
+        _copy(Participant, ArchivedParticipant, PARTICIPANT_FIELDS, ids)
+        _copy(WorkflowHistory, ArchivedWorkflowHistory, HISTORY_FIELDS, ids)
+
+        counts = {}
+        for activity_id, count in (WorkflowHistory.objects.filter(workflowactivity__in=ids)
+                                   .order_by().values_list('workflowactivity')
+                                   .annotate(count=Count('id'))):
+            counts.setdefault(count, []).append(activity_id)
+        activities = WorkflowActivity.objects.filter(pk__in=ids)
+        activities.update(current_history=None, archived_on=datetime.datetime.today())
+        for count, activity_ids in counts.items():
+            activities.filter(pk__in=activity_ids).update(archived_history_count=count)
+
+        WorkflowHistory.objects.filter(workflowactivity__in=ids).delete()
+        Participant.objects.filter(workflowactivity__in=ids).delete()
+    return len(ids)
+
+
+def archive_completed(before=None, days=None, workflow=None, chunk_size=500):
+    """
+    Archives every activity completed before the given datetime (or the given
+    number of days ago) chunk_size activities per transaction and returns the
+    number of activities archived.
+    """
+    if before is None:
+        before = datetime.datetime.today() - datetime.timedelta(days=days or 0)
+    queryset = archivable(before, workflow=workflow).order_by('pk')
+
+    archived = 0
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return archived
+        last_pk = ids[-1]
+        archived += archive_activities(ids)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the workflow engine.
+
+workflow.benchmarks.generators creates synthetic workflows and activities and
+workflow.benchmarks.runner times the engine operations against them. Run them
+with the workflow_benchmark management command, preferably against a
+throwaway SQLite database; all the data is created in a transaction that is
+rolled back at the end.
+"""
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic workflows and activities for the benchmarks
+"""
+from __future__ import unicode_literals
+
+import random
+
+from workflow.models import (
+    Workflow, State, Transition, WorkflowActivity, WorkflowHistory, Participant
+)
+
+
+def generate_workflow(user, states=10, transitions=None, seed=0):
+    """
+    Creates a valid workflow of the given number of states: a chain from the
+    start state to the end state plus (transitions - states + 1) extra
+    transitions between random states that aren't the end state.
+    Transitions default to twice the number of states.
+    """
+    if states < 2:
+        raise ValueError('A workflow needs at least a start and an end state')
+    if transitions is None:
+        transitions = 2 * states
+    if transitions < states - 1:
+        raise ValueError('At least %d transitions are needed to link %d states' % (states - 1, states))
+    rnd = random.Random(seed)
+
+    workflow = Workflow.objects.create(
+        name='Benchmark %d/%d' % (states, transitions),
+        label='benchmark', created_by=user
+    )
+    State.objects.bulk_create([
+        State(
+            name='State %d' % i, workflow=workflow, estimation_value=1,
+            is_start_state=(i == 0), is_end_state=(i == states - 1)
+        ) for i in range(states)
+    ])
+    chain = list(State.objects.filter(workflow=workflow).order_by('id'))
+    links = [(chain[i], chain[i + 1]) for i in range(states - 1)]
+    links.extend(
+        (rnd.choice(chain[:-1]), rnd.choice(chain))
+        for i in range(transitions - len(links))
+    )
+    Transition.objects.bulk_create([
+        Transition(
+            name='Transition %d' % i, workflow=workflow,
+            from_state=from_state, to_state=to_state
+        ) for i, (from_state, to_state) in enumerate(links)
+    ])
+    return workflow
+
+
+def generate_activities(workflow, user, count=1, history=1, start=True):
+    """
+    Creates count activities of the workflow with the user as participant.
+    Unless start is False they are started and get (history - 1) comments
+    in the start state so that each has the given number of history rows.
+    """
+    activities = [WorkflowActivity(workflow=workflow, created_by=user) for i in range(count)]
+    for activity in activities:
+        activity.save()
+    Participant.objects.bulk_create([
+        Participant(workflowactivity=activity, user=user) for activity in activities
+    ])
+    if not start:
+        return activities
+
+    started = WorkflowActivity.objects.bulk_start(activities, user)
+    comments = [
+        WorkflowHistory(
+            workflowactivity=wh.workflowactivity,
+            state_id=wh.state_id,
+            log_type=WorkflowHistory.COMMENT,
+            note='Comment %d' % i,
+            participant_id=wh.participant_id,
+            deadline=wh.deadline
+        ) for wh in started for i in range(history - 1)
+    ]
+    WorkflowHistory.objects.bulk_create(comments, batch_size=500)
+    return activities
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the workflow engine: a pool of threads, each simulating a
+participant with its own database connection, starts, comments on and
+progresses a shared set of activities.
+
+The data has to be committed for the threads to see it so, unlike the
+micro-benchmarks, this needs a file backed database (it refuses to run
+against an in-memory SQLite database).
+"""
+from __future__ import unicode_literals
+
+import random
+import threading
+from timeit import default_timer
+
+from django.contrib.auth.models import User
+from django.db import connection, OperationalError
+
+from workflow.benchmarks.generators import generate_workflow, generate_activities
+from workflow.benchmarks.runner import percentile
+from workflow.exceptions import ConcurrentWorkflowChange, WorkflowException
+from workflow.models import Participant, WorkflowActivity
+
+OPERATIONS = ('start', 'comment', 'progress')
+
+
+class LoadTest(object):
+    """
+    Drives the operations of the simulated participants and collects their
+    latencies and failures
+    """
+
+    def __init__(self, workflow, users, activity_ids, operations=100, comment_ratio=0.3,
+                 select_for_update=False, seed=0):
+        self.workflow = workflow
+        self.users = users
+        self.activity_ids = activity_ids
+        self.operations = operations
+        self.comment_ratio = comment_ratio
+        self.select_for_update = select_for_update
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.latencies = dict((name, []) for name in OPERATIONS)
+        self.errors = {'conflicts': 0, 'lock_errors': 0, 'invalid': 0, 'other': 0}
+
+    def run(self):
+        """
+        Runs one thread per user and returns the report
+        """
+        threads = [
+            threading.Thread(target=self.participant, args=(user, random.Random(self.seed + i)))
+            for i, user in enumerate(self.users)
+        ]
+        started = default_timer()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(default_timer() - started)
+
+    def participant(self, user, rnd):
+        graph = self.workflow.get_graph()
+        try:
+            for i in range(self.operations):
+                activity = WorkflowActivity.objects.get(pk=rnd.choice(self.activity_ids))
+                if activity.completed_on:
+                    continue
+                if activity.state_id is None:
+                    name, operation = 'start', lambda: activity.start(
+                        user, select_for_update=self.select_for_update)
+                elif (rnd.random() < self.comment_ratio or
+                        not graph.transitions_from(activity.state_id)):
+                    name, operation = 'comment', lambda: activity.add_comment(user, 'Load test')
+                else:
+                    transition = rnd.choice(graph.transitions_from(activity.state_id))
+                    name, operation = 'progress', lambda: activity.progress(
+                        transition, user, select_for_update=self.select_for_update)
+                self.call(name, operation)
+        finally:
+            connection.close()
+
+    def call(self, name, operation):
+        error = None
+        started = default_timer()
+        try:
+            operation()
+        except ConcurrentWorkflowChange:
+            error = 'conflicts'
+        except WorkflowException:
+            # Validated against a state changed by someone else
+            error = 'invalid'
+        except OperationalError as e:
+            error = 'lock_errors' if 'locked' in str(e) else 'other'
+        except Exception:
+            error = 'other'
+        duration = (default_timer() - started) * 1000
+        with self._lock:
+            if error:
+                self.errors[error] += 1
+            else:
+                self.latencies[name].append(duration)
+
+    def report(self, elapsed):
+        succeeded = sum(len(latencies) for latencies in self.latencies.values())
+        report = {
+            'config': {
+                'workflow': self.workflow.pk,
+                'threads': len(self.users),
+                'activities': len(self.activity_ids),
+                'operations': self.operations,
+                'comment_ratio': self.comment_ratio,
+                'select_for_update': self.select_for_update,
+                'seed': self.seed,
+                'database': connection.vendor,
+            },
+            'elapsed': elapsed,
+            'succeeded': succeeded,
+            'throughput': succeeded / elapsed if elapsed else 0.0,
+            'errors': dict(self.errors),
+            'operations': {},
+        }
+        for name, latencies in self.latencies.items():
+            latencies.sort()
+            report['operations'][name] = {
+                'count': len(latencies),
+                'p50': percentile(latencies, 50) if latencies else None,
+                'p99': percentile(latencies, 99) if latencies else None,
+            }
+        return report
+
+
+def is_in_memory():
+    return connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:')
+
+
+def prepare(workflow=None, threads=8, activities=20, states=10, transitions=None, seed=0):
+    """
+    Creates the simulated users (participants of every activity) unless they
+    exist, the activities and, unless a workflow is given, a generated
+    workflow. Returns a (workflow, users, activity ids, created workflow,
+    created users) tuple.
+    """
+    users = []
+    created_users = []
+    for i in range(threads):
+        user, user_created = User.objects.get_or_create(username='workflow_load_%d' % i)
+        users.append(user)
+        if user_created:
+            created_users.append(user)
+    created = None
+    if workflow is None:
+        workflow = created = generate_workflow(
+            users[0], states=states, transitions=transitions, seed=seed
+        )
+    pool = generate_activities(workflow, users[0], count=activities, start=False)
+    Participant.objects.bulk_create([
+        Participant(workflowactivity=activity, user=user)
+        for activity in pool for user in users[1:]
+    ])
+    return workflow, users, [activity.pk for activity in pool], created, created_users
+
+
+def cleanup(activity_ids, created, created_users):
+    """
+    Deletes what prepare() created (and only that: the users that already
+    existed are kept)
+    """
+    WorkflowActivity.objects.filter(pk__in=activity_ids).delete()
+    if created is not None:
+        created.delete()
+    User.objects.filter(pk__in=[user.pk for user in created_users]).delete()
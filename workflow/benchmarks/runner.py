@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Times the workflow engine operations against synthetic data and reports the
+latency percentiles and number of queries of each of them
+"""
+from __future__ import unicode_literals
+
+import math
+import platform
+from timeit import default_timer
+
+import django
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from workflow.benchmarks.generators import generate_workflow, generate_activities
+from workflow.graph import graph_cache
+from workflow.models import WorkflowActivity
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of a sorted list
+    """
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def measure(operation, calls):
+    """
+    Calls operation(argument) for every argument of the calls list and
+    returns the latency statistics (in milliseconds) and average number of
+    queries per call
+    """
+    durations = []
+    queries = 0
+    for argument in calls:
+        with CaptureQueriesContext(connection) as context:
+            started = default_timer()
+            operation(argument)
+            durations.append((default_timer() - started) * 1000)
+        queries += len(context.captured_queries)
+    durations.sort()
+    result = {
+        'calls': len(durations),
+        'min': durations[0],
+        'max': durations[-1],
+        'mean': sum(durations) / len(durations),
+        'queries': float(queries) / len(durations),
+    }
+    for percent in PERCENTILES:
+        result['p%d' % percent] = percentile(durations, percent)
+    return result
+
+
+def run(user, states=10, transitions=None, history=10, iterations=50, seed=0):
+    """
+    Generates a workflow of the given number of states and transitions and
+    activities with the given number of history rows, times start(),
+    progress(), current_state(), add_comment() and is_valid() iterations
+    times each and returns the report as a JSON serializable dict.
+
+    Everything is done in a transaction that is rolled back at the end.
+    """
+    report = {
+        'config': {
+            'states': states,
+            'transitions': transitions if transitions is not None else 2 * states,
+            'history': history,
+            'iterations': iterations,
+            'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'operations': {},
+    }
+    operations = report['operations']
+    with transaction.atomic():
+        workflow = generate_workflow(user, states=states, transitions=transitions, seed=seed)
+        graph = workflow.get_graph()
+        transition = graph.transitions_from(graph.start_state.id)[0]
+
+        fresh = generate_activities(workflow, user, count=iterations, start=False)
+        operations['start'] = measure(lambda activity: activity.start(user), fresh)
+
+        started = generate_activities(workflow, user, count=iterations, history=history)
+        operations['progress'] = measure(
+            lambda activity: activity.progress(transition, user), started
+        )
+
+        # Fresh instances so that nothing is cached on them
+        ids = [activity.pk for activity in started]
+        operations['current_state'] = measure(
+            lambda activity: activity.current_state(),
+            list(WorkflowActivity.objects.filter(pk__in=ids))
+        )
+        operations['add_comment'] = measure(
+            lambda activity: activity.add_comment(user, 'Benchmark comment'), started
+        )
+
+        def validate_cold(i):
+            graph_cache.invalidate(workflow.pk)
+            workflow.is_valid()
+        operations['is_valid'] = measure(validate_cold, range(iterations))
+        operations['is_valid_cached'] = measure(lambda i: workflow.is_valid(), range(iterations))
+
+        transaction.set_rollback(True)
+    graph_cache.invalidate(workflow.pk)
+    return report
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+A compact JSON serializable format for the definition of a Workflow and the
+import of such definitions (used to clone workflows too).
+
+    {
+        "format": 1,
+        "name": "...", "label": "...", "description": "...",
+        "states": [
+            {"key": 1, "name": "...", "description": "...",
+             "is_start_state": true, "is_end_state": false,
+             "estimation_value": 1, "estimation_unit": 86400,
+             "users": ["username", ...], "groups": ["group name", ...]},
+            ...
+        ],
+        "transitions": [
+            {"name": "...", "description": "...", "from_state": 1, "to_state": 2,
+             "users": [...], "groups": [...]},
+            ...
+        ]
+    }
+
+The keys of the states and transitions (the ids they had when exported) are
+only used to connect the transitions. Users and groups are referred to by
+username and name so a definition can be deployed on another database (or by
+id, for the definitions frozen in a WorkflowVersion).
+
+export_definition() takes six queries and import_definition() about ten
+whatever the size of the workflow: the states, transitions and their users
+and groups are inserted with bulk_create, and the ids of the new states and
+transitions are read back in insertion order to remap the references.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+
+from workflow.exceptions import UnableToImportWorkflow
+from workflow.graph import graph_cache
+from workflow.models import Workflow, State, Transition
+from workflow.permissions import permission_cache
+
+FORMAT = 1
+
+STATE_FIELDS = (
+    'name', 'description', 'is_start_state', 'is_end_state', 'estimation_value',
+    'estimation_unit'
+)
+TRANSITION_FIELDS = ('name', 'description')
+
+
+def _members(through, attname, name_field, ids):
+    members = {}
+    for pk, name in (through.objects.filter(**{'%s__in' % attname: ids})
+                     .order_by(name_field).values_list(attname, name_field)):
+        members.setdefault(pk, []).append(name)
+    return members
+
+
+def export_definition(workflow, natural_keys=True):
+    """
+    Returns the definition of the workflow as a JSON serializable dict. The
+    users and groups are referred to by id unless natural_keys is True.
+    """
+    user_field, group_field = ('user__username', 'group__name') if natural_keys else ('user', 'group')
+    states = list(State.objects.filter(workflow=workflow).order_by('pk'))
+    transitions = list(Transition.objects.filter(workflow=workflow).order_by('pk'))
+    state_ids = [state.pk for state in states]
+    transition_ids = [transition.pk for transition in transitions]
+    members = {
+        'state_users': _members(State.users.through, 'state', user_field, state_ids),
+        'state_groups': _members(State.groups.through, 'state', group_field, state_ids),
+        'transition_users': _members(
+            Transition.users.through, 'transition', user_field, transition_ids),
+        'transition_groups': _members(
+            Transition.groups.through, 'transition', group_field, transition_ids),
+    }
+    definition = {
+        'format': FORMAT,
+        'name': workflow.name,
+        'label': workflow.label,
+        'description': workflow.description,
+        'states': [],
+        'transitions': [],
+    }
+    for state in states:
+        item = dict((name, getattr(state, name)) for name in STATE_FIELDS)
+        item['key'] = state.pk
+        item['users'] = members['state_users'].get(state.pk, [])
+        item['groups'] = members['state_groups'].get(state.pk, [])
+        definition['states'].append(item)
+    for transition in transitions:
+        item = dict((name, getattr(transition, name)) for name in TRANSITION_FIELDS)
+        item['key'] = transition.pk
+        item['from_state'] = transition.from_state_id
+        item['to_state'] = transition.to_state_id
+        item['users'] = members['transition_users'].get(transition.pk, [])
+        item['groups'] = members['transition_groups'].get(transition.pk, [])
+        definition['transitions'].append(item)
+    return definition
+
+
+def _lookup(model, field, names):
+    names = set(names)
+    found = dict(model.objects.filter(**{'%s__in' % field: names}).values_list(field, 'pk'))
+    missing = names - set(found)
+    if missing:
+        raise UnableToImportWorkflow(
+            'Unknown %s: %s' % (model._meta.verbose_name_plural, ', '.join(sorted(missing)))
+        )
+    return found
+
+
+def _bulk_create(model, workflow, instances):
+    """
+    Inserts the instances and returns their ids, in the same order
+    """
+    model.objects.bulk_create(instances)
+    ids = list(model.objects.filter(workflow=workflow).order_by('pk').values_list('pk', flat=True))
+    if len(ids) != len(instances):
+        raise UnableToImportWorkflow('Unable to read back the ids of the new %s'
+                                     % model._meta.verbose_name_plural)
+    return ids
+
+
+def import_definition(definition, user, name=None, cloned_from=None):
+    """
+    Creates a new Workflow (in definition) from a definition created by
+    export_definition() and returns it
+    """
+    try:
+        if definition.get('format') != FORMAT:
+            raise UnableToImportWorkflow('Unknown definition format: %s' % definition.get('format'))
+        states = definition['states']
+        transitions = definition['transitions']
+        items = states + transitions
+        users = _lookup(User, 'username', [n for item in items for n in item.get('users', [])])
+        groups = _lookup(Group, 'name', [n for item in items for n in item.get('groups', [])])
+
+        with transaction.atomic():
+            workflow = Workflow.objects.create(
+                name=name or definition['name'],
+                label=definition.get('label', ''),
+                description=definition.get('description', ''),
+                created_by=user,
+                cloned_from=cloned_from,
+            )
+            state_ids = _bulk_create(State, workflow, [
+                State(workflow=workflow, **dict(
+                    (field, state[field]) for field in STATE_FIELDS if field in state
+                )) for state in states
+            ])
+            keys = dict((state['key'], pk) for state, pk in zip(states, state_ids))
+            transition_ids = _bulk_create(Transition, workflow, [
+                Transition(
+                    workflow=workflow,
+                    from_state_id=keys[transition['from_state']],
+                    to_state_id=keys[transition['to_state']],
+                    **dict((field, transition[field])
+                           for field in TRANSITION_FIELDS if field in transition)
+                ) for transition in transitions
+            ])
+            for model, ids, objects in ((State, state_ids, states),
+                                        (Transition, transition_ids, transitions)):
+                attname = model._meta.model_name
+                model.users.through.objects.bulk_create([
+                    model.users.through(**{attname + '_id': pk, 'user_id': users[username]})
+                    for pk, item in zip(ids, objects) for username in set(item.get('users', []))
+                ])
+                model.groups.through.objects.bulk_create([
+                    model.groups.through(**{attname + '_id': pk, 'group_id': groups[group]})
+                    for pk, item in zip(ids, objects) for group in set(item.get('groups', []))
+                ])
+    except (KeyError, TypeError, AttributeError) as e:
+        raise UnableToImportWorkflow('Malformed workflow definition: %r' % e)
+    # bulk_create sends no signals
+    graph_cache.invalidate(workflow.pk)
+    permission_cache.invalidate(workflow.pk)
+    return workflow
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Delivery of the signals defined in workflow.signals.
+
+The WORKFLOW_SIGNAL_DISPATCH setting controls when the signals fired after a
+WorkflowHistory item (or a batch of them) is written are delivered:
+
+``'immediate'`` (default)
+    The receivers are called straight away, inside the transaction that wrote
+    the history.
+``'on_commit'``
+    The signals are queued per connection and delivered in order, as one
+    batch, by a single hook run once the transaction commits. The signals
+    queued in a savepoint that is rolled back (or in a transaction that rolls
+    back) aren't delivered. Requires Django 1.9 or later, or on older
+    versions a database backend providing connection.on_commit() (such as the
+    django-transaction-hooks ones): ImproperlyConfigured is raised otherwise
+    rather than silently delivering them inside the transaction.
+
+In both modes signals without any connected receiver are skipped.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction, connections, DEFAULT_DB_ALIAS
+
+IMMEDIATE = 'immediate'
+ON_COMMIT = 'on_commit'
+
+
+def dispatch_mode():
+    return getattr(settings, 'WORKFLOW_SIGNAL_DISPATCH', IMMEDIATE)
+
+
+def has_receivers(signal):
+    """
+    Cheap check for whether sending the signal could call anything at all
+    """
+    return bool(signal.receivers)
+
+
+def _on_commit(using):
+    """
+    Returns the function registering a callback run when the transaction on
+    the given database commits
+    """
+    if hasattr(transaction, 'on_commit'):
+        return lambda func: transaction.on_commit(func, using=using)
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if hasattr(connection, 'on_commit'):
+        return connection.on_commit
+    raise ImproperlyConfigured(
+        "WORKFLOW_SIGNAL_DISPATCH = 'on_commit' requires Django 1.9 or a database "
+        "backend providing connection.on_commit() (see django-transaction-hooks)"
+    )
+
+
+class _Batch(object):
+    """
+    The signals queued during a transaction. Every group of signals is
+    flagged by its own on_commit() hook, which is dropped if the savepoint it
+    was registered in rolls back, and the flush hook (kept after them) then
+    delivers the flagged ones in order.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, signals, on_commit):
+        item = [False, signals]
+        self.items.append(item)
+        on_commit(lambda: item.__setitem__(0, True))
+
+    def flush(self):
+        for committed, signals in self.items:
+            if committed:
+                _deliver(signals)
+
+
+def _queue(connection, signals, on_commit):
+    # The (sids, func) commit hooks of the connection. The flush hook is added
+    # without savepoint ids so that only rolling the whole transaction back
+    # drops it, and moved last whenever signals are queued.
+    hooks = connection.run_on_commit
+    batch = getattr(connection, '_workflow_signals', None)
+    position = None
+    if batch is not None:
+        position = next((i for i, hook in enumerate(hooks) if hook[1] == batch.flush), None)
+    if position is None:
+        # The first signals of the transaction
+        batch = connection._workflow_signals = _Batch()
+    else:
+        del hooks[position]
+    batch.add(signals, on_commit)
+    hooks.append((set(), batch.flush))
+
+
+def send(signals, using=None):
+    """
+    Sends (or queues, depending on the dispatch mode) a list of
+    (signal, sender, kwargs) tuples in order.
+    """
+    on_commit = _on_commit(using) if dispatch_mode() == ON_COMMIT else None
+    signals = [item for item in signals if has_receivers(item[0])]
+    if not signals:
+        return
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if on_commit is not None and connection.in_atomic_block:
+        _queue(connection, signals, on_commit)
+    else:
+        # Outside of a transaction the history is already committed
+        _deliver(signals)
+
+
+def _deliver(signals):
+    for signal, sender, kwargs in signals:
+        signal.send(sender=sender, **kwargs)
@@ -42,3 +42,23 @@ class UnableToEnableParticipant(WorkflowException):
     """
     To be raised if the WorkflowActivity is unable to enable a participant
     """
+
+
+class ConcurrentWorkflowChange(WorkflowException):
+    """
+    To be raised if a WorkflowActivity was started, progressed or stopped by
+    someone else between validating a transition and recording it
+    """
+
+
+class UnableToCloneWorkflow(WorkflowException):
+    """
+    To be raised if unable to clone a workflow
+    """
+
+
+class UnableToImportWorkflow(WorkflowException):
+    """
+    To be raised if a workflow definition can't be imported because it is
+    malformed or refers to unknown users or groups
+    """
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of the audit trail (WorkflowHistory, archived or not) as CSV
+or JSON lines, optionally gzipped.
+
+The rows are read as values() dicts in chunks of chunk_size ordered by id
+(each chunk starts after the last id of the previous one), so the memory
+used doesn't depend on the number of rows exported. The live and archived
+history are merged by id. Used by the export_workflow_history command and
+the workflow.views.history_export view.
+"""
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import heapq
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.encoding import force_bytes
+
+from workflow.models import WorkflowHistory, ArchivedWorkflowHistory
+
+FORMATS = ('csv', 'jsonl')
+
+COLUMNS = (
+    'id', 'activity', 'log_type', 'state_id', 'state', 'transition_id', 'transition',
+    'note', 'user_id', 'username', 'created_on', 'deadline', 'archived'
+)
+
+FIELDS = (
+    'id', 'workflowactivity', 'log_type', 'state', 'state__name', 'transition',
+    'transition__name', 'note', 'participant__user', 'participant__user__username',
+    'created_on', 'deadline'
+)
+
+LOG_TYPES = {
+    WorkflowHistory.TRANSITION: 'transition',
+    WorkflowHistory.COMMENT: 'comment',
+}
+
+
+def parse_when(value):
+    """
+    Parses a date or datetime given as a string, raises ValueError if it is
+    neither
+    """
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('Invalid date: %s' % value)
+        when = datetime.datetime.combine(day, datetime.time())
+    return when
+
+
+def _chunked(model, archived, workflow, since, until, chunk_size):
+    queryset = model.objects.order_by('id')
+    if workflow is not None:
+        queryset = queryset.filter(workflowactivity__workflow=workflow)
+    if since is not None:
+        queryset = queryset.filter(created_on__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_on__lt=until)
+    last = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last).values(*FIELDS)[:chunk_size])
+        for row in rows:
+            yield row['id'], (
+                row['id'], row['workflowactivity'], LOG_TYPES.get(row['log_type']),
+                row['state'], row['state__name'], row['transition'], row['transition__name'],
+                row['note'], row['participant__user'], row['participant__user__username'],
+                row['created_on'], row['deadline'], archived
+            )
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]['id']
+
+
+def history_rows(workflow=None, since=None, until=None, chunk_size=2000):
+    """
+    Yields the history items (as tuples of COLUMNS values) of the given
+    workflow (or of all of them) created from since (included) until
+    (excluded), ordered by id
+    """
+    live = _chunked(WorkflowHistory, False, workflow, since, until, chunk_size)
+    archived = _chunked(ArchivedWorkflowHistory, True, workflow, since, until, chunk_size)
+    for pk, row in heapq.merge(live, archived):
+        yield row
+
+
+class Echo(object):
+    """
+    A file-like object handing back what the csv writer writes
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    if six.PY2 and isinstance(value, six.text_type):
+        # The csv module of Python 2 only handles bytes
+        return value.encode('utf-8')
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield force_bytes(writer.writerow([_csv_value(name) for name in COLUMNS]))
+    for row in rows:
+        yield force_bytes(writer.writerow([_csv_value(value) for value in row]))
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield force_bytes(json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder) + '\n')
+
+
+def buffered(chunks, size=64 * 1024):
+    """
+    Joins small chunks of bytes into chunks of about size bytes
+    """
+    buf = []
+    length = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buf)
+            buf = []
+            length = 0
+    if buf:
+        yield b''.join(buf)
+
+
+def gzipped(chunks):
+    """
+    Compresses a stream of bytes into a gzip stream
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_history(format='csv', compress=False, workflow=None, since=None, until=None,
+                   chunk_size=2000):
+    """
+    Returns an iterator over the bytes of the export of the history in the
+    given format (one of FORMATS), gzipped if compress is True
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format: %s' % format)
+    rows = history_rows(workflow=workflow, since=since, until=until, chunk_size=chunk_size)
+    chunks = buffered(csv_lines(rows) if format == 'csv' else jsonl_lines(rows))
+    return gzipped(chunks) if compress else chunks
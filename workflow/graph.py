@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled, read-only representations of a workflow's directed graph.
+
+Loading the states and transitions of a workflow is the most common thing the
+engine does, so the definition is compiled once into a WorkflowGraph and kept
+in a per-process cache. The cache is invalidated by the post_save / post_delete
+receivers connected in workflow.models whenever a State or Transition changes.
+
+Those receivers only run in the process making the change (and not at all for
+queryset.update(), raw SQL or bulk_create), so the entries also expire after
+the WORKFLOW_CACHE_TTL setting (in seconds, 10 by default): that is how long
+another process may keep using a stale definition. None never expires them,
+0 disables the cache.
+"""
+from __future__ import unicode_literals
+
+import copy
+import datetime
+import threading
+import time
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+
+DEFAULT_TTL = 10
+
+
+def cache_ttl():
+    """
+    The number of seconds the compiled definitions are cached for
+    """
+    return getattr(settings, 'WORKFLOW_CACHE_TTL', DEFAULT_TTL)
+
+
+def _copy(instance):
+    """
+    Returns a copy of a cached State or Transition (and of the related
+    instances it caches) for a caller to modify
+    """
+    clone = copy.copy(instance)
+    clone._state = copy.copy(instance._state)
+    for name, value in instance.__dict__.items():
+        if name != '_state' and hasattr(value, '_meta'):
+            clone.__dict__[name] = _copy(value)
+    return clone
+
+
+class WorkflowGraph(object):
+    """
+    An immutable snapshot of the states and transitions of a workflow.
+
+    The graph is shared by every thread of the process: the State and
+    Transition instances of its attributes must be treated as read-only.
+    The methods returning instances (start_state, get_state, get_transition,
+    transitions_from and transitions_into) return copies.
+
+    **Attributes:**
+    states
+        A dict of State instances keyed by id.
+    transitions
+        A dict of Transition instances keyed by id. Their from_state and
+        to_state are resolved against ``states`` so no further queries are
+        needed to follow them.
+    start_states
+        A tuple with the ids of all the states flagged as start state.
+    end_states
+        A frozenset with the ids of all the states flagged as end state.
+    outgoing / incoming
+        Adjacency lists: dicts mapping a state id to a tuple of transition ids.
+    durations
+        A dict mapping a state id to its estimated duration (a timedelta) or
+        None if the state has no estimation.
+    """
+
+    def __init__(self, workflow_id, states, transitions):
+        transitions = list(transitions)
+        states = dict((state.id, state) for state in states)
+        outgoing = dict((state_id, []) for state_id in states)
+        incoming = dict((state_id, []) for state_id in states)
+        for transition in transitions:
+            # Resolve the foreign keys against the states we already have
+            if transition.from_state_id in states:
+                transition.from_state = states[transition.from_state_id]
+                outgoing[transition.from_state_id].append(transition.id)
+            if transition.to_state_id in states:
+                transition.to_state = states[transition.to_state_id]
+                incoming[transition.to_state_id].append(transition.id)
+        transitions = dict((transition.id, transition) for transition in transitions)
+
+        set_ = super(WorkflowGraph, self).__setattr__
+        set_('workflow_id', workflow_id)
+        set_('states', states)
+        set_('transitions', transitions)
+        set_('start_states', tuple(s.id for s in states.values() if s.is_start_state))
+        set_('end_states', frozenset(s.id for s in states.values() if s.is_end_state))
+        set_('outgoing', dict((k, tuple(v)) for k, v in outgoing.items()))
+        set_('incoming', dict((k, tuple(v)) for k, v in incoming.items()))
+        set_('durations', dict((s.id, s.duration()) for s in states.values()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('WorkflowGraph instances are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('WorkflowGraph instances are immutable')
+
+    @classmethod
+    def compile(cls, workflow):
+        """
+        Builds the graph of the given workflow (or workflow id) with exactly
+        two queries.
+        """
+        workflow_id = getattr(workflow, 'pk', workflow)
+        State = apps.get_model('workflow', 'State')
+        Transition = apps.get_model('workflow', 'Transition')
+        states = list(State.objects.filter(workflow_id=workflow_id))
+        transitions = list(Transition.objects.filter(workflow_id=workflow_id))
+        return cls(workflow_id, states, transitions)
+
+    @property
+    def start_state(self):
+        """
+        The start State of the workflow or None if there isn't exactly one
+        """
+        if len(self.start_states) == 1:
+            return _copy(self.states[self.start_states[0]])
+        return None
+
+    def get_state(self, state_id):
+        """
+        Returns a copy of the State with the given id or None
+        """
+        state = self.states.get(state_id)
+        return _copy(state) if state is not None else None
+
+    def get_transition(self, transition_id):
+        """
+        Returns a copy of the Transition with the given id or None
+        """
+        transition = self.transitions.get(transition_id)
+        return _copy(transition) if transition is not None else None
+
+    def is_end_state(self, state_id):
+        return state_id in self.end_states
+
+    def transitions_from(self, state_id):
+        """
+        Returns a list of the Transition instances leaving the given state
+        """
+        return [_copy(self.transitions[t]) for t in self.outgoing.get(state_id, ())]
+
+    def transitions_into(self, state_id):
+        """
+        Returns a list of the Transition instances arriving at the given state
+        """
+        return [_copy(self.transitions[t]) for t in self.incoming.get(state_id, ())]
+
+    def reachable_from(self, state_ids):
+        """
+        Returns the set of state ids that can be reached (following the
+        transitions forwards) from the given states, themselves included
+        """
+        return self._walk(state_ids, self.outgoing, 'to_state_id')
+
+    def reaching(self, state_ids):
+        """
+        Returns the set of state ids from which any of the given states can be
+        reached, themselves included
+        """
+        return self._walk(state_ids, self.incoming, 'from_state_id')
+
+    def _walk(self, state_ids, adjacency, attname):
+        # Breadth first search over the adjacency lists
+        seen = set(state_ids)
+        queue = deque(seen)
+        while queue:
+            for transition_id in adjacency.get(queue.popleft(), ()):
+                state_id = getattr(self.transitions[transition_id], attname)
+                if state_id not in seen:
+                    seen.add(state_id)
+                    queue.append(state_id)
+        return seen
+
+    def deadline(self, state_id):
+        """
+        The same as State.deadline() but answered from the compiled graph
+        """
+        duration = self.durations.get(state_id)
+        if duration is not None:
+            return datetime.datetime.today() + duration
+        return None
+
+
+class DefinitionCache(object):
+    """
+    A thread safe, per-process cache of objects compiled from the definition
+    of a workflow (such as its WorkflowGraph).
+
+    Entries are keyed by the workflow id plus a version stamp. Invalidating a
+    workflow bumps its version so that an object being compiled concurrently
+    with the change is never served afterwards. ttl is a callable returning
+    the number of seconds an entry is kept for (None: until invalidated), or
+    None for definitions that never change.
+    """
+
+    def __init__(self, compile, ttl=cache_ttl):
+        self.compile = compile
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+
+    def version(self, workflow_id):
+        return self._versions.get(workflow_id, 0)
+
+    def get(self, workflow):
+        workflow_id = getattr(workflow, 'pk', workflow)
+        key = (workflow_id, self.version(workflow_id))
+        now = time.time()
+        item = self._entries.get(key)
+        if item is not None and (item[1] is None or item[1] > now):
+            return item[0]
+        entry = self.compile(workflow_id)
+        ttl = self.ttl() if self.ttl is not None else None
+        if ttl != 0:
+            with self._lock:
+                # Only store it if nothing changed while we were compiling
+                if key[1] == self.version(workflow_id):
+                    self._entries[key] = (entry, now + ttl if ttl is not None else None)
+        return entry
+
+    def invalidate(self, workflow_id):
+        with self._lock:
+            self._versions[workflow_id] = self.version(workflow_id) + 1
+            for key in [k for k in self._entries if k[0] == workflow_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            workflow_ids = set(self._versions) | set(k[0] for k in self._entries)
+            for workflow_id in workflow_ids:
+                self._versions[workflow_id] = self.version(workflow_id) + 1
+            self._entries.clear()
+
+
+graph_cache = DefinitionCache(WorkflowGraph.compile)
+
+
+def get_graph(workflow):
+    """
+    Returns the (cached) compiled WorkflowGraph for the given workflow or
+    workflow id.
+    """
+    return graph_cache.get(workflow)
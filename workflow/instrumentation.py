@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing of the receivers of the signals defined in workflow.signals.
+
+When enabled (with enable() or the WORKFLOW_SIGNAL_INSTRUMENTATION setting)
+every send records the number of calls and the cumulative and maximum
+duration per signal and per receiver. Receivers slower than the
+WORKFLOW_SLOW_RECEIVER_THRESHOLD setting (in seconds) are logged as warnings
+to the "workflow.signals" logger.
+
+The statistics are kept per process. get_stats() returns them and the
+workflow_signal_stats management command dumps them after running another
+management command with the instrumentation enabled.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger('workflow.signals')
+
+
+def receiver_name(receiver):
+    """
+    Returns a readable dotted name for a signal receiver
+    """
+    name = getattr(receiver, '__qualname__', None) or getattr(receiver, '__name__', None)
+    if name is None:
+        # A callable object
+        name = receiver.__class__.__name__
+    elif getattr(receiver, '__self__', None) is not None and '.' not in name:
+        # A bound method on Python 2
+        name = '%s.%s' % (receiver.__self__.__class__.__name__, name)
+    return '%s.%s' % (getattr(receiver, '__module__', '?'), name)
+
+
+class SignalStats(object):
+    """
+    Thread safe accumulator of signal timings
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._enabled = None
+        self._threshold = None
+        self._signals = {}
+        self._receivers = {}
+
+    def is_enabled(self):
+        if self._enabled is None:
+            return getattr(settings, 'WORKFLOW_SIGNAL_INSTRUMENTATION', False)
+        return self._enabled
+
+    def threshold(self):
+        if self._threshold is None:
+            return getattr(settings, 'WORKFLOW_SLOW_RECEIVER_THRESHOLD', None)
+        return self._threshold
+
+    def enable(self, threshold=None):
+        self._enabled = True
+        self._threshold = threshold
+
+    def disable(self):
+        self._enabled = False
+        self._threshold = None
+
+    def use_settings(self):
+        """
+        Goes back to the WORKFLOW_SIGNAL_INSTRUMENTATION and
+        WORKFLOW_SLOW_RECEIVER_THRESHOLD settings after enable() / disable()
+        """
+        self._enabled = None
+        self._threshold = None
+
+    def _add(self, entries, key, duration):
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+
+    def record_send(self, signal_name, duration):
+        with self._lock:
+            self._add(self._signals, signal_name, duration)
+
+    def record_receiver(self, signal_name, receiver, duration):
+        name = receiver_name(receiver)
+        with self._lock:
+            self._add(self._receivers, (signal_name, name), duration)
+        threshold = self.threshold()
+        if threshold is not None and duration > threshold:
+            logger.warning('Receiver %s of %s took %.3fs (threshold %.3fs)',
+                           name, signal_name, duration, threshold)
+
+    def get_stats(self):
+        """
+        Returns a dict mapping the name of every signal sent to a dict with the
+        "calls", "total" and "max" duration (in seconds) of its sends and a
+        "receivers" dict with the same figures for each of its receivers.
+        """
+        with self._lock:
+            stats = {}
+            for name, (calls, total, max_) in self._signals.items():
+                stats[name] = {'calls': calls, 'total': total, 'max': max_, 'receivers': {}}
+            for (name, receiver), (calls, total, max_) in self._receivers.items():
+                stats.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0, 'receivers': {}})
+                stats[name]['receivers'][receiver] = {'calls': calls, 'total': total, 'max': max_}
+            return stats
+
+    def reset(self):
+        with self._lock:
+            self._signals.clear()
+            self._receivers.clear()
+
+
+signal_stats = SignalStats()
+
+enable = signal_stats.enable
+disable = signal_stats.disable
+use_settings = signal_stats.use_settings
+is_enabled = signal_stats.is_enabled
+get_stats = signal_stats.get_stats
+reset = signal_stats.reset
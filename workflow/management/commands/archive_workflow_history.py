@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from workflow.archive import archive_completed
+
+
+class Command(BaseCommand):
+    help = ('Moves the history and participants of the workflow activities '
+            'completed more than a number of days ago into the archive tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Archive the activities completed more than this many days ago'
+        )
+        parser.add_argument(
+            '--workflow', type=int, default=None,
+            help='Only archive the activities of the workflow with this id'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of activities archived per transaction'
+        )
+
+    def handle(self, *args, **options):
+        count = archive_completed(
+            days=options['days'], workflow=options['workflow'], chunk_size=options['chunk_size']
+        )
+        self.stdout.write('Archived %d workflow activities' % count)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from workflow.models import WorkflowActivity, WorkflowHistory
+
+
+class Command(BaseCommand):
+    help = ('Points the denormalized current_history, state and deadline fields '
+            'of every WorkflowActivity at its latest WorkflowHistory item')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of activities updated per transaction'
+        )
+        parser.add_argument(
+            '--all', action='store_true', default=False,
+            help='Also refresh activities that already have a current history item'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        activities = WorkflowActivity.objects.order_by('pk')
+        if not options['all']:
+            activities = activities.filter(current_history__isnull=True)
+
+        last_pk = 0
+        updated = 0
+        while True:
+            ids = list(activities.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            # History items are inserted in chronological order so the highest
+            # id of an activity is its latest item
+            latest = (WorkflowHistory.objects.filter(workflowactivity__in=ids)
+                      .order_by().values('workflowactivity').annotate(latest=Max('id')))
+            rows = (WorkflowHistory.objects
+                    .filter(pk__in=[item['latest'] for item in latest])
+                    .values_list('workflowactivity', 'pk', 'state', 'deadline'))
+            with transaction.atomic():
+                for activity_id, history_id, state_id, deadline in rows:
+                    WorkflowActivity.objects.filter(pk=activity_id).update(
+                        current_history=history_id, state=state_id, deadline=deadline
+                    )
+                    updated += 1
+        self.stdout.write('Updated %d workflow activities' % updated)
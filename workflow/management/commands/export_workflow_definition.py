@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.definitions import export_definition
+from workflow.models import Workflow
+
+
+class Command(BaseCommand):
+    help = 'Exports the definition of a workflow (states, transitions and permissions) as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workflow', type=int, help='Id of the workflow to export')
+        parser.add_argument('--output', default=None, help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            workflow = Workflow.objects.get(pk=options['workflow'])
+        except Workflow.DoesNotExist:
+            raise CommandError('Unknown workflow %s' % options['workflow'])
+        dump = json.dumps(export_definition(workflow), indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(dump)
+        else:
+            self.stdout.write(dump)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import force_text
+
+from workflow.export import FORMATS, export_history, parse_when
+
+
+class Command(BaseCommand):
+    help = ('Exports the history (audit trail) of the workflow activities, archived '
+            'or not, as CSV or JSON lines with constant memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workflow', type=int, default=None,
+            help='Only export the history of the activities of the workflow with this id'
+        )
+        parser.add_argument('--since', default=None, help='Only export the history from this date')
+        parser.add_argument('--until', default=None, help='Only export the history before this date')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format')
+        parser.add_argument('--gzip', action='store_true', default=False, help='Gzip the output')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of history rows read per query'
+        )
+        parser.add_argument('--output', default=None, help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_when(options['since']) if options['since'] else None
+            until = parse_when(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(e)
+        chunks = export_history(
+            format=options['format'], compress=options['gzip'], workflow=options['workflow'],
+            since=since, until=until, chunk_size=options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        elif options['gzip']:
+            # The compressed bytes go to the stream underneath self.stdout
+            output = getattr(self.stdout._out, 'buffer', self.stdout._out)
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+        else:
+            # Chunks hold whole rows, so they can be decoded one by one
+            for chunk in chunks:
+                self.stdout.write(force_text(chunk), ending='')
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.definitions import import_definition
+from workflow.exceptions import UnableToImportWorkflow
+
+
+class Command(BaseCommand):
+    help = ('Creates a new workflow (in definition) from a JSON definition written '
+            'by export_workflow_definition')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The JSON definition file')
+        parser.add_argument('--user', required=True, help='Username of the creator of the workflow')
+        parser.add_argument('--name', default=None, help='Name of the new workflow')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('Unknown user %s' % options['user'])
+        try:
+            with open(options['path']) as f:
+                definition = json.load(f)
+            workflow = import_definition(definition, user, name=options['name'])
+        except (IOError, ValueError, UnableToImportWorkflow) as e:
+            raise CommandError(e)
+        self.stdout.write('Imported workflow %d (%s)' % (workflow.pk, workflow.name))
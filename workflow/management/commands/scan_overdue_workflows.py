@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from workflow.overdue import scan_overdue
+
+
+class Command(BaseCommand):
+    help = ('Sends the workflow_overdue signal for every uncompleted workflow '
+            'activity whose deadline for the current state has passed')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workflow', type=int, default=None,
+            help='Only scan the activities of the workflow with this id'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of activities loaded (and signalled) at once'
+        )
+
+    def handle(self, *args, **options):
+        count = scan_overdue(workflow=options['workflow'], chunk_size=options['chunk_size'])
+        self.stdout.write('Found %d overdue workflow activities' % count)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from workflow.models import WorkflowActivity
+from workflow.snapshots import take_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Records a snapshot of the state and participants of every workflow '
+            'activity with history newer than its latest snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workflow', type=int, default=None,
+            help='Only snapshot the activities of the workflow with this id'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of activities snapshotted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        activities = WorkflowActivity.objects.all()
+        if options['workflow'] is not None:
+            activities = activities.filter(workflow=options['workflow'])
+        count = take_snapshots(activities, batch_size=options['batch_size'])
+        self.stdout.write('Took %d workflow activity snapshots' % count)
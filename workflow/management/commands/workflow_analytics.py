@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.analytics import PERCENTILES, report
+from workflow.export import parse_when
+
+
+def _hours(seconds):
+    return '%.1f' % (seconds / 3600.0) if seconds is not None else '-'
+
+
+class Command(BaseCommand):
+    help = ('Reports the time spent in every state (compared with its estimation) '
+            'and the lead time of every workflow, computed by the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workflow', type=int, default=None, help='Only report on this workflow')
+        parser.add_argument('--since', default=None, help='Only count the history from this date')
+        parser.add_argument('--until', default=None, help='Only count the history before this date')
+        parser.add_argument('--json', action='store_true', default=False, help='Output the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_when(options['since']) if options['since'] else None
+            until = parse_when(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(e)
+        result = report(workflow=options['workflow'], since=since, until=until)
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2, sort_keys=True))
+            return
+
+        columns = ['count', 'mean'] + ['p%d' % p for p in PERCENTILES]
+        row = '%-30s' + ' %10s' * (len(columns) + 2)
+        self.stdout.write('Dwell time per state (hours)')
+        self.stdout.write(row % tuple(['state'] + columns + ['estimate', 'over']))
+        for item in result['states']:
+            self.stdout.write(row % tuple(
+                [item['name'][:30], item['count'], _hours(item['mean'])] +
+                [_hours(item['percentiles']['p%d' % p]) for p in PERCENTILES] +
+                [_hours(item['estimate']), item['over_estimate']]
+            ))
+        row = '%-30s' + ' %10s' * len(columns)
+        self.stdout.write('')
+        self.stdout.write('Lead time per workflow (hours)')
+        self.stdout.write(row % tuple(['workflow'] + columns))
+        for item in result['workflows']:
+            self.stdout.write(row % tuple(
+                [item['name'][:30], item['count'], _hours(item['mean'])] +
+                [_hours(item['percentiles']['p%d' % p]) for p in PERCENTILES]
+            ))
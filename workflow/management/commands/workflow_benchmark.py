@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.benchmarks.runner import run, PERCENTILES
+
+
+class Command(BaseCommand):
+    help = ('Times start(), progress(), current_state(), add_comment() and '
+            'is_valid() against a synthetic workflow and reports the latency '
+            'percentiles and query count of each. The generated data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--states', type=int, default=10, help='Number of states of the workflow')
+        parser.add_argument(
+            '--transitions', type=int, default=None,
+            help='Number of transitions of the workflow (defaults to twice the states)'
+        )
+        parser.add_argument('--history', type=int, default=10, help='Number of history rows per activity')
+        parser.add_argument('--iterations', type=int, default=50, help='Number of calls per operation')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the workflow generator')
+        parser.add_argument('--user', default=None, help='Username of the user running the workflows')
+        parser.add_argument('--json', action='store_true', default=False, help='Output the report as JSON')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('Unknown user %s' % options['user'])
+        else:
+            user = User.objects.order_by('pk').first()
+            if user is None:
+                raise CommandError('There are no users, create one or pass --user')
+        try:
+            report = run(
+                user, states=options['states'], transitions=options['transitions'],
+                history=options['history'], iterations=options['iterations'], seed=options['seed']
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        dump = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(dump)
+        if options['json']:
+            self.stdout.write(dump)
+            return
+
+        columns = ['p%d' % percent for percent in PERCENTILES] + ['max']
+        row = '%-16s' + ' %10s' * (len(columns) + 1)
+        self.stdout.write(row % tuple(['operation'] + ['%s (ms)' % c for c in columns] + ['queries']))
+        for name in sorted(report['operations']):
+            timing = report['operations'][name]
+            self.stdout.write(row % tuple(
+                [name] + ['%.3f' % timing[c] for c in columns] + ['%.1f' % timing['queries']]
+            ))
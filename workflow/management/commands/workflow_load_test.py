@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.benchmarks import load
+from workflow.models import Workflow
+
+
+class Command(BaseCommand):
+    help = ('Simulates concurrent participants starting, commenting on and '
+            'progressing shared workflow activities from a pool of threads and '
+            'reports the throughput, latencies, lock errors and conflicting '
+            'transitions. Needs a file backed database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of simulated participants')
+        parser.add_argument('--activities', type=int, default=20, help='Number of shared activities')
+        parser.add_argument('--operations', type=int, default=100, help='Number of operations per participant')
+        parser.add_argument(
+            '--workflow', type=int, default=None,
+            help='Id of an existing (e.g. fixture) workflow to use instead of a generated one'
+        )
+        parser.add_argument('--states', type=int, default=10, help='Number of states of the generated workflow')
+        parser.add_argument(
+            '--transitions', type=int, default=None,
+            help='Number of transitions of the generated workflow'
+        )
+        parser.add_argument(
+            '--comment-ratio', type=float, default=0.3,
+            help='Share of the operations on started activities that are comments'
+        )
+        parser.add_argument(
+            '--select-for-update', action='store_true', default=False,
+            help='Lock the activity rows instead of relying on the version check'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated participants')
+        parser.add_argument('--keep', action='store_true', default=False, help="Don't delete the generated data")
+        parser.add_argument('--json', action='store_true', default=False, help='Output the report as JSON')
+
+    def handle(self, *args, **options):
+        if load.is_in_memory():
+            raise CommandError('The load test needs a file backed database')
+        workflow = None
+        if options['workflow'] is not None:
+            try:
+                workflow = Workflow.objects.get(pk=options['workflow'])
+            except Workflow.DoesNotExist:
+                raise CommandError('Unknown workflow %s' % options['workflow'])
+        try:
+            workflow, users, activity_ids, created, created_users = load.prepare(
+                workflow=workflow, threads=options['threads'], activities=options['activities'],
+                states=options['states'], transitions=options['transitions'], seed=options['seed']
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        try:
+            report = load.LoadTest(
+                workflow, users, activity_ids, operations=options['operations'],
+                comment_ratio=options['comment_ratio'],
+                select_for_update=options['select_for_update'], seed=options['seed']
+            ).run()
+        finally:
+            if not options['keep']:
+                load.cleanup(activity_ids, created, created_users)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        self.stdout.write('%d operations in %.2fs: %.1f operations/s' % (
+            report['succeeded'], report['elapsed'], report['throughput']))
+        for name in sorted(report['operations']):
+            timing = report['operations'][name]
+            if timing['count']:
+                self.stdout.write('%-10s %6d  p50 %8.3f ms  p99 %8.3f ms' % (
+                    name, timing['count'], timing['p50'], timing['p99']))
+        errors = report['errors']
+        self.stdout.write('conflicting transitions: %d, invalid transitions: %d, '
+                          'lock errors: %d, other errors: %d' % (
+                              errors['conflicts'], errors['invalid'],
+                              errors['lock_errors'], errors['other']))
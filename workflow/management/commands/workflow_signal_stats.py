@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import argparse
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from workflow import instrumentation
+
+
+class Command(BaseCommand):
+    help = ('Runs a management command with the workflow signal instrumentation '
+            'enabled and dumps the call count, cumulative and maximum duration '
+            'per signal and receiver')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json', action='store_true', default=False,
+            help='Dump the statistics as JSON'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=None,
+            help='Log receivers slower than this many seconds'
+        )
+        parser.add_argument(
+            'subcommand',
+            help='The management command to run (the statistics are kept per '
+                 'process so only those of this one can be dumped)'
+        )
+        parser.add_argument('subcommand_args', nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        instrumentation.reset()
+        instrumentation.enable(threshold=options['threshold'])
+        try:
+            call_command(options['subcommand'], *options['subcommand_args'],
+                         stdout=self.stdout, stderr=self.stderr)
+        finally:
+            instrumentation.use_settings()
+
+        stats = instrumentation.get_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+            return
+
+        row = '%-60s %8s %12s %12s'
+        self.stdout.write(row % ('signal / receiver', 'calls', 'total (ms)', 'max (ms)'))
+        for name in sorted(stats, key=lambda name: -stats[name]['total']):
+            signal = stats[name]
+            self.stdout.write(row % (
+                name, signal['calls'], '%.3f' % (signal['total'] * 1000), '%.3f' % (signal['max'] * 1000)
+            ))
+            receivers = signal['receivers']
+            for receiver in sorted(receivers, key=lambda r: -receivers[r]['total']):
+                timing = receivers[receiver]
+                self.stdout.write(row % (
+                    '    ' + receiver, timing['calls'],
+                    '%.3f' % (timing['total'] * 1000), '%.3f' % (timing['max'] * 1000)
+                ))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0006_require_contenttypes_0002'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Participant',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('disabled', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-disabled', 'workflowactivity', 'user'],
+                'verbose_name': 'Participant',
+                'verbose_name_plural': 'Participants',
+            },
+        ),
+        migrations.CreateModel(
+            name='State',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=128, verbose_name='Name')),
+                ('description', models.TextField(default='', verbose_name='Description', blank=True)),
+                ('is_start_state', models.BooleanField(default=False, verbose_name='Is the start state?')),
+                ('is_end_state', models.BooleanField(default=False, verbose_name='Is an end state?')),
+                ('estimation_value', models.IntegerField(default=0, help_text='Use whole numbers', verbose_name='Estimated time (value)')),
+                ('estimation_unit', models.IntegerField(default=86400, verbose_name='Estimation unit of time', choices=[(1, 'Second(s)'), (60, 'Minute(s)'), (3600, 'Hour(s)'), (86400, 'Day(s)'), (604800, 'Week(s)')])),
+                ('groups', models.ManyToManyField(to='auth.Group', blank=True)),
+                ('users', models.ManyToManyField(to=settings.AUTH_USER_MODEL, blank=True)),
+            ],
+            options={
+                'ordering': ['-is_start_state', 'is_end_state'],
+                'verbose_name': 'State',
+                'verbose_name_plural': 'States',
+            },
+        ),
+        migrations.CreateModel(
+            name='Transition',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=128, verbose_name='Name of transition')),
+                ('description', models.TextField(default='', verbose_name='Description', blank=True)),
+                ('from_state', models.ForeignKey(related_name='transitions_from', to='workflow.State')),
+                ('groups', models.ManyToManyField(to='auth.Group', blank=True)),
+                ('to_state', models.ForeignKey(related_name='transitions_into', to='workflow.State')),
+                ('users', models.ManyToManyField(to=settings.AUTH_USER_MODEL, blank=True)),
+            ],
+            options={
+                'verbose_name': 'Transition',
+                'verbose_name_plural': 'Transitions',
+            },
+        ),
+        migrations.CreateModel(
+            name='Workflow',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=128, verbose_name='Workflow Name')),
+                ('label', models.CharField(max_length=64, verbose_name='Workflow label')),
+                ('slug', models.SlugField(verbose_name='Slug', editable=False)),
+                ('description', models.TextField(default='', verbose_name='Description', blank=True)),
+                ('status', models.IntegerField(default=0, verbose_name='Status', choices=[(0, 'In definition'), (1, 'Active'), (2, 'Retired')])),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['status', 'name'],
+                'verbose_name': 'Workflow',
+                'verbose_name_plural': 'Workflows',
+                'permissions': (('can_manage_workflows', 'Can manage workflows'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowActivity',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('completed_on', models.DateTimeField(null=True, blank=True)),
+                ('created_by', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+                ('workflow', models.ForeignKey(to='workflow.Workflow')),
+            ],
+            options={
+                'ordering': ['-created_on', '-completed_on'],
+                'verbose_name': 'Workflow Activity',
+                'verbose_name_plural': 'Workflow Activities',
+                'permissions': (('can_start_workflow', 'Can start a workflow'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowHistory',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('log_type', models.IntegerField(help_text='The sort of thing being logged', choices=[(1, 'Transition'), (2, 'Comment')])),
+                ('note', models.TextField(default='', verbose_name='Note', blank=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('deadline', models.DateTimeField(help_text='The deadline for staying in this state', null=True, verbose_name='Deadline', blank=True)),
+                ('participant', models.ForeignKey(help_text='The participant who triggered this happening in the workflow history', to='workflow.Participant')),
+                ('state', models.ForeignKey(to='workflow.State', help_text='The state at this point in the workflow history', null=True)),
+                ('transition', models.ForeignKey(related_name='history', to='workflow.Transition', help_text='The transition relating to this happening in the workflow history', null=True)),
+                ('workflowactivity', models.ForeignKey(related_name='history', to='workflow.WorkflowActivity')),
+            ],
+            options={
+                'ordering': ['-created_on'],
+                'verbose_name': 'Workflow History',
+                'verbose_name_plural': 'Workflow Histories',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowModelRelation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('content_type', models.ForeignKey(verbose_name='Content Type', to='contenttypes.ContentType')),
+                ('workflow', models.ForeignKey(verbose_name='Workflow', to='workflow.Workflow')),
+            ],
+            options={
+                'verbose_name': 'Workflow model relation',
+                'verbose_name_plural': 'Workflow model relations',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowObjectRelation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('content_id', models.PositiveIntegerField()),
+                ('content_type', models.ForeignKey(related_name='workflow_object', to='contenttypes.ContentType')),
+                ('workflow', models.ForeignKey(verbose_name='Workflow', to='workflow.Workflow')),
+            ],
+            options={
+                'verbose_name': 'Workflow object relation',
+                'verbose_name_plural': 'Workflow object relations',
+            },
+        ),
+        migrations.AddField(
+            model_name='transition',
+            name='workflow',
+            field=models.ForeignKey(related_name='transitions', to='workflow.Workflow'),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='workflow',
+            field=models.ForeignKey(related_name='states', to='workflow.Workflow'),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='workflowactivity',
+            field=models.ForeignKey(related_name='participants', to='workflow.WorkflowActivity'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='workflowobjectrelation',
+            unique_together=set([('content_type', 'content_id')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='participant',
+            unique_together=set([('user', 'workflowactivity')]),
+        ),
+    ]
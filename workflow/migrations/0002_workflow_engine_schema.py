@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedParticipant',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('disabled', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(null=True)),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-disabled', 'workflowactivity', 'user'],
+                'verbose_name': 'Archived participant',
+                'verbose_name_plural': 'Archived participants',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedWorkflowHistory',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('log_type', models.IntegerField(choices=[(1, 'Transition'), (2, 'Comment')])),
+                ('note', models.TextField(default='', verbose_name='Note', blank=True)),
+                ('created_on', models.DateTimeField()),
+                ('deadline', models.DateTimeField(null=True, verbose_name='Deadline', blank=True)),
+                ('subject_disabled', models.NullBooleanField()),
+                ('participant', models.ForeignKey(to='workflow.ArchivedParticipant')),
+            ],
+            options={
+                'ordering': ['-created_on'],
+                'verbose_name': 'Archived workflow history',
+                'verbose_name_plural': 'Archived workflow histories',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowSnapshot',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('taken_on', models.DateTimeField()),
+                ('last_history', models.IntegerField(help_text='The id of the latest WorkflowHistory item included', null=True)),
+                ('participants', models.TextField(default='{}')),
+            ],
+            options={
+                'ordering': ['-taken_on'],
+                'verbose_name': 'Workflow snapshot',
+                'verbose_name_plural': 'Workflow snapshots',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkflowVersion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('number', models.PositiveIntegerField(verbose_name='Version', editable=False)),
+                ('definition', models.TextField(verbose_name='Definition', editable=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-number'],
+                'verbose_name': 'Workflow version',
+                'verbose_name_plural': 'Workflow versions',
+            },
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='created_on',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workflow',
+            name='cloned_from',
+            field=models.ForeignKey(related_name='clones', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='workflow.Workflow', null=True),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='archived_history_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='archived_on',
+            field=models.DateTimeField(help_text='When the history of this activity was archived', verbose_name='Archived on', null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='current_history',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='workflow.WorkflowHistory', null=True),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='deadline',
+            field=models.DateTimeField(editable=False, blank=True, help_text='The deadline for staying in the current state', null=True, verbose_name='Deadline', db_index=True),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='state',
+            field=models.ForeignKey(related_name='activities', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='workflow.State', help_text='The state this activity is currently in', null=True),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workflowhistory',
+            name='subject',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='workflow.Participant', null=True),
+        ),
+        migrations.AddField(
+            model_name='workflowhistory',
+            name='subject_disabled',
+            field=models.NullBooleanField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='workflowactivity',
+            name='created_on',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='workflowhistory',
+            name='created_on',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='state',
+            index_together=set([('workflow', 'is_start_state')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='workflowactivity',
+            index_together=set([('workflow', 'created_on')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='workflowhistory',
+            index_together=set([('workflowactivity', 'created_on')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='workflowmodelrelation',
+            index_together=set([('content_type', 'workflow')]),
+        ),
+        migrations.AddField(
+            model_name='workflowversion',
+            name='workflow',
+            field=models.ForeignKey(related_name='versions', to='workflow.Workflow'),
+        ),
+        migrations.AddField(
+            model_name='workflowsnapshot',
+            name='state',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='workflow.State', null=True),
+        ),
+        migrations.AddField(
+            model_name='workflowsnapshot',
+            name='workflowactivity',
+            field=models.ForeignKey(related_name='snapshots', to='workflow.WorkflowActivity'),
+        ),
+        migrations.AddField(
+            model_name='archivedworkflowhistory',
+            name='state',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='workflow.State', null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedworkflowhistory',
+            name='subject',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='workflow.ArchivedParticipant', null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedworkflowhistory',
+            name='transition',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='workflow.Transition', null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedworkflowhistory',
+            name='workflowactivity',
+            field=models.ForeignKey(related_name='archived_history', to='workflow.WorkflowActivity'),
+        ),
+        migrations.AddField(
+            model_name='archivedparticipant',
+            name='workflowactivity',
+            field=models.ForeignKey(related_name='archived_participants', to='workflow.WorkflowActivity'),
+        ),
+        migrations.AddField(
+            model_name='workflowactivity',
+            name='workflow_version',
+            field=models.ForeignKey(related_name='activities', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='workflow.WorkflowVersion', null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='workflowversion',
+            unique_together=set([('workflow', 'number')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='workflowsnapshot',
+            index_together=set([('workflowactivity', 'taken_on')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedworkflowhistory',
+            index_together=set([('workflowactivity', 'created_on')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Max
+
+BATCH_SIZE = 1000
+
+
+def backfill_workflow_state(apps, schema_editor):
+    """
+    Points the denormalized current_history, state and deadline fields of the
+    activities recorded before they existed at their latest history item (the
+    same as the backfill_workflow_state command), so that start() doesn't take
+    them for unstarted activities
+    """
+    WorkflowActivity = apps.get_model('workflow', 'WorkflowActivity')
+    WorkflowHistory = apps.get_model('workflow', 'WorkflowHistory')
+    db = schema_editor.connection.alias
+    activities = WorkflowActivity.objects.using(db).filter(current_history__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        ids = list(activities.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        latest = (WorkflowHistory.objects.using(db).filter(workflowactivity__in=ids)
+                  .order_by().values('workflowactivity').annotate(latest=Max('id')))
+        rows = (WorkflowHistory.objects.using(db)
+                .filter(pk__in=[item['latest'] for item in latest])
+                .values_list('workflowactivity', 'pk', 'state', 'deadline'))
+        for activity_id, history_id, state_id, deadline in rows:
+            WorkflowActivity.objects.using(db).filter(pk=activity_id).update(
+                current_history=history_id, state=state_id, deadline=deadline
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0002_workflow_engine_schema'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_workflow_state, migrations.RunPython.noop),
+    ]
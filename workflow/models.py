@@ -2,8 +2,13 @@
 from __future__ import unicode_literals
 
 import datetime
+import json
+from contextlib import contextmanager
 
-from django.db import models
+from django.db import models, transaction, connections
+from django.db.models import Case, When, Value, Q, F, Max
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import ugettext_lazy as _, ugettext as __
 from django.contrib.auth.models import User, Group
@@ -14,12 +19,18 @@ from django.utils.text import slugify
 
 from workflow.signals import (
     workflow_started, workflow_pre_change, workflow_post_change,
-    workflow_transitioned, workflow_commented, workflow_ended
+    workflow_transitioned, workflow_commented, workflow_ended, workflow_bulk_started,
+    workflow_bulk_progressed
 )
 from workflow.exceptions import (
-    UnableToActivateWorkflow, UnableToStartWorkflow, UnableToProgressWorkflow,
-    UnableToAddCommentToWorkflow, UnableToDisableParticipant, UnableToEnableParticipant
+    WorkflowException, UnableToActivateWorkflow, UnableToCloneWorkflow, UnableToStartWorkflow,
+    UnableToProgressWorkflow, UnableToAddCommentToWorkflow, UnableToDisableParticipant,
+    UnableToEnableParticipant, ConcurrentWorkflowChange
 )
+from workflow import dispatch, resolver
+from workflow.graph import graph_cache, get_graph
+from workflow.permissions import permission_cache, user_groups, get_permission_index
+from workflow.versions import definition_graph, get_version_graph, get_version_permission_index
 
 
 class Workflow(models.Model):
@@ -45,6 +56,10 @@ class Workflow(models.Model):
     status = models.IntegerField(_('Status'), choices=STATUS_CHOICE, default=DEFINITION)
     created_by = models.ForeignKey(User)
     created_on = models.DateTimeField(auto_now_add=True)
+    cloned_from = models.ForeignKey(
+            'self', null=True, blank=True, editable=False, related_name='clones',
+            on_delete=models.SET_NULL
+        )
 
     class Meta:
         ordering = ['status', 'name']
@@ -58,12 +73,16 @@ class Workflow(models.Model):
         self.slug = slugify(urlquote(self.name))
         return super(Workflow, self).save(*args, **kwargs)
 
-    def is_valid(self):
+    def is_valid(self, graph=None):
         """
-        Checks that the directed graph doesn't contain any orphaned nodes (is
-        connected), any cul-de-sac nodes (non-end nodes with no exit
-        transition), has compatible roles for transitions and states and
-        contains exactly one start node and at least one end state.
+        Checks that every state of the directed graph can be reached from the
+        start node (no orphaned nodes), that an end node can be reached from
+        every state (no cul-de-sac nodes), that every transition connects
+        reachable states of this workflow and that the graph contains exactly
+        one start node and at least one end state.
+
+        The (cached) graph of the live definition is checked unless another
+        WorkflowGraph of this workflow is given.
 
         Any errors are logged in the errors dictionary.
 
@@ -75,40 +94,75 @@ class Workflow(models.Model):
             'transitions': {},
         }
         valid = True
+        if graph is None:
+            graph = self.get_graph()
 
         # The graph must have only one start node
-        if self.states.filter(is_start_state=True).count() != 1:
+        if len(graph.start_states) != 1:
             self.errors['workflow'].append(__('There must be only one start state'))
             valid = False
 
         # The graph must have at least one end state
-        if self.states.filter(is_end_state=True).count() < 1:
+        if len(graph.end_states) < 1:
             self.errors['workflow'].append(__('There must be at least one end state'))
             valid = False
 
-        # Check for orphan nodes / cul-de-sac nodes
-        all_states = self.states.all()
-        for state in all_states:
-            if state.transitions_into.all().count() == 0 and not state.is_start_state:
-                if state.id not in self.errors['states']:
-                    self.errors['states'][state.id] = list()
-                self.errors['states'][state.id].append(
+        # Check for orphan nodes / cul-de-sac nodes. Without a single start
+        # state reachability means nothing: only the states no transition
+        # leads to are orphaned.
+        if len(graph.start_states) == 1:
+            reachable = graph.reachable_from(graph.start_states)
+        else:
+            reachable = None
+        can_end = graph.reaching(graph.end_states)
+        for state in graph.states.values():
+            if reachable is not None:
+                orphaned = state.id not in reachable
+            else:
+                orphaned = not graph.incoming[state.id]
+            if orphaned and not state.is_start_state:
+                self.errors['states'].setdefault(state.id, []).append(
                     __('This state is orphaned. '
                        'There is no way to get to it given the current workflow topology.')
                 )
                 valid = False
 
-            if state.transitions_from.all().count() == 0 and not state.is_end_state:
-                if state.id not in self.errors['states']:
-                    self.errors['states'][state.id] = list()
-                self.errors['states'][state.id].append(
+            if not graph.outgoing[state.id] and not state.is_end_state:
+                self.errors['states'].setdefault(state.id, []).append(
                     __('This state is a dead end. '
                        'It is not marked as an end state and there is no way to exit from it.')
                 )
                 valid = False
+            elif graph.end_states and state.id not in can_end:
+                self.errors['states'].setdefault(state.id, []).append(
+                    __('This state is a dead end. '
+                       'There is no way to reach an end state from it.')
+                )
+                valid = False
+
+        # Check for transitions that can never be used
+        for transition in graph.transitions.values():
+            if (transition.from_state_id not in graph.states or
+                    transition.to_state_id not in graph.states):
+                self.errors['transitions'].setdefault(transition.id, []).append(
+                    __('This transition connects a state of another workflow.')
+                )
+                valid = False
+            elif reachable is not None and transition.from_state_id not in reachable:
+                self.errors['transitions'].setdefault(transition.id, []).append(
+                    __('This transition can never be used as the state it '
+                       'leaves from is orphaned.')
+                )
+                valid = False
 
         return valid
 
+    def get_graph(self):
+        """
+        Returns the compiled (and cached) WorkflowGraph of this workflow
+        """
+        return get_graph(self.pk)
+
     def has_errors(self, thing):
         """
         Utility method to quickly get a list of errors associated with the
@@ -132,7 +186,8 @@ class Workflow(models.Model):
         Puts the workflow in the "active" state after checking the directed
         graph doesn't contain any orphaned nodes (is connected), is in 
         DEFINITION state, has compatible roles for transitions and states and
-        contains exactly one start state and at least one end state
+        contains exactly one start state and at least one end state. The
+        definition is frozen into the first WorkflowVersion (see publish).
         """
         # Only workflows in definition state can be activated
         if self.status != self.DEFINITION:
@@ -144,8 +199,46 @@ class Workflow(models.Model):
                 __("Cannot activate as the workflow doesn't validate.")
             )
 
-        self.status = self.ACTIVE
-        self.save()
+        with transaction.atomic():
+            self.status = self.ACTIVE
+            self.save()
+            self.publish()
+
+    def publish(self):
+        """
+        Freezes the current definition of this active workflow (its states,
+        transitions and their permissions) into a new WorkflowVersion. The
+        activities started from now on pin it and are validated against it
+        whatever changes are made to the states and transitions afterwards.
+        The definition is validated as exported, not as cached.
+        """
+        from workflow.definitions import export_definition
+        if self.status != self.ACTIVE:
+            raise UnableToActivateWorkflow(__('Only active workflows may be published'))
+        definition = json.dumps(export_definition(self, natural_keys=False))
+        if not self.is_valid(definition_graph(self.pk, json.loads(definition))):
+            raise UnableToActivateWorkflow(
+                __("Cannot publish as the workflow doesn't validate.")
+            )
+        latest = self.versions.aggregate(latest=Max('number'))['latest']
+        return WorkflowVersion.objects.create(
+            workflow=self, number=(latest or 0) + 1, definition=definition
+        )
+
+    def clone(self, user, name=None):
+        """
+        Returns a copy of this workflow (its states, transitions and their
+        permissions) in the DEFINITION state, as a new revision to work on.
+        Only active or retired workflows (which are known to be valid) may be
+        cloned. The copy is made with a handful of bulk queries whatever the
+        size of the workflow (see workflow.definitions).
+        """
+        from workflow.definitions import export_definition, import_definition
+        if self.status < self.ACTIVE:
+            raise UnableToCloneWorkflow(
+                __('Only active or retired workflows may be cloned')
+            )
+        return import_definition(export_definition(self), user, name=name, cloned_from=self)
 
     def retire(self):
         """
@@ -202,14 +295,26 @@ class State(models.Model):
         ordering = ['-is_start_state', 'is_end_state']
         verbose_name = _('State')
         verbose_name_plural = _('States')
+        # Finding the start state(s) of a workflow
+        index_together = [('workflow', 'is_start_state')]
+
+    def duration(self):
+        """
+        Will return the estimated time (a timedelta) to be spent in this state
+        or None if there is no estimation
+        """
+        if self.estimation_value > 0:
+            return datetime.timedelta(seconds=(self.estimation_value * self.estimation_unit))
+        else:
+            return None
 
     def deadline(self):
         """
         Will return the expected deadline (or None) for this state calculated
         from datetime.today()
         """
-        if self.estimation_value > 0:
-            duration = datetime.timedelta(seconds=(self.estimation_value * self.estimation_unit))
+        duration = self.duration()
+        if duration is not None:
             return datetime.datetime.today() + duration
         else:
             return None
@@ -220,7 +325,7 @@ class State(models.Model):
                 ).all().distinct()
 
     def has_perm_view(self, user):
-        return user in self.can_view_users()
+        return get_permission_index(self.workflow_id).can_view(user, self)
 
     def __unicode__(self):
         return '%s - %s' % (self.name, self.workflow)
@@ -254,7 +359,400 @@ class Transition(models.Model):
                 ).all().distinct()
 
     def has_perm_use(self, user):
-        return user in self.can_use_users()
+        return get_permission_index(self.workflow_id).can_use(user, self)
+
+
+class WorkflowVersion(models.Model):
+    """
+    An immutable copy of the definition of a workflow (as written by
+    workflow.definitions.export_definition) frozen by Workflow.publish().
+    WorkflowActivity instances pin the latest version of their workflow when
+    they are started. Being immutable, what is compiled from a version is
+    cached for good (see workflow.versions).
+    """
+    workflow = models.ForeignKey(Workflow, related_name='versions')
+    number = models.PositiveIntegerField(_('Version'), editable=False)
+    definition = models.TextField(_('Definition'), editable=False)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        unique_together = ('workflow', 'number')
+        verbose_name = _('Workflow version')
+        verbose_name_plural = _('Workflow versions')
+
+    def __unicode__(self):
+        return '%s (v%d)' % (self.workflow, self.number)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise WorkflowException(__('Workflow versions are immutable'))
+        return super(WorkflowVersion, self).save(*args, **kwargs)
+
+    def get_definition(self):
+        return json.loads(self.definition)
+
+    def get_graph(self):
+        """
+        Returns the compiled (and cached) WorkflowGraph of this version
+        """
+        return get_version_graph(self.pk)
+
+    def get_permission_index(self):
+        """
+        Returns the compiled (and cached) PermissionIndex of this version
+        """
+        return get_version_permission_index(self.pk)
+
+
+def _unique(activities):
+    """
+    Returns the list of the activities without repetitions (the first
+    instance of every activity is kept)
+    """
+    seen = set()
+    unique = []
+    for activity in activities:
+        if activity.pk is None or activity.pk not in seen:
+            seen.add(activity.pk)
+            unique.append(activity)
+    return unique
+
+
+class WorkflowActivityManager(models.Manager):
+    """
+    Adds bulk operations for launching, progressing and inspecting many
+    WorkflowActivity instances with a fixed number of queries per batch
+    """
+
+    def bulk_start(self, activities, user, batch_size=250, send_signals=False):
+        """
+        Starts many (saved) WorkflowActivity instances at once by putting them
+        into the start state of their workflow. The user is made a participant
+        of every activity it doesn't already take part in.
+
+        Every batch is validated and written in its own transaction with a
+        constant number of queries and the workflow_bulk_started signal is
+        sent once per batch. The per-item signals fired by
+        WorkflowHistory.save() are only sent when send_signals is True. All of
+        them are delivered according to WORKFLOW_SIGNAL_DISPATCH (see
+        workflow.dispatch). An activity given more than once is only started
+        once.
+
+        Returns the list of created WorkflowHistory items.
+        """
+        activities = _unique(activities)
+        history = []
+        for i in range(0, len(activities), batch_size):
+            batch = activities[i:i + batch_size]
+            history.extend(self._bulk_start(batch, user, send_signals))
+        return history
+
+    def _bulk_start(self, activities, user, send_signals):
+        if any(activity.pk is None for activity in activities):
+            raise UnableToStartWorkflow(__('Activities must be saved before being started'))
+        ids = [activity.pk for activity in activities]
+
+        with transaction.atomic():
+            # Validation (the same rules as WorkflowActivity.start())
+            current = dict(
+                (pk, (state_id, completed_on, version)) for pk, state_id, completed_on, version in
+                self.select_for_update().filter(pk__in=ids).values_list(
+                    'pk', 'state', 'completed_on', 'version')
+            )
+            for activity in activities:
+                state_id, completed_on, activity.version = current[activity.pk]
+                if state_id:
+                    raise UnableToStartWorkflow(__('Already started'))
+                if completed_on:
+                    raise UnableToStartWorkflow(__('Already completed'))
+            # The activities pin the latest version of their workflow
+            versions = self.latest_versions(set(activity.workflow_id for activity in activities))
+            graphs = {}
+            for activity in activities:
+                activity.workflow_version_id = versions.get(activity.workflow_id)
+                if activity.workflow_id not in graphs:
+                    graphs[activity.workflow_id] = activity.get_graph()
+            for graph in graphs.values():
+                if graph.start_state is None:
+                    raise UnableToStartWorkflow(__('Cannot find single start state'))
+
+            participants = self._bulk_participants(ids, user)
+            for activity in activities:
+                activity.clear_participant_cache()
+            deadlines = dict(
+                (workflow_id, graph.deadline(graph.start_state.id))
+                for workflow_id, graph in graphs.items()
+            )
+            history = [
+                WorkflowHistory(
+                    workflowactivity=activity,
+                    state=graphs[activity.workflow_id].start_state,
+                    log_type=WorkflowHistory.TRANSITION,
+                    note=__('Started workflow'),
+                    participant_id=participants[activity.pk],
+                    deadline=deadlines[activity.workflow_id]
+                ) for activity in activities
+            ]
+            if send_signals and dispatch.has_receivers(workflow_pre_change):
+                for wh in history:
+                    workflow_pre_change.send(sender=wh)
+            self._bulk_create_history(history)
+            self._bulk_set_current_history(history, None)
+
+        signals = [(workflow_bulk_started, WorkflowActivity, {
+            'activities': activities, 'history': history
+        })]
+        if send_signals:
+            for wh in history:
+                signals.extend(wh.post_save_signals())
+        dispatch.send(signals)
+        return history
+
+    def bulk_progress(self, activities, transition, user, note='', batch_size=250,
+                      send_signals=False):
+        """
+        Progresses many WorkflowActivity instances with the same transition in
+        a single transaction.
+
+        The current state of a whole batch of activities is validated with one
+        query, the WorkflowHistory items are created with bulk_create and the
+        activities reaching an end state are marked as completed with a single
+        UPDATE. Activities that can't be progressed don't abort the others.
+        The rows of a batch are locked while it is validated (on databases that
+        support SELECT ... FOR UPDATE) and ConcurrentWorkflowChange is raised
+        if one of them is transitioned by someone else nonetheless. An
+        activity given more than once is only progressed once.
+
+        Returns a (history, failures) tuple: the list of created
+        WorkflowHistory items and a dict mapping the id of every activity that
+        wasn't progressed to the UnableToProgressWorkflow exception explaining
+        why.
+        """
+        activities = _unique(activities)
+        graph = get_graph(transition.workflow_id)
+        live = graph.transitions.get(transition.id, transition)
+        # The state the transition leaves from, its target state and the
+        # deadline by pinned version (None for the live definition), None if
+        # the transition isn't part of the version
+        targets = {None: (
+            live.from_state_id, graph.get_state(live.to_state_id) or live.to_state,
+            graph.deadline(live.to_state_id)
+        )}
+        history = []
+        failures = {}
+
+        with transaction.atomic():
+            for i in range(0, len(activities), batch_size):
+                batch = activities[i:i + batch_size]
+                ids = [activity.pk for activity in batch]
+                current = dict(
+                    (pk, (state_id, version, version_id)) for pk, state_id, version, version_id in
+                    self.select_for_update().filter(pk__in=ids).values_list(
+                        'pk', 'state', 'version', 'workflow_version')
+                )
+                for state_id, version, version_id in current.values():
+                    if version_id not in targets:
+                        version_graph = get_version_graph(version_id)
+                        target = version_graph.transitions.get(transition.id)
+                        targets[version_id] = target and (
+                            target.from_state_id, version_graph.get_state(target.to_state_id),
+                            version_graph.deadline(target.to_state_id)
+                        )
+                participants = dict(Participant.objects.filter(
+                    workflowactivity__in=ids, user=user, disabled=False
+                ).values_list('workflowactivity', 'pk'))
+
+                items = []
+                # The items by the state their activity must still be in
+                from_states = {}
+                for activity in batch:
+                    if activity.pk not in participants:
+                        failures[activity.pk] = UnableToProgressWorkflow(
+                            __('Not an enabled participant of the workflow activity'))
+                    elif current.get(activity.pk, (None,))[0] is None:
+                        failures[activity.pk] = UnableToProgressWorkflow(
+                            __('Start the workflow before attempting to transition'))
+                    elif (targets[current[activity.pk][2]] is None or
+                            current[activity.pk][0] != targets[current[activity.pk][2]][0]):
+                        failures[activity.pk] = UnableToProgressWorkflow(
+                            __('Transition not valid (wrong parent)'))
+                    else:
+                        state_id, activity.version, activity.workflow_version_id = current[activity.pk]
+                        from_state_id, target_state, deadline = targets[activity.workflow_version_id]
+                        wh = WorkflowHistory(
+                            workflowactivity=activity,
+                            state=target_state,
+                            log_type=WorkflowHistory.TRANSITION,
+                            transition=transition,
+                            note=note if note else transition.name,
+                            participant_id=participants[activity.pk],
+                            deadline=deadline
+                        )
+                        items.append(wh)
+                        from_states.setdefault(from_state_id, []).append(wh)
+                if not items:
+                    continue
+
+                if send_signals and dispatch.has_receivers(workflow_pre_change):
+                    for wh in items:
+                        workflow_pre_change.send(sender=wh)
+                self._bulk_create_history(items)
+                for from_state_id, group in from_states.items():
+                    self._bulk_set_current_history(group, from_state_id)
+                # If we're at the end then mark the workflow activities as completed on today
+                ended = [wh for wh in items if wh.state.is_end_state]
+                if ended:
+                    completed_on = datetime.datetime.today()
+                    self.filter(pk__in=[wh.workflowactivity_id for wh in ended]).update(
+                        completed_on=completed_on
+                    )
+                    for wh in ended:
+                        wh.workflowactivity.completed_on = completed_on
+                history.extend(items)
+
+        signals = [(workflow_bulk_progressed, WorkflowActivity, {
+            'activities': [wh.workflowactivity for wh in history],
+            'history': history,
+            'transition': transition,
+        })]
+        if send_signals:
+            for wh in history:
+                signals.extend(wh.post_save_signals())
+        dispatch.send(signals)
+        return history, failures
+
+    def available_transitions(self, user, activities):
+        """
+        Returns a dict mapping the id of every given activity (a queryset or
+        an iterable of WorkflowActivity instances or ids) to the list of
+        transitions the user may use to progress it.
+
+        Only the enabled participants of a started, uncompleted activity can
+        progress it so every other activity maps to an empty list. The number
+        of queries doesn't depend on the number of activities.
+        """
+        fields = ('pk', 'workflow', 'workflow_version', 'state', 'completed_on')
+        if isinstance(activities, models.QuerySet):
+            rows = activities.values_list(*fields)
+        else:
+            ids = [getattr(activity, 'pk', activity) for activity in activities]
+            rows = self.filter(pk__in=ids).values_list(*fields)
+        rows = list(rows)
+        ids = [row[0] for row in rows]
+        enabled = set(Participant.objects.filter(
+            workflowactivity__in=ids, user=user, disabled=False
+        ).values_list('workflowactivity', flat=True))
+
+        usable = {}
+        available = {}
+        for pk, workflow_id, version_id, state_id, completed_on in rows:
+            available[pk] = []
+            if pk not in enabled or state_id is None or completed_on:
+                continue
+            # The definition the activity was pinned to or the live one
+            if version_id:
+                index, graph = get_version_permission_index(version_id), get_version_graph(version_id)
+            else:
+                index, graph = get_permission_index(workflow_id), get_graph(workflow_id)
+            if (workflow_id, version_id) not in usable:
+                usable[workflow_id, version_id] = index.usable_transitions(user)
+            available[pk] = [
+                transition for transition in graph.transitions_from(state_id)
+                if transition.id in usable[workflow_id, version_id]
+            ]
+        return available
+
+    def latest_versions(self, workflow_ids):
+        """
+        Returns a dict mapping the given workflow ids to the id of their
+        latest WorkflowVersion (the published ones only) with one query
+        """
+        return dict(WorkflowVersion.objects.filter(workflow__in=workflow_ids)
+                    .order_by('number').values_list('workflow', 'pk'))
+
+    def _bulk_participants(self, ids, user):
+        """
+        Returns a dict mapping the given activity ids to the id of the user's
+        participant, creating the missing participants in bulk
+        """
+        participants = {}
+        for activity_id, pk, disabled in Participant.objects.filter(
+                workflowactivity__in=ids, user=user).values_list('workflowactivity', 'pk', 'disabled'):
+            if disabled:
+                raise UnableToStartWorkflow(__('The participant is disabled'))
+            participants[activity_id] = pk
+        missing = [pk for pk in ids if pk not in participants]
+        if missing:
+            Participant.objects.bulk_create([
+                Participant(workflowactivity_id=pk, user=user) for pk in missing
+            ])
+            participants.update(Participant.objects.filter(
+                workflowactivity__in=missing, user=user).values_list('workflowactivity', 'pk'))
+        return participants
+
+    def _bulk_create_history(self, history):
+        """
+        Inserts the WorkflowHistory items (transitions) with bulk_create()
+        making sure their primary keys are set afterwards
+        """
+        last_pk = WorkflowHistory.objects.order_by('-pk').values_list('pk', flat=True).first()
+        WorkflowHistory.objects.bulk_create(history)
+        if any(wh.pk is None for wh in history):
+            # Only some database backends return primary keys from bulk_create.
+            # The rows are read back matching every column that tells them
+            # apart from history written concurrently: the activities are
+            # locked against other transitions but comments may still be added.
+            pks = {}
+            for row in WorkflowHistory.objects.filter(
+                    pk__gt=last_pk or 0,
+                    log_type=WorkflowHistory.TRANSITION,
+                    workflowactivity__in=[wh.workflowactivity_id for wh in history],
+                    participant__in=set(wh.participant_id for wh in history),
+                    ).order_by('pk').values_list(
+                        'workflowactivity', 'state', 'transition', 'participant', 'pk'):
+                pks.setdefault(row[:4], row[4])
+            for wh in history:
+                wh.pk = pks[wh.workflowactivity_id, wh.state_id, wh.transition_id, wh.participant_id]
+
+    def _bulk_set_current_history(self, history, from_state_id):
+        """
+        Bulk version of WorkflowActivity.set_current_history(): points every
+        activity at its (freshly bulk created) WorkflowHistory transition and
+        increments its version.
+
+        Raises ConcurrentWorkflowChange (rolling the batch back) unless every
+        activity was still in the from_state_id state it was validated in.
+        Activities being started (from_state_id is None) also get pinned to
+        their workflow_version.
+        """
+        groups = {}
+        for wh in history:
+            version_id = wh.workflowactivity.workflow_version_id if from_state_id is None else None
+            groups.setdefault((wh.state_id, wh.deadline, version_id), []).append(wh)
+        for (state_id, deadline, version_id), items in groups.items():
+            pin = {'workflow_version': version_id} if version_id else {}
+            updated = self.filter(
+                pk__in=[wh.workflowactivity_id for wh in items], state=from_state_id
+            ).update(
+                current_history=Case(
+                    *[When(pk=wh.workflowactivity_id, then=Value(wh.pk)) for wh in items],
+                    output_field=models.IntegerField()
+                ),
+                state=state_id,
+                deadline=deadline,
+                version=F('version') + 1,
+                **pin
+            )
+            if updated != len(items):
+                raise ConcurrentWorkflowChange(
+                    __('A workflow activity was changed by someone else')
+                )
+            for wh in items:
+                wh.workflowactivity.current_history = wh
+                wh.workflowactivity.state_id = state_id
+                wh.workflowactivity.deadline = deadline
+                wh.workflowactivity.version += 1
 
 
 class WorkflowActivity(models.Model):
@@ -267,8 +765,44 @@ class WorkflowActivity(models.Model):
     """
     workflow = models.ForeignKey(Workflow)
     created_by = models.ForeignKey(User)
-    created_on = models.DateTimeField(auto_now_add=True)
+    # Indexed for the date hierarchy of the admin
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True)
     completed_on = models.DateTimeField(blank=True, null=True)
+    # Denormalized copy of the latest WorkflowHistory item, its state and its
+    # deadline. Kept up to date by WorkflowHistory.save() within the same
+    # transaction as the history item is inserted.
+    current_history = models.ForeignKey(
+            'WorkflowHistory', null=True, blank=True, editable=False,
+            related_name='+', on_delete=models.SET_NULL
+        )
+    state = models.ForeignKey(
+            State, null=True, blank=True, editable=False,
+            related_name='activities', on_delete=models.SET_NULL,
+            help_text=_('The state this activity is currently in')
+        )
+    deadline = models.DateTimeField(
+            _('Deadline'), blank=True, null=True, editable=False, db_index=True,
+            help_text=_('The deadline for staying in the current state')
+        )
+    # Incremented by every transition so that concurrent transitions of the
+    # same activity can be detected (see set_current_history)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Summary of the history and participants moved to the archive tables by
+    # workflow.archive once the activity was completed
+    archived_on = models.DateTimeField(
+            _('Archived on'), blank=True, null=True, editable=False,
+            help_text=_('When the history of this activity was archived')
+        )
+    archived_history_count = models.PositiveIntegerField(default=0, editable=False)
+    # The published definition this activity was started with and is
+    # validated against (see workflow.versions), None if its workflow wasn't
+    # published then
+    workflow_version = models.ForeignKey(
+            WorkflowVersion, null=True, blank=True, editable=False,
+            related_name='activities', on_delete=models.SET_NULL
+        )
+
+    objects = WorkflowActivityManager()
 
     class Meta:
         ordering = ['-created_on', '-completed_on']
@@ -277,83 +811,253 @@ class WorkflowActivity(models.Model):
         permissions = (
             ('can_start_workflow', __('Can start a workflow')),
         )
+        # The activities of a workflow, latest first (see workflow.views)
+        index_together = [('workflow', 'created_on')]
 
     def current_state(self):
         """
         Returns the instance of the WorkflowHistory model that represents the 
         current state this WorkflowActivity is in.
         """
-        if self.history.all():
-            return self.history.all().first()
+        if self.current_history_id is None:
+            # Either not started, archived or created before the denormalized
+            # pointer was backfilled (see the backfill_workflow_state command)
+            return self.get_history(include_archived=True).select_related('state').first()
+        if not hasattr(self, self._current_history_cache_name()):
+            self.current_history = WorkflowHistory.objects.select_related('state').get(
+                pk=self.current_history_id
+            )
+        return self.current_history
+
+    def get_history(self, include_archived=False):
+        """
+        Returns the history of this activity, latest first. Once the activity
+        was archived its history is served from ArchivedWorkflowHistory if
+        include_archived is True (and is empty otherwise).
+        """
+        if include_archived and self.archived_on:
+            return self.archived_history.all()
+        return self.history.all()
+
+    def _current_history_cache_name(self):
+        return self._meta.get_field('current_history').get_cache_name()
+
+    def reload_current_state(self, select_for_update=False):
+        """
+        Reloads the version and the denormalized current state of this
+        activity from the database (locking its row until the end of the
+        transaction if select_for_update is True) so that a transition is
+        validated against what was last committed.
+        """
+        queryset = WorkflowActivity.objects.filter(pk=self.pk)
+        if select_for_update:
+            queryset = queryset.select_for_update()
+        (self.version, self.state_id, current_history_id, self.deadline,
+         self.completed_on, self.workflow_version_id) = queryset.values_list(
+            'version', 'state', 'current_history', 'deadline', 'completed_on', 'workflow_version'
+        ).get()
+        if current_history_id != self.current_history_id:
+            self.__dict__.pop(self._current_history_cache_name(), None)
+            self.current_history_id = current_history_id
+
+    @contextmanager
+    def recording_transition(self, select_for_update=False):
+        """
+        Reloads the current state (see reload_current_state) to validate a
+        transition against and opens the transaction recording it.
+
+        With select_for_update the row of the activity is locked within the
+        transaction. Otherwise (or if the database doesn't support it) the
+        state is read beforehand so that no read lock is held while waiting
+        to write, which would make concurrent writers fail on SQLite; the
+        version compare-and-swap in set_current_history detects a transition
+        recorded in between.
+        """
+        lock = (select_for_update and
+                connections[self._state.db or 'default'].features.has_select_for_update)
+        if not lock:
+            self.reload_current_state()
+        with transaction.atomic(using=self._state.db):
+            if lock:
+                self.reload_current_state(select_for_update=True)
+            yield
+
+    def set_current_history(self, history):
+        """
+        Points the denormalized current_history, state and deadline fields at
+        the given WorkflowHistory item. Should be called within the transaction
+        that created the item.
+
+        A transition is only recorded if the version of the activity is still
+        the one it was validated against (raising ConcurrentWorkflowChange
+        otherwise) and increments it. A comment only becomes the current item
+        if the state it recorded is still the current one.
+        """
+        activities = WorkflowActivity.objects.filter(pk=self.pk)
+        updates = {
+            'current_history': history.pk,
+            'state': history.state_id,
+            'deadline': history.deadline,
+        }
+        if history.log_type == WorkflowHistory.TRANSITION:
+            if self.workflow_version_id is not None:
+                updates['workflow_version'] = self.workflow_version_id
+            if not activities.filter(version=self.version).update(version=F('version') + 1, **updates):
+                raise ConcurrentWorkflowChange(
+                    __('The workflow activity was changed by someone else')
+                )
+            self.version += 1
+        elif not activities.filter(state=history.state_id).update(**updates):
+            return
+        self.current_history = history
+        self.state_id = history.state_id
+        self.deadline = history.deadline
+
+    def get_graph(self):
+        """
+        Returns the WorkflowGraph this activity is validated against: the one
+        of the WorkflowVersion it is pinned to or, if it isn't, the live one
+        of its workflow
+        """
+        if self.workflow_version_id:
+            return get_version_graph(self.workflow_version_id)
+        return get_graph(self.workflow_id)
+
+    def get_participants(self):
+        """
+        Returns a dict mapping the user ids to the participants (with their
+        users) of this activity. They are loaded with a single query the first
+        time (or taken from prefetch_related('participants__user')) and reused
+        by every operation on this instance afterwards, enabling and disabling
+        participants included.
+        """
+        participants = self.__dict__.get('_participant_cache')
+        if participants is None:
+            prefetched = getattr(self, '_prefetched_objects_cache', {})
+            if 'participants' in prefetched:
+                items = prefetched['participants']
+            else:
+                items = self.participants.select_related('user')
+            participants = self._participant_cache = dict((p.user_id, p) for p in items)
+        return participants
+
+    def get_participant(self, user, enabled=True):
+        """
+        Returns the participant of the user (which must be enabled unless
+        enabled is False) from get_participants() or raises
+        Participant.DoesNotExist
+        """
+        participant = self.get_participants().get(getattr(user, 'pk', user))
+        if participant is None or (enabled and participant.disabled):
+            raise Participant.DoesNotExist('Participant matching query does not exist.')
+        return participant
 
-    def start(self, user):
+    def clear_participant_cache(self):
+        """
+        Makes the next get_participants() call read the participants again
+        """
+        self.__dict__.pop('_participant_cache', None)
+
+    def available_transitions(self, user):
+        """
+        Returns the list of transitions the user may use to progress this
+        WorkflowActivity from its current state
+        """
+        return WorkflowActivity.objects.available_transitions(user, [self])[self.pk]
+
+    def start(self, user, select_for_update=False):
         """
         Starts a WorkflowActivity by putting it into the start state of the
         workflow defined in the "workflow" field after validating the workflow
         activity is in a state appropriate for "starting"
+
+        Raises ConcurrentWorkflowChange if the activity was started by someone
+        else in the meantime, unless select_for_update is True in which case
+        its row is locked for the duration of the validation.
         """
-        participant = Participant.objects.get(workflowactivity=self, user=user, disabled=False)
-        start_state_result = State.objects.filter(workflow=self.workflow, is_start_state=True)
-        # Validation
-        # 1. The workflow activity isn't already started
-        if self.current_state():
-            if self.current_state().state:
+        participant = self.get_participant(user)
+        version_id = WorkflowActivity.objects.latest_versions([self.workflow_id]).get(self.workflow_id)
+        with self.recording_transition(select_for_update):
+            # Validation
+            # 1. The workflow activity isn't already started
+            if self.state_id is not None:
                 raise UnableToStartWorkflow(__('Already started'))
-        # 2. The workflow activity hasn't been force_stopped before being started
-        if self.completed_on:
-            raise UnableToStartWorkflow(__('Already completed'))
-        # 3. There is exactly one start state
-        if start_state_result.count() != 1:
-            raise UnableToStartWorkflow(__('Cannot find single start state'))
-
-        first_step = WorkflowHistory(
-                workflowactivity=self,
-                state=start_state_result.first(),
-                log_type=WorkflowHistory.TRANSITION,
-                note=__('Started workflow'),
-                participant=participant,
-                deadline=start_state_result.first().deadline()
-            )
-        first_step.save()
+            # 2. The workflow activity hasn't been force_stopped before being started
+            if self.completed_on:
+                raise UnableToStartWorkflow(__('Already completed'))
+            # 3. There is exactly one start state
+            # (of the latest version of the workflow, pinned from now on)
+            self.workflow_version_id = version_id
+            graph = self.get_graph()
+            start_state = graph.start_state
+            if start_state is None:
+                raise UnableToStartWorkflow(__('Cannot find single start state'))
+
+            first_step = WorkflowHistory(
+                    workflowactivity=self,
+                    state=start_state,
+                    log_type=WorkflowHistory.TRANSITION,
+                    note=__('Started workflow'),
+                    participant=participant,
+                    deadline=graph.deadline(start_state.id)
+                )
+            first_step.save()
         return first_step
 
-    def progress(self, transition, user, note=''):
+    def progress(self, transition, user, note='', select_for_update=False):
         """
         Attempts to progress a workflow activity with the specified transition
 
         The transition is validated (to make sure it is a legal "move" in the
         directed graph) and the method returns the new WorkflowHistory state or
         raises an UnableToProgressWorkflow exception.
+
+        The validation is done against the current state in the database and
+        ConcurrentWorkflowChange is raised (and nothing recorded) if another
+        transition is recorded in the meantime. Pass select_for_update=True to
+        lock the row of the activity instead, making concurrent callers wait.
         """
-        participant = Participant.objects.get(workflowactivity=self, user=user, disabled=False)
-        # Validate the transition
-        current_state = self.current_state()
-        # 1. Make sure the workflow activity is started
-        if not current_state:
-            raise UnableToProgressWorkflow(__('Start the workflow before attempting to transition'))
-        # 2. Make sure it's parent is the current state
-        if transition.from_state != current_state.state:
-            raise UnableToProgressWorkflow(__('Transition not valid (wrong parent)'))
-
-        # The "progress" request has been validated to store the transition into
-        # the appropriate WorkflowHistory record and if it is an end state then
-        # update this WorkflowActivity's record with the appropriate timestamp
-        wh = WorkflowHistory(
-                workflowactivity=self,
-                state=transition.to_state,
-                log_type=WorkflowHistory.TRANSITION,
-                transition=transition,
-                note=note if note else transition.name,
-                participant=participant,
-                deadline=transition.to_state.deadline()
-            )
-        wh.save()
-        # If we're at the end then mark the workflow activity as completed on today
-        if transition.to_state.is_end_state:
-            self.completed_on = datetime.datetime.today()
-            self.save()
+        participant = self.get_participant(user)
+        with self.recording_transition(select_for_update):
+            graph = self.get_graph()
+            # Validate the transition
+            # 1. Make sure the workflow activity is started
+            if self.state_id is None:
+                raise UnableToProgressWorkflow(__('Start the workflow before attempting to transition'))
+            # 2. Make sure it's parent is the current state (in the definition
+            # the activity is validated against, not the live one)
+            frozen = graph.transitions.get(transition.id)
+            if frozen is None or frozen.from_state_id != self.state_id:
+                raise UnableToProgressWorkflow(__('Transition not valid (wrong parent)'))
+            to_state = graph.get_state(frozen.to_state_id)
+
+            # The "progress" request has been validated to store the transition into
+            # the appropriate WorkflowHistory record and if it is an end state then
+            # update this WorkflowActivity's record with the appropriate timestamp
+            wh = WorkflowHistory(
+                    workflowactivity=self,
+                    state=to_state,
+                    log_type=WorkflowHistory.TRANSITION,
+                    transition=transition,
+                    note=note if note else transition.name,
+                    participant=participant,
+                    deadline=graph.deadline(to_state.id)
+                )
+            wh.save()
+            # If we're at the end then mark the workflow activity as completed on today
+            if to_state.is_end_state:
+                self.completed_on = datetime.datetime.today()
+                self.save(update_fields=['completed_on'])
         return wh
 
+    def check_not_archived(self, exception):
+        """
+        Raises the given exception if the history of this activity was
+        archived: nothing may be added to it anymore
+        """
+        if self.archived_on:
+            raise exception(__('The workflow activity is archived'))
+
     def add_comment(self, user, note):
         """
         In many sorts of workflow it is necessary to add a comment about
@@ -361,9 +1065,15 @@ class WorkflowActivity(models.Model):
         """
         if not note:
             raise UnableToAddCommentToWorkflow(__('Cannot add an empty comment(note)'))
-        participant, created = Participant.objects.get_or_create(workflowactivity=self, user=user)
-        current_state = self.current_state().state if self.current_state() else None
-        deadline = self.current_state().deadline if current_state else None
+        self.check_not_archived(UnableToAddCommentToWorkflow)
+        try:
+            participant = self.get_participant(user, enabled=False)
+        except Participant.DoesNotExist:
+            participant, created = Participant.objects.get_or_create(workflowactivity=self, user=user)
+            self.get_participants()[participant.user_id] = participant
+        current = self.current_state()
+        current_state = current.state if current else None
+        deadline = current.deadline if current_state else None
         wh = WorkflowHistory(
                 workflowactivity=self,
                 state=current_state,
@@ -390,24 +1100,28 @@ class WorkflowActivity(models.Model):
         if not note:
             raise UnableToDisableParticipant(__('Must supply a reason for disabling'
                                                 ' a participant. None given.'))
+        self.check_not_archived(UnableToDisableParticipant)
         try:
-            p_as_user = Participant.objects.get(workflowactivity=self, user=user, disabled=False)
-            p_to_disable = Participant.objects.get(workflowactivity=self, user=user_to_disable)
+            p_as_user = self.get_participant(user)
+            p_to_disable = self.get_participant(user_to_disable, enabled=False)
             if not p_to_disable.disabled:
                 p_to_disable.disabled = True
-                p_to_disable.save()
+                p_to_disable.save(update_fields=['disabled'])
                 name = user_to_disable.get_full_name()
                 name = name if name else user_to_disable.username
                 note = _('Participant %s disabled with the reason: %s') % (name, note)
-                current_state = self.current_state().state if self.current_state() else None
-                deadline = self.current_state().deadline if self.current_state() else None
+                current = self.current_state()
+                current_state = current.state if current else None
+                deadline = current.deadline if current else None
                 wh = WorkflowHistory(
                         workflowactivity=self,
                         state=current_state,
                         log_type=WorkflowHistory.COMMENT,
                         participant=p_as_user,
                         note=note,
-                        deadline=deadline
+                        deadline=deadline,
+                        subject=p_to_disable,
+                        subject_disabled=True
                     )
                 wh.save()
                 return wh
@@ -427,24 +1141,28 @@ class WorkflowActivity(models.Model):
         if not note:
             raise UnableToEnableParticipant(__('Must supply a reason for enabling '
                                                'a disabled participant. None given.'))
+        self.check_not_archived(UnableToEnableParticipant)
         try:
-            p_as_user = Participant.objects.get(workflowactivity=self, user=user, disabled=False)
-            p_to_enable = Participant.objects.get(workflowactivity=self, user=user_to_enable)
+            p_as_user = self.get_participant(user)
+            p_to_enable = self.get_participant(user_to_enable, enabled=False)
             if p_to_enable.disabled:
                 p_to_enable.disabled = False
-                p_to_enable.save()
+                p_to_enable.save(update_fields=['disabled'])
                 name = user_to_enable.get_full_name()
                 name = name if name else user_to_enable.username
                 note = _('Participant %s enabled with the reason: %s') % (name, note)
-                current_state = self.current_state().state if self.current_state() else None
-                deadline = self.current_state().deadline if self.current_state() else None
+                current = self.current_state()
+                current_state = current.state if current else None
+                deadline = current.deadline if current else None
                 wh = WorkflowHistory(
                         workflowactivity=self,
                         state=current_state,
                         log_type=WorkflowHistory.COMMENT,
                         participant=p_as_user,
                         note=note,
-                        deadline=deadline
+                        deadline=deadline,
+                        subject=p_to_enable,
+                        subject_disabled=False
                     )
                 wh.save()
                 return wh
@@ -455,28 +1173,31 @@ class WorkflowActivity(models.Model):
             # If we can't find the participant then there is nothing to do
             return None
 
-    def force_stop(self, user, reason):
+    def force_stop(self, user, reason, select_for_update=False):
         """
         Should a WorkflowActivity need to be abandoned this method cleanly logs
         the event and puts the WorkflowActivity in the appropriate state (with
         reason provided by participant).
+
+        Raises ConcurrentWorkflowChange if the activity is progressed by
+        someone else in the meantime (see progress).
         """
-        # Lets try to create an appropriate entry in the WorkflowHistory table
-        current_state = self.current_state()
-        participant = Participant.objects.get(workflowactivity=self, user=user, disabled=False)
-        if current_state:
-            final_step = WorkflowHistory(
-                    workflowactivity=self,
-                    state=current_state.state,
-                    log_type=WorkflowHistory.TRANSITION,
-                    note=__('Workflow forced to stop! Reason given: %s') % reason,
-                    participant=participant,
-                    deadline=None
-                )
-            final_step.save()
+        participant = self.get_participant(user)
+        with self.recording_transition(select_for_update):
+            # Lets try to create an appropriate entry in the WorkflowHistory table
+            if self.current_history_id is not None:
+                final_step = WorkflowHistory(
+                        workflowactivity=self,
+                        state_id=self.state_id,
+                        log_type=WorkflowHistory.TRANSITION,
+                        note=__('Workflow forced to stop! Reason given: %s') % reason,
+                        participant=participant,
+                        deadline=None
+                    )
+                final_step.save()
 
-        self.completed_on = datetime.datetime.today()
-        self.save()
+            self.completed_on = datetime.datetime.today()
+            self.save(update_fields=['completed_on'])
 
 
 class Participant(models.Model):
@@ -486,11 +1207,14 @@ class Participant(models.Model):
     user = models.ForeignKey(User)
     workflowactivity = models.ForeignKey(WorkflowActivity, related_name='participants')
     disabled = models.BooleanField(default=False)
+    created_on = models.DateTimeField(auto_now_add=True, null=True)
 
     class Meta:
         ordering = ['-disabled', 'workflowactivity', 'user']
         verbose_name = _('Participant')
         verbose_name_plural = _('Participants')
+        # Also the index finding the participant of a user in one or many
+        # activities
         unique_together = ('user', 'workflowactivity')
 
     def __unicode__(self):
@@ -534,33 +1258,157 @@ class WorkflowHistory(models.Model):
             Participant,
             help_text=_('The participant who triggered this happening in the workflow history')
         )
-    created_on = models.DateTimeField(auto_now_add=True)
+    # Indexed for the date hierarchy of the admin and the exports by date
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True)
     deadline = models.DateTimeField(
             _('Deadline'), blank=True, null=True,
             help_text=_('The deadline for staying in this state')
         )
+    # The participant disabled or enabled by this comment and the disabled
+    # flag it was given (see WorkflowActivity.disable_participant) so that
+    # the participants can be replayed by workflow.snapshots
+    subject = models.ForeignKey(
+            Participant, null=True, blank=True, editable=False,
+            related_name='+', on_delete=models.SET_NULL
+        )
+    subject_disabled = models.NullBooleanField(editable=False)
 
     class Meta:
         ordering = ['-created_on']
         verbose_name = _('Workflow History')
         verbose_name_plural = _('Workflow Histories')
+        # Reading the (latest) history of an activity
+        index_together = [('workflowactivity', 'created_on')]
 
     def __unicode__(self):
-        return '%s created by %s' % (self.note, self.created_by.get_full_name())        
+        return '%s created by %s' % (self.note, self.participant)
 
     def save(self, *args, **kwargs):
-        workflow_pre_change.send(sender=self)
-        super(WorkflowHistory, self).save(*args, **kwargs)
-        workflow_post_change.send(sender=self)
+        adding = self.pk is None
+        if dispatch.has_receivers(workflow_pre_change):
+            workflow_pre_change.send(sender=self)
+        with transaction.atomic():
+            super(WorkflowHistory, self).save(*args, **kwargs)
+            if adding:
+                self.workflowactivity.set_current_history(self)
+        dispatch.send(self.post_save_signals(), using=kwargs.get('using'))
+
+    def post_save_signals(self):
+        """
+        Returns the (signal, sender, kwargs) tuples to send once this item has
+        been saved. The state (and the workflow activity) is only looked at if
+        someone listens to workflow_started or workflow_ended.
+        """
+        signals = [(workflow_post_change, self, {})]
         if self.log_type == self.TRANSITION:
-            workflow_transitioned.send(sender=self)
+            signals.append((workflow_transitioned, self, {}))
         elif self.log_type == self.COMMENT:
-            workflow_commented.send(sender=self)
-        if self.state:
+            signals.append((workflow_commented, self, {}))
+        if self.state_id and (dispatch.has_receivers(workflow_started) or
+                              dispatch.has_receivers(workflow_ended)):
             if self.state.is_start_state:
-                workflow_started.send(sender=self.workflowactivity)
+                signals.append((workflow_started, self.workflowactivity, {}))
             elif self.state.is_end_state:
-                workflow_ended.send(sender=self.workflowactivity)
+                signals.append((workflow_ended, self.workflowactivity, {}))
+        return signals
+
+
+class ArchivedParticipant(models.Model):
+    """
+    A Participant of a completed WorkflowActivity moved out of the Participant
+    table by workflow.archive (keeping its id)
+    """
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='+')
+    workflowactivity = models.ForeignKey(WorkflowActivity, related_name='archived_participants')
+    disabled = models.BooleanField(default=False)
+    created_on = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['-disabled', 'workflowactivity', 'user']
+        verbose_name = _('Archived participant')
+        verbose_name_plural = _('Archived participants')
+
+    def __unicode__(self):
+        name = self.user.get_full_name()
+        name = name if name else self.user.username
+        disabled = _(' (disabled)') if self.disabled else ''
+        return '%s%s' % (name, disabled)
+
+
+class ArchivedWorkflowHistory(models.Model):
+    """
+    A WorkflowHistory item of a completed WorkflowActivity moved out of the
+    WorkflowHistory table by workflow.archive (keeping its id)
+    """
+    id = models.IntegerField(primary_key=True)
+    workflowactivity = models.ForeignKey(WorkflowActivity, related_name='archived_history')
+    log_type = models.IntegerField(choices=WorkflowHistory.LOG_TYPE_CHOICE)
+    state = models.ForeignKey(State, null=True, related_name='+', on_delete=models.SET_NULL)
+    transition = models.ForeignKey(
+            Transition, null=True, related_name='+', on_delete=models.SET_NULL
+        )
+    note = models.TextField(_('Note'), blank=True, default='')
+    participant = models.ForeignKey(ArchivedParticipant)
+    created_on = models.DateTimeField()
+    deadline = models.DateTimeField(_('Deadline'), blank=True, null=True)
+    subject = models.ForeignKey(
+            ArchivedParticipant, null=True, related_name='+', on_delete=models.SET_NULL
+        )
+    subject_disabled = models.NullBooleanField()
+
+    TRANSITION = WorkflowHistory.TRANSITION
+    COMMENT = WorkflowHistory.COMMENT
+
+    class Meta:
+        ordering = ['-created_on']
+        verbose_name = _('Archived workflow history')
+        verbose_name_plural = _('Archived workflow histories')
+        index_together = [('workflowactivity', 'created_on')]
+
+    def __unicode__(self):
+        return self.note
+
+
+class WorkflowSnapshot(models.Model):
+    """
+    The state and participants of a WorkflowActivity once all its history up
+    to (and including) the last_history item happened. workflow.snapshots
+    answers point-in-time queries from the nearest snapshot by replaying
+    only the later history.
+    """
+    workflowactivity = models.ForeignKey(WorkflowActivity, related_name='snapshots')
+    taken_on = models.DateTimeField()
+    last_history = models.IntegerField(
+            null=True, help_text=_('The id of the latest WorkflowHistory item included')
+        )
+    state = models.ForeignKey(State, null=True, related_name='+', on_delete=models.SET_NULL)
+    # JSON object mapping the participant ids to their [user id, disabled]
+    participants = models.TextField(default='{}')
+
+    class Meta:
+        ordering = ['-taken_on']
+        verbose_name = _('Workflow snapshot')
+        verbose_name_plural = _('Workflow snapshots')
+        # Finding the latest snapshot of an activity before a date
+        index_together = [('workflowactivity', 'taken_on')]
+
+    def __unicode__(self):
+        return '%s on %s' % (self.workflowactivity_id, self.taken_on)
+
+    def get_participants(self):
+        """
+        Returns a dict mapping the participant ids to (user id, disabled)
+        """
+        return dict(
+            (int(pk), (user_id, disabled))
+            for pk, (user_id, disabled) in json.loads(self.participants).items()
+        )
+
+    def set_participants(self, participants):
+        self.participants = json.dumps(dict(
+            (str(pk), [user_id, disabled]) for pk, (user_id, disabled) in participants.items()
+        ), sort_keys=True)
 
 
 class WorkflowObjectRelation(models.Model):
@@ -589,6 +1437,14 @@ class WorkflowObjectRelation(models.Model):
     def __unicode__(self):
         return '%s %s - %s' % (self.content_type, self.content_id, self.workflow.name)
 
+    @classmethod
+    def get_workflow(cls, obj):
+        """
+        Returns the workflow assigned to the object, falling back to the one
+        assigned to its model, or None
+        """
+        return resolver.get_workflow(obj)
+
 
 class WorkflowModelRelation(models.Model):
     """Stores an workflow for a model (ContentType).
@@ -608,15 +1464,86 @@ class WorkflowModelRelation(models.Model):
     class Meta:
         verbose_name = _('Workflow model relation')
         verbose_name_plural = _('Workflow model relations')    
+        # Finding the workflow of a model
+        index_together = [('content_type', 'workflow')]
 
     def __unicode__(self):
         return '%s - %s' % (self.content_type.name, self.workflow.name)
 
     @classmethod
     def get_workflow(cls, model):
-        content_type = ContentType.objects.filter(model=model._meta.model_name).first()
-        if not content_type:
-            return None
-        self = cls.objects.filter(content_type=content_type).first()
-        if self:
-            return self.workflow
+        """
+        Returns the workflow assigned to the model (class or instance) or None.
+        The result is cached per process (see workflow.resolver).
+        """
+        return resolver.get_model_workflow(model)
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=Transition)
+@receiver(post_delete, sender=Transition)
+def invalidate_workflow_definition(sender, instance, **kwargs):
+    """
+    Makes sure no stale WorkflowGraph or PermissionIndex is served once a state
+    or transition of the workflow has changed
+    """
+    graph_cache.invalidate(instance.workflow_id)
+    permission_cache.invalidate(instance.workflow_id)
+
+
+@receiver(m2m_changed, sender=State.users.through)
+@receiver(m2m_changed, sender=State.groups.through)
+@receiver(m2m_changed, sender=Transition.users.through)
+@receiver(m2m_changed, sender=Transition.groups.through)
+def invalidate_workflow_permissions(sender, instance, action, reverse, **kwargs):
+    """
+    Refreshes the PermissionIndex of a workflow when the users or groups of
+    one of its states or transitions change
+    """
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # The change was made from the user / group side so we can't tell
+        # which workflows are affected without a query
+        permission_cache.clear()
+    else:
+        permission_cache.invalidate(instance.workflow_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Forgets the cached group membership of users whose groups changed
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_groups.invalidate(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            user_groups.invalidate(user_id)
+    else:
+        user_groups.clear()
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_deleted_group(sender, instance, **kwargs):
+    """
+    Deleting a group removes its memberships and permissions without sending
+    m2m_changed so everything that might reference it is forgotten
+    """
+    user_groups.clear()
+    permission_cache.clear()
+
+
+@receiver(post_save, sender=WorkflowModelRelation)
+@receiver(post_delete, sender=WorkflowModelRelation)
+@receiver(post_save, sender=Workflow)
+@receiver(post_delete, sender=Workflow)
+def invalidate_model_workflows(sender, **kwargs):
+    """
+    Forgets the cached workflow of every model when the relations between
+    models and workflows (or a workflow) change
+    """
+    resolver.model_workflows.clear()
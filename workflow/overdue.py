@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Finds the WorkflowActivity instances that stayed in their current state for
+longer than its estimation allowed.
+
+The deadline of the latest WorkflowHistory item is denormalized onto the
+(indexed) WorkflowActivity.deadline field so a scan only ever looks at the
+current state of every activity. Activities are read in chunks with keyset
+pagination on (deadline, id) so memory usage doesn't depend on the number of
+overdue activities.
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db.models import Q
+
+from workflow.models import WorkflowActivity
+from workflow.signals import workflow_overdue
+
+
+def iter_overdue(now=None, workflow=None, chunk_size=1000):
+    """
+    Yields lists of at most chunk_size uncompleted WorkflowActivity instances
+    whose deadline is before now (defaults to datetime.today()), ordered by
+    deadline. Can be limited to the activities of a single workflow.
+    """
+    if now is None:
+        now = datetime.datetime.today()
+    queryset = WorkflowActivity.objects.filter(
+        completed_on__isnull=True, deadline__lt=now
+    ).order_by('deadline', 'pk')
+    if workflow is not None:
+        queryset = queryset.filter(workflow=workflow)
+
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(
+                Q(deadline__gt=last.deadline) | Q(deadline=last.deadline, pk__gt=last.pk)
+            )
+        activities = list(chunk[:chunk_size].iterator())
+        if not activities:
+            return
+        yield activities
+        if len(activities) < chunk_size:
+            return
+        last = activities[-1]
+
+
+def scan_overdue(now=None, workflow=None, chunk_size=1000):
+    """
+    Sends the workflow_overdue signal for every chunk of overdue activities
+    and returns the number of overdue activities found.
+    """
+    count = 0
+    for activities in iter_overdue(now=now, workflow=workflow, chunk_size=chunk_size):
+        workflow_overdue.send(sender=WorkflowActivity, activities=activities)
+        count += len(activities)
+    return count
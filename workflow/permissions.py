@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed permission tables for the states and transitions of a workflow.
+
+Transition.has_perm_use() and State.has_perm_view() are answered from a
+PermissionIndex compiled per workflow (see workflow.graph.DefinitionCache) and
+from a per-process cache of the groups of every user. Both are invalidated by
+the m2m_changed receivers connected in workflow.models.
+
+The receivers only run in the process making the change and not at all for
+queryset.update(), raw SQL or bulk_create of the through rows, so both caches
+also expire after WORKFLOW_CACHE_TTL seconds (see workflow.graph): a
+permission taken away in another process is honoured within that delay. Set
+it to 0 to check the permissions against the database every time.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.apps import apps
+
+from workflow.graph import DefinitionCache, cache_ttl
+
+
+def _index(pairs):
+    index = {}
+    for key, value in pairs:
+        index.setdefault(key, set()).add(value)
+    return dict((key, frozenset(values)) for key, values in index.items())
+
+
+class PermissionIndex(object):
+    """
+    Maps user ids and group ids to the ids of the transitions they may use and
+    the ids of the states they may view in a particular workflow.
+    """
+
+    def __init__(self, workflow_id, transition_users, transition_groups,
+                 state_users, state_groups):
+        self.workflow_id = workflow_id
+        self.transition_users = _index(transition_users)
+        self.transition_groups = _index(transition_groups)
+        self.state_users = _index(state_users)
+        self.state_groups = _index(state_groups)
+
+    @classmethod
+    def compile(cls, workflow):
+        """
+        Builds the permission index of the given workflow (or workflow id)
+        with exactly four queries.
+        """
+        workflow_id = getattr(workflow, 'pk', workflow)
+        State = apps.get_model('workflow', 'State')
+        Transition = apps.get_model('workflow', 'Transition')
+        return cls(
+            workflow_id,
+            Transition.users.through.objects.filter(
+                transition__workflow=workflow_id).values_list('user', 'transition'),
+            Transition.groups.through.objects.filter(
+                transition__workflow=workflow_id).values_list('group', 'transition'),
+            State.users.through.objects.filter(
+                state__workflow=workflow_id).values_list('user', 'state'),
+            State.groups.through.objects.filter(
+                state__workflow=workflow_id).values_list('group', 'state'),
+        )
+
+    def _resolve(self, user, by_user, by_group):
+        if user is None or user.pk is None:
+            return frozenset()
+        allowed = set(by_user.get(user.pk, ()))
+        for group_id in user_groups.get(user):
+            allowed.update(by_group.get(group_id, ()))
+        return allowed
+
+    def usable_transitions(self, user):
+        """
+        Returns the set of ids of the transitions the user may use
+        """
+        return self._resolve(user, self.transition_users, self.transition_groups)
+
+    def viewable_states(self, user):
+        """
+        Returns the set of ids of the states the user may view
+        """
+        return self._resolve(user, self.state_users, self.state_groups)
+
+    def can_use(self, user, transition):
+        return getattr(transition, 'pk', transition) in self.usable_transitions(user)
+
+    def can_view(self, user, state):
+        return getattr(state, 'pk', state) in self.viewable_states(user)
+
+
+class UserGroupCache(object):
+    """
+    A thread safe, per-process cache of the group ids of users, kept for
+    WORKFLOW_CACHE_TTL seconds
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._generation = 0
+
+    def get(self, user):
+        user_id = getattr(user, 'pk', user)
+        now = time.time()
+        item = self._groups.get(user_id)
+        if item is not None and (item[1] is None or item[1] > now):
+            return item[0]
+        generation = self._generation
+        User = apps.get_model('auth', 'User')
+        groups = frozenset(User.groups.through.objects.filter(
+            user=user_id).values_list('group', flat=True))
+        ttl = cache_ttl()
+        if ttl != 0:
+            with self._lock:
+                # Only store it if nothing changed while we were querying
+                if generation == self._generation:
+                    self._groups[user_id] = (groups, now + ttl if ttl is not None else None)
+        return groups
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._groups.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._groups.clear()
+
+
+permission_cache = DefinitionCache(PermissionIndex.compile)
+user_groups = UserGroupCache()
+
+
+def get_permission_index(workflow):
+    """
+    Returns the (cached) PermissionIndex for the given workflow or workflow id
+    """
+    return permission_cache.get(workflow)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Resolves the workflow assigned to a model (WorkflowModelRelation) or to a
+single object (WorkflowObjectRelation, falling back to the workflow of its
+model).
+
+prefetch_workflows() does the same for a whole list of objects with one
+query per content type.
+
+Content types come from ContentType.objects.get_for_model() (and so from its
+own cache) and the workflow of every model is cached per process. The cache
+is cleared whenever a WorkflowModelRelation or a Workflow is saved or deleted
+(see the receivers at the bottom of workflow.models).
+"""
+from __future__ import unicode_literals
+
+import copy
+import threading
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+
+MISSING = object()
+
+
+class ModelWorkflowCache(object):
+    """
+    A thread safe, per-process cache of the workflow of models keyed by
+    content type id
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workflows = {}
+        self._generation = 0
+
+    def get(self, content_type_id):
+        workflow = self._workflows.get(content_type_id, MISSING)
+        if workflow is MISSING:
+            generation = self._generation
+            WorkflowModelRelation = apps.get_model('workflow', 'WorkflowModelRelation')
+            relation = (WorkflowModelRelation.objects.filter(content_type=content_type_id)
+                        .select_related('workflow').order_by('pk').first())
+            workflow = relation.workflow if relation else None
+            with self._lock:
+                # Only store it if nothing changed while we were querying
+                if generation == self._generation:
+                    self._workflows[content_type_id] = workflow
+        # Callers get their own instance to modify
+        return copy.copy(workflow)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._workflows.clear()
+
+
+model_workflows = ModelWorkflowCache()
+
+
+def get_model_workflow(model):
+    """
+    Returns the (cached) workflow assigned to the model (class or instance)
+    with a WorkflowModelRelation or None
+    """
+    return model_workflows.get(ContentType.objects.get_for_model(model).pk)
+
+
+def get_workflow(obj):
+    """
+    Returns the workflow assigned to the object with a WorkflowObjectRelation,
+    or else the one assigned to its model, or None. Classes are resolved with
+    get_model_workflow().
+    """
+    if isinstance(obj, type) or obj.pk is None:
+        return get_model_workflow(obj)
+    content_type = ContentType.objects.get_for_model(obj)
+    WorkflowObjectRelation = apps.get_model('workflow', 'WorkflowObjectRelation')
+    relation = (WorkflowObjectRelation.objects.filter(content_type=content_type, content_id=obj.pk)
+                .select_related('workflow').first())
+    if relation is not None:
+        return relation.workflow
+    return model_workflows.get(content_type.pk)
+
+
+def prefetch_workflows(objects, attname='workflow', batch_size=500):
+    """
+    Resolves the workflow of every object of a queryset or list (as
+    get_workflow() does) and stores it as the attname attribute of the
+    object. The WorkflowObjectRelation of the objects are read with one query
+    per content type (and batch of batch_size objects); the objects without
+    one share the cached workflow of their model.
+
+    Returns the list of objects.
+    """
+    objects = list(objects)
+    WorkflowObjectRelation = apps.get_model('workflow', 'WorkflowObjectRelation')
+    by_model = {}
+    for obj in objects:
+        by_model.setdefault(obj.__class__, []).append(obj)
+    by_content_type = {}
+    for model, instances in by_model.items():
+        content_type = ContentType.objects.get_for_model(model)
+        by_content_type.setdefault(content_type.pk, []).extend(instances)
+
+    for content_type_id, instances in by_content_type.items():
+        workflows = {}
+        ids = list(set(obj.pk for obj in instances))
+        for i in range(0, len(ids), batch_size):
+            for relation in WorkflowObjectRelation.objects.filter(
+                    content_type=content_type_id, content_id__in=ids[i:i + batch_size]
+                    ).select_related('workflow'):
+                workflows[relation.content_id] = relation.workflow
+        fallback = MISSING
+        for obj in instances:
+            workflow = workflows.get(obj.pk)
+            if workflow is None:
+                if fallback is MISSING:
+                    fallback = model_workflows.get(content_type_id)
+                workflow = fallback
+            setattr(obj, attname, workflow)
+    return objects
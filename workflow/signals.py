@@ -1,27 +1,81 @@
 # -*- coding: utf-8 -*-
+from timeit import default_timer
+
 import django.dispatch
 
+from workflow.instrumentation import signal_stats
+
+
+class WorkflowSignal(django.dispatch.Signal):
+    """
+    A named signal that times its receivers when the instrumentation in
+    workflow.instrumentation is enabled
+    """
+
+    def __init__(self, name, **kwargs):
+        super(WorkflowSignal, self).__init__(**kwargs)
+        self.name = name
+
+    def send(self, sender, **named):
+        if not signal_stats.is_enabled() or not self.receivers:
+            return super(WorkflowSignal, self).send(sender, **named)
+
+        responses = []
+        started = default_timer()
+        try:
+            for receiver in self._live_receivers(sender):
+                receiver_started = default_timer()
+                try:
+                    response = receiver(signal=self, sender=sender, **named)
+                finally:
+                    signal_stats.record_receiver(
+                        self.name, receiver, default_timer() - receiver_started
+                    )
+                responses.append((receiver, response))
+        finally:
+            signal_stats.record_send(self.name, default_timer() - started)
+        return responses
+
 
 # Fired when a new WorkflowActivity starts navigating a workflow. The sender is
 # an instance of the WorkflowActivity model
-workflow_started = django.dispatch.Signal()
+workflow_started = WorkflowSignal('workflow_started')
 
 # Fired just before a WorkflowActivity creates a new item in the Workflow History
 # (the sender is an instance of the WorkflowHistory model)
-workflow_pre_change = django.dispatch.Signal()
+workflow_pre_change = WorkflowSignal('workflow_pre_change')
 
 # Fired after a WorkflowActivity creates a new item in the Workflow History (the
 # sender is an instance of the WorkflowHistory model)
-workflow_post_change = django.dispatch.Signal()
+workflow_post_change = WorkflowSignal('workflow_post_change')
 
 # Fired when a WorkflowActivity causes a transition to a new state (the sender is
 # an instance of the WorkflowHistory model)
-workflow_transitioned = django.dispatch.Signal()
+workflow_transitioned = WorkflowSignal('workflow_transitioned')
 
 # Fired when a comment is created during the lift of a WorkflowActivity (the
 # sender is an instance of the WorkflowHistory model)
-workflow_commented = django.dispatch.Signal()
+workflow_commented = WorkflowSignal('workflow_commented')
 
 # Fired when an active WorkflowActivity reaches a workflow's end state. The
 # sender is an instance of the WorkflowActivity model
-workflow_ended = django.dispatch.Signal()
+workflow_ended = WorkflowSignal('workflow_ended')
+
+# Fired once for every batch of WorkflowActivity instances started together by
+# WorkflowActivity.objects.bulk_start(). The sender is the WorkflowActivity model
+# and the "activities" and "history" arguments hold the started activities and
+# the WorkflowHistory items created for them
+workflow_bulk_started = WorkflowSignal('workflow_bulk_started')
+
+# Fired once after WorkflowActivity.objects.bulk_progress() moved a number of
+# WorkflowActivity instances through the same transition. The sender is the
+# WorkflowActivity model and the "activities", "history" and "transition"
+# arguments hold the progressed activities, the WorkflowHistory items created
+# for them and the Transition used
+workflow_bulk_progressed = WorkflowSignal('workflow_bulk_progressed')
+
+# Fired by workflow.overdue.scan_overdue() for every batch of uncompleted
+# WorkflowActivity instances whose deadline for the current state has passed.
+# The sender is the WorkflowActivity model and the "activities" argument holds
+# the overdue activities of the batch
+workflow_overdue = WorkflowSignal('workflow_overdue')
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Point-in-time reconstruction of the state and participants of
+WorkflowActivity instances.
+
+take_snapshots() (run periodically with the snapshot_workflow_activities
+command) records a WorkflowSnapshot of every activity with new history.
+state_as_of() and states_as_of() answer "what state was the activity in on
+date D and who were its active participants" from the latest snapshot taken
+before D, replaying only the WorkflowHistory items recorded after it:
+
+* transitions move the activity to their state,
+* comments made by disable_participant / enable_participant set the disabled
+  flag of their subject,
+* participants created after the snapshot join, enabled.
+
+The history and participants of archived activities (see workflow.archive)
+are replayed from the ArchivedWorkflowHistory and ArchivedParticipant tables
+they were moved to, with the same ids.
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from workflow.models import (
+    WorkflowActivity, WorkflowHistory, WorkflowSnapshot, Participant, ArchivedWorkflowHistory,
+    ArchivedParticipant
+)
+
+
+class PointInTime(object):
+    """
+    The state of a WorkflowActivity at a point in time
+    """
+
+    def __init__(self, activity_id, when, state_id, participants, completed):
+        self.activity_id = activity_id
+        self.when = when
+        self.state_id = state_id
+        # Maps the participant ids to (user id, disabled)
+        self.participants = participants
+        self.completed = completed
+
+    def __repr__(self):
+        return '<PointInTime %s on %s: state %s>' % (self.activity_id, self.when, self.state_id)
+
+    @property
+    def active_user_ids(self):
+        """
+        The ids of the users of the enabled participants
+        """
+        return sorted(user_id for user_id, disabled in self.participants.values() if not disabled)
+
+
+def _batches(ids, batch_size):
+    for i in range(0, len(ids), batch_size):
+        yield ids[i:i + batch_size]
+
+
+def take_snapshots(activities=None, batch_size=500):
+    """
+    Records a WorkflowSnapshot of every given activity (a queryset, defaults
+    to all of them) with history newer than its latest snapshot, batch_size
+    activities per transaction. Returns the number of snapshots taken.
+    """
+    if activities is None:
+        activities = WorkflowActivity.objects.all()
+    ids = list(activities.filter(archived_on__isnull=True).order_by('pk').values_list('pk', flat=True))
+    taken = 0
+    for batch in _batches(ids, batch_size):
+        with transaction.atomic():
+            latest = dict(WorkflowHistory.objects.filter(workflowactivity__in=batch)
+                          .order_by().values_list('workflowactivity').annotate(Max('id')))
+            snapshotted = dict(WorkflowSnapshot.objects.filter(workflowactivity__in=batch)
+                               .order_by().values_list('workflowactivity').annotate(Max('last_history')))
+            changed = [pk for pk in batch if pk in latest and latest[pk] != snapshotted.get(pk)]
+            if not changed:
+                continue
+            participants = dict((pk, {}) for pk in changed)
+            for activity_id, pk, user_id, disabled in Participant.objects.filter(
+                    workflowactivity__in=changed).values_list('workflowactivity', 'pk', 'user', 'disabled'):
+                participants[activity_id][pk] = (user_id, disabled)
+            now = datetime.datetime.today()
+            snapshots = []
+            for activity_id, state_id in WorkflowActivity.objects.filter(
+                    pk__in=changed).values_list('pk', 'state'):
+                snapshot = WorkflowSnapshot(
+                    workflowactivity_id=activity_id, taken_on=now,
+                    last_history=latest[activity_id], state_id=state_id
+                )
+                snapshot.set_participants(participants[activity_id])
+                snapshots.append(snapshot)
+            WorkflowSnapshot.objects.bulk_create(snapshots)
+            taken += len(snapshots)
+    return taken
+
+
+def states_as_of(activities, when, batch_size=500):
+    """
+    Returns a dict mapping the id of every given activity (a queryset or an
+    iterable of WorkflowActivity instances or ids) to its PointInTime on the
+    given date. Activities created after that date are left out.
+
+    Every batch of activities takes a fixed number of queries whatever their
+    history: five, one more if it mixes activities with and without a
+    snapshot and up to three more for archived activities. Only the history
+    recorded after the snapshot of an activity is read.
+    """
+    if hasattr(activities, 'values_list'):
+        ids = list(activities.values_list('pk', flat=True))
+    else:
+        ids = [getattr(activity, 'pk', activity) for activity in activities]
+    result = {}
+    for batch in _batches(ids, batch_size):
+        result.update(_states_as_of(batch, when))
+    return result
+
+
+def _history(model, ids, when, snapshots):
+    """
+    The history items of the given activities recorded until when, only
+    those after their snapshot for the activities in the snapshots dict
+    """
+    queryset = model.objects.filter(created_on__lte=when).order_by('id')
+    fields = ('workflowactivity', 'id', 'log_type', 'state', 'subject', 'subject_disabled')
+    bounded = [snapshots[pk].pk for pk in ids if pk in snapshots and snapshots[pk].last_history]
+    unbounded = [pk for pk in ids if pk not in snapshots or not snapshots[pk].last_history]
+    rows = []
+    if bounded:
+        # Every activity joined to its own snapshot, bounded by its last item
+        rows.extend(queryset.filter(
+            workflowactivity__snapshots__in=bounded,
+            id__gt=F('workflowactivity__snapshots__last_history')
+        ).values_list(*fields))
+    if unbounded:
+        rows.extend(queryset.filter(workflowactivity__in=unbounded).values_list(*fields))
+    return rows
+
+
+def _states_as_of(ids, when):
+    completed = {}
+    archived = []
+    for pk, completed_on, archived_on in WorkflowActivity.objects.filter(
+            pk__in=ids, created_on__lte=when).values_list('pk', 'completed_on', 'archived_on'):
+        completed[pk] = completed_on
+        if archived_on is not None:
+            archived.append(pk)
+    ids = list(completed)
+
+    # The latest snapshot of every activity taken before the date
+    snapshots = {}
+    latest = (WorkflowSnapshot.objects.filter(workflowactivity__in=ids, taken_on__lte=when)
+              .order_by().values('workflowactivity').annotate(latest=Max('id')))
+    for snapshot in WorkflowSnapshot.objects.filter(pk__in=[item['latest'] for item in latest]):
+        snapshots[snapshot.workflowactivity_id] = snapshot
+
+    states = {}
+    participants = {}
+    replayed = {}
+    for pk in ids:
+        snapshot = snapshots.get(pk)
+        states[pk] = snapshot.state_id if snapshot else None
+        participants[pk] = snapshot.get_participants() if snapshot else {}
+        replayed[pk] = (snapshot.last_history or 0) if snapshot else 0
+
+    # Participants that joined after the snapshot (or before any)
+    joined = [(Participant, ids)]
+    if archived:
+        joined.append((ArchivedParticipant, archived))
+    for model, model_ids in joined:
+        for activity_id, pk, user_id, created_on in model.objects.filter(
+                Q(created_on__lte=when) | Q(created_on__isnull=True), workflowactivity__in=model_ids
+                ).order_by().values_list('workflowactivity', 'pk', 'user', 'created_on'):
+            if pk not in participants[activity_id]:
+                participants[activity_id][pk] = (user_id, False)
+
+    # The history since the snapshot (archived items keep their ids)
+    history = _history(WorkflowHistory, ids, when, snapshots)
+    if archived:
+        history.extend(_history(ArchivedWorkflowHistory, archived, when, snapshots))
+    history.sort(key=lambda row: row[1])
+    for activity_id, pk, log_type, state_id, subject_id, subject_disabled in history:
+        if pk <= replayed[activity_id]:
+            continue
+        if log_type == WorkflowHistory.TRANSITION:
+            states[activity_id] = state_id
+        elif subject_id is not None and subject_id in participants[activity_id]:
+            user_id = participants[activity_id][subject_id][0]
+            participants[activity_id][subject_id] = (user_id, bool(subject_disabled))
+
+    return dict(
+        (pk, PointInTime(
+            pk, when, states[pk], participants[pk],
+            completed[pk] is not None and completed[pk] <= when
+        )) for pk in ids
+    )
+
+
+def state_as_of(activity, when):
+    """
+    Returns the PointInTime of the activity (or activity id) on the given
+    date or None if it didn't exist yet
+    """
+    activity_id = getattr(activity, 'pk', activity)
+    return states_as_of([activity_id], when).get(activity_id)
+
+
+def workflow_states_as_of(workflow, when, batch_size=500):
+    """
+    Returns the PointInTime of every activity of the workflow (or workflow
+    id) on the given date, keyed by activity id
+    """
+    return states_as_of(WorkflowActivity.objects.filter(workflow=workflow), when, batch_size)
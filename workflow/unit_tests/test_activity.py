@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for WorkflowActivity
+"""
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from workflow.exceptions import UnableToStartWorkflow
+from workflow.graph import graph_cache
+from workflow.models import Transition, WorkflowActivity, WorkflowHistory, Participant
+from workflow.signals import workflow_bulk_started
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class ActivityTestCase(TestCase):
+    """
+    Testing WorkflowActivity
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='activity_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+
+    def test_current_history_pointer(self):
+        """
+        Makes sure the denormalized current state follows every history item
+        """
+        wa = create_activity(self.workflow, self.user)
+        self.assertEqual(None, wa.current_state())
+        wh = wa.start(self.user)
+        wa = WorkflowActivity.objects.get(pk=wa.pk)
+        self.assertEqual(wh.pk, wa.current_history_id)
+        self.assertEqual(wh.state_id, wa.state_id)
+        self.assertEqual(wh.deadline, wa.deadline)
+
+        wh = wa.add_comment(self.user, 'a comment')
+        self.assertEqual(wh, wa.current_state())
+        wh = wa.progress(self.transitions[0], self.user)
+        wa = WorkflowActivity.objects.get(pk=wa.pk)
+        self.assertEqual(self.transitions[0].to_state_id, wa.state_id)
+        # A single query regardless of the length of the history
+        with self.assertNumQueries(1):
+            self.assertEqual(wh, wa.current_state())
+            self.assertEqual(self.transitions[0].to_state_id, wa.current_state().state.id)
+
+    def test_backfill_workflow_state(self):
+        """
+        Makes sure the backfill command points activities at their latest
+        history item
+        """
+        wa = create_activity(self.workflow, self.user)
+        wa.start(self.user)
+        wh = wa.progress(self.transitions[0], self.user)
+        WorkflowActivity.objects.update(current_history=None, state=None, deadline=None)
+
+        call_command('backfill_workflow_state', stdout=StringIO())
+        wa = WorkflowActivity.objects.get(pk=wa.pk)
+        self.assertEqual(wh.pk, wa.current_history_id)
+        self.assertEqual(wh.state_id, wa.state_id)
+        self.assertEqual(wh.deadline, wa.deadline)
+
+    def test_backfill_migration(self):
+        """
+        Makes sure the upgrade backfills the activities started before the
+        denormalized fields so that they can't be started again
+        """
+        wa = create_activity(self.workflow, self.user)
+        wh = wa.start(self.user)
+        WorkflowActivity.objects.update(current_history=None, state=None, deadline=None)
+        migration = import_module('workflow.migrations.0003_backfill_workflow_state')
+        migration.backfill_workflow_state(apps, connection.schema_editor())
+        wa = WorkflowActivity.objects.get(pk=wa.pk)
+        self.assertEqual(wh.pk, wa.current_history_id)
+        self.assertEqual(wh.state_id, wa.state_id)
+        self.assertRaises(UnableToStartWorkflow, wa.start, self.user)
+
+    def test_bulk_start(self):
+        """
+        Makes sure many activities can be started with a constant number of
+        queries
+        """
+        received = []
+
+        def on_bulk_started(sender, activities, history, **kwargs):
+            received.append(len(history))
+        workflow_bulk_started.connect(on_bulk_started)
+        self.addCleanup(workflow_bulk_started.disconnect, on_bulk_started)
+
+        self.workflow.get_graph()
+        query_counts = []
+        for size in (5, 20):
+            activities = [
+                WorkflowActivity.objects.create(workflow=self.workflow, created_by=self.user)
+                for i in range(size)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                history = WorkflowActivity.objects.bulk_start(activities, self.user)
+            query_counts.append(len(context.captured_queries))
+            self.assertEqual(size, len(history))
+            for activity in WorkflowActivity.objects.filter(pk__in=[a.pk for a in activities]):
+                self.assertEqual(self.transitions[0].from_state_id, activity.state_id)
+                current = activity.current_state()
+                self.assertEqual(WorkflowHistory.TRANSITION, current.log_type)
+                self.assertEqual(self.user, current.participant.user)
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual([5, 20], received)
+
+        # The activities can be progressed as usual afterwards
+        activity.progress(self.transitions[0], self.user)
+        self.assertEqual(self.transitions[0].to_state_id, activity.state_id)
+
+    def test_bulk_start_validation(self):
+        """
+        Makes sure bulk_start() applies the same rules as start()
+        """
+        wa = create_activity(self.workflow, self.user)
+        wa.start(self.user)
+        fresh = WorkflowActivity.objects.create(workflow=self.workflow, created_by=self.user)
+        try:
+            WorkflowActivity.objects.bulk_start([fresh, wa], self.user)
+        except UnableToStartWorkflow as instance:
+            self.assertEqual('Already started', instance.args[0])
+        else:
+            self.fail('Exception expected but not thrown')
+        # Nothing was written for the batch
+        self.assertFalse(Participant.objects.filter(workflowactivity=fresh).exists())
+
+    def test_bulk_progress(self):
+        """
+        Makes sure many activities can be progressed at once and failures are
+        reported per activity
+        """
+        started = [create_activity(self.workflow, self.user) for i in range(3)]
+        WorkflowActivity.objects.bulk_start(started, self.user)
+        unstarted = create_activity(self.workflow, self.user)
+        other_user = User.objects.create(username='not_a_participant')
+
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            started + [unstarted], self.transitions[0], self.user
+        )
+        self.assertEqual(3, len(history))
+        self.assertEqual([unstarted.pk], list(failures))
+        self.assertEqual('Start the workflow before attempting to transition',
+                         failures[unstarted.pk].args[0])
+
+        # The same transition can't be used twice in a row
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            started, self.transitions[0], self.user
+        )
+        self.assertEqual([], history)
+        self.assertEqual(3, len(failures))
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            started, self.transitions[1], other_user
+        )
+        self.assertEqual([], history)
+        self.assertEqual(3, len(failures))
+
+        # Reaching the end state completes the activities
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            started, self.transitions[1], self.user
+        )
+        self.assertEqual({}, failures)
+        for activity in WorkflowActivity.objects.filter(pk__in=[a.pk for a in started]):
+            self.assertNotEqual(None, activity.completed_on)
+            self.assertEqual(self.transitions[1].to_state_id, activity.state_id)
+            self.assertEqual(self.transitions[1], activity.current_state().transition)
+
+    def test_bulk_duplicates(self):
+        """
+        Makes sure an activity given twice is only started / progressed once
+        without aborting the others
+        """
+        a, b, c = [create_activity(self.workflow, self.user) for i in range(3)]
+        history = WorkflowActivity.objects.bulk_start([a, b, a], self.user)
+        self.assertEqual([a.pk, b.pk], [wh.workflowactivity_id for wh in history])
+        WorkflowActivity.objects.bulk_start([c], self.user)
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            [b, c, b], self.transitions[0], self.user
+        )
+        self.assertEqual({}, failures)
+        self.assertEqual([b.pk, c.pk], [wh.workflowactivity_id for wh in history])
+        for activity in WorkflowActivity.objects.filter(pk__in=[b.pk, c.pk]):
+            self.assertEqual(self.transitions[0].to_state_id, activity.state_id)
+        self.assertEqual(2, WorkflowHistory.objects.filter(workflowactivity=b).count())
+
+    def test_bulk_history_read_back(self):
+        """
+        Makes sure the ids of the bulk created history aren't mixed up with
+        a comment added concurrently (on backends not returning them)
+        """
+        activities = [create_activity(self.workflow, self.user) for i in range(2)]
+        WorkflowActivity.objects.bulk_start(activities, self.user)
+        manager = WorkflowHistory.objects
+        bulk_create = manager.bulk_create
+        comments = []
+
+        def commented_bulk_create(objs, *args, **kwargs):
+            comments.append(activities[0].add_comment(self.user, 'concurrent'))
+            return bulk_create(objs, *args, **kwargs)
+        manager.bulk_create = commented_bulk_create
+        self.addCleanup(delattr, manager, 'bulk_create')
+
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            activities, self.transitions[0], self.user
+        )
+        self.assertEqual({}, failures)
+        for wh in history:
+            self.assertNotEqual(comments[0].pk, wh.pk)
+            self.assertEqual(wh, WorkflowHistory.objects.get(pk=wh.pk))
+            self.assertEqual(self.transitions[0], WorkflowHistory.objects.get(pk=wh.pk).transition)
+            self.assertEqual(wh.pk, WorkflowActivity.objects.get(pk=wh.workflowactivity_id).current_history_id)
+
+    def test_available_transitions(self):
+        """
+        Makes sure the transitions a user may use are resolved for many
+        activities with a constant number of queries
+        """
+        other_user = User.objects.create(username='other_participant')
+        self.transitions[0].users.add(self.user)
+        activities = [create_activity(self.workflow, self.user, other_user) for i in range(4)]
+        WorkflowActivity.objects.bulk_start(activities[:3], self.user)
+        activities[1].disable_participant(other_user, self.user, 'on holiday')
+        activities[2].force_stop(self.user, 'not needed')
+
+        queryset = WorkflowActivity.objects.filter(pk__in=[a.pk for a in activities])
+        available = WorkflowActivity.objects.available_transitions(self.user, queryset)
+        self.assertEqual({
+            activities[0].pk: [self.transitions[0]],
+            activities[1].pk: [],
+            activities[2].pk: [],
+            activities[3].pk: [],
+        }, available)
+        # The other user has no permission on the transition
+        available = WorkflowActivity.objects.available_transitions(other_user, activities)
+        self.assertEqual([[], [], [], []], [available[a.pk] for a in activities])
+        with self.assertNumQueries(2):
+            WorkflowActivity.objects.available_transitions(self.user, queryset)
+        self.assertEqual([self.transitions[0]], activities[0].available_transitions(self.user))
+
+    def test_participant_cache(self):
+        """
+        Makes sure the participants are loaded once per instance and stay
+        coherent when they are disabled or enabled
+        """
+        other_user = User.objects.create(username='cached_participant')
+        activity = create_activity(self.workflow, self.user, other_user)
+        with self.assertNumQueries(1):
+            self.assertEqual(set([self.user.pk, other_user.pk]), set(activity.get_participants()))
+            activity.get_participant(self.user)
+
+        activity.start(self.user)
+        activity.disable_participant(self.user, other_user, 'on holiday')
+        self.assertTrue(Participant.objects.get(workflowactivity=activity, user=other_user).disabled)
+        with self.assertRaises(Participant.DoesNotExist):
+            activity.progress(self.transitions[0], other_user)
+        activity.enable_participant(self.user, other_user, 'back')
+        activity.progress(self.transitions[0], other_user)
+
+        # add_comment() makes the user a participant
+        commenter = User.objects.create(username='commenter')
+        activity.add_comment(commenter, 'a comment')
+        self.assertEqual(commenter, activity.get_participant(commenter).user)
+        activity.clear_participant_cache()
+        self.assertEqual(3, len(activity.get_participants()))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the admin of the workflow models
+"""
+from __future__ import unicode_literals
+
+import re
+
+from django.conf.urls import include, url
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import override_settings, CaptureQueriesContext
+
+from workflow.admin import EstimatedCountPaginator
+from workflow.graph import graph_cache
+from workflow.models import Transition, WorkflowActivity, WorkflowHistory
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+urlpatterns = [
+    url(r'^admin/', include(admin.site.urls)),
+]
+
+
+@override_settings(
+    ROOT_URLCONF='workflow.unit_tests.test_admin',
+    STATIC_URL='/static/',
+    MIDDLEWARE_CLASSES=(
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ),
+)
+class AdminTestCase(TestCase):
+    """
+    Testing the changelists of the huge tables
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create_superuser('admin_user', 'admin@example.com', 'secret')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transition = Transition.objects.filter(workflow=self.workflow).order_by('pk')[0]
+        self.client.login(username='admin_user', password='secret')
+
+    def add_activities(self, count):
+        activities = [create_activity(self.workflow, self.user) for i in range(count)]
+        WorkflowActivity.objects.bulk_start(activities, self.user)
+        WorkflowActivity.objects.bulk_progress(activities, self.transition, self.user)
+
+    def changelist(self, name, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:workflow_%s_changelist' % name), params)
+        self.assertEqual(200, response.status_code)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_constant_queries(self):
+        """
+        Makes sure the changelists don't load the foreign keys of every row
+        or count the whole table
+        """
+        self.add_activities(2)
+        queries = dict((name, len(self.changelist(name))) for name in ('workflowhistory', 'workflowactivity'))
+        self.add_activities(8)
+        for name in ('workflowhistory', 'workflowactivity'):
+            statements = self.changelist(name)
+            self.assertEqual(queries[name], len(statements), '\n'.join(statements))
+            self.assertFalse([sql for sql in statements if re.search(r'COUNT\(\*\)', sql)])
+
+    def test_filtered(self):
+        self.add_activities(3)
+        statements = self.changelist('workflowhistory', log_type=WorkflowHistory.TRANSITION)
+        self.assertTrue([sql for sql in statements if re.search(r'COUNT\(\*\).*LIMIT', sql)])
+        self.changelist('workflowhistory', created_on__year='2020')
+
+    def test_estimated_count(self):
+        self.add_activities(3)
+        self.assertEqual(6, EstimatedCountPaginator(WorkflowHistory.objects.all(), 10).count)
+        paginator = EstimatedCountPaginator(WorkflowHistory.objects.filter(log_type=1), 10)
+        paginator.MAX_COUNT = 4
+        self.assertEqual(4, paginator.count)
+        self.assertEqual(1, paginator.num_pages)
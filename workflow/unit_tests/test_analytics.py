@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the dwell time and lead time analytics
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow.analytics import state_dwell_times, workflow_lead_times, report
+from workflow.archive import archive_activities
+from workflow.graph import graph_cache
+from workflow.models import State, Transition, WorkflowActivity, WorkflowHistory
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+HOUR = 3600.0
+
+
+class AnalyticsTestCase(TestCase):
+    """
+    Testing state_dwell_times() and workflow_lead_times()
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.base = datetime.datetime(2020, 1, 1)
+        self.user = User.objects.create(username='analytics_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.states = list(State.objects.filter(workflow=self.workflow).order_by('pk'))
+        # Estimated one hour in the start state
+        State.objects.filter(pk=self.states[0].pk).update(estimation_unit=State.HOUR)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('pk'))
+        # Activity i stays i + 1 hours in the start state and 2 * (i + 1)
+        # hours in the second one
+        self.activities = []
+        for i in range(4):
+            activity = create_activity(self.workflow, self.user)
+            self.at(activity.start(self.user), 0)
+            self.at(activity.add_comment(self.user, 'ignored'), 0.5)
+            self.at(activity.progress(self.transitions[0], self.user), i + 1)
+            self.at(activity.progress(self.transitions[1], self.user), 3 * (i + 1))
+            WorkflowActivity.objects.filter(pk=activity.pk).update(
+                created_on=self.base, completed_on=self.base + datetime.timedelta(hours=3 * (i + 1))
+            )
+            self.activities.append(activity)
+        # Still in the start state: not counted
+        self.at(create_activity(self.workflow, self.user).start(self.user), 0)
+        archive_activities([self.activities[0].pk])
+
+    def at(self, history, hours):
+        WorkflowHistory.objects.filter(pk=history.pk).update(
+            created_on=self.base + datetime.timedelta(hours=hours)
+        )
+
+    def test_dwell_times(self):
+        with self.assertNumQueries(1):
+            dwell = state_dwell_times(self.workflow)
+        self.assertEqual(set([self.states[0].pk, self.states[1].pk]), set(dwell))
+        start = dwell[self.states[0].pk]
+        self.assertEqual(4, start.count)
+        self.assertAlmostEqual(2.5 * HOUR, start.mean, 0)
+        self.assertAlmostEqual(HOUR, start.minimum, 0)
+        self.assertAlmostEqual(4 * HOUR, start.maximum, 0)
+        self.assertAlmostEqual(2 * HOUR, start.percentiles[50], 0)
+        self.assertAlmostEqual(4 * HOUR, start.percentiles[90], 0)
+        self.assertEqual(HOUR, start.estimate)
+        self.assertEqual(3, start.over_estimate)
+        self.assertAlmostEqual(2.5, start.mean_to_estimate, 3)
+
+        second = dwell[self.states[1].pk]
+        self.assertAlmostEqual(5 * HOUR, second.mean, 0)
+        self.assertEqual(HOUR * 24, second.estimate)
+        self.assertEqual(0, second.over_estimate)
+
+        # The transitions into the state within the range
+        dwell = state_dwell_times(since=self.base + datetime.timedelta(minutes=1),
+                                  until=self.base + datetime.timedelta(hours=3))
+        self.assertEqual([self.states[1].pk], list(dwell))
+        self.assertEqual(2, dwell[self.states[1].pk].count)
+        self.assertEqual({}, state_dwell_times(create_workflow(self.user, name='empty')))
+
+    def test_lead_times(self):
+        with self.assertNumQueries(1):
+            lead = workflow_lead_times()
+        stats = lead[self.workflow.pk]
+        self.assertEqual(4, stats.count)
+        self.assertAlmostEqual(7.5 * HOUR, stats.mean, 0)
+        self.assertAlmostEqual(6 * HOUR, stats.percentiles[50], 0)
+        self.assertAlmostEqual(12 * HOUR, stats.percentiles[99], 0)
+        self.assertEqual(1, workflow_lead_times(
+            self.workflow, until=self.base + datetime.timedelta(hours=4))[self.workflow.pk].count)
+
+    def test_report(self):
+        with self.assertNumQueries(4):
+            result = report(self.workflow.pk)
+        self.assertEqual(['State 0', 'State 1'], [item['name'] for item in result['states']])
+        self.assertEqual(4, result['workflows'][0]['count'])
+        out = StringIO()
+        call_command('workflow_analytics', workflow=self.workflow.pk, stdout=out)
+        self.assertTrue('State 1' in out.getvalue())
+        call_command('workflow_analytics', json=True, since='2020-01-01', stdout=out)
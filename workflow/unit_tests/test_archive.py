@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the archival of completed activities
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow.archive import archive_completed
+from workflow.exceptions import (
+    UnableToAddCommentToWorkflow, UnableToDisableParticipant, UnableToEnableParticipant
+)
+from workflow.graph import graph_cache
+from workflow.models import (
+    Transition, WorkflowActivity, WorkflowHistory, Participant, ArchivedWorkflowHistory,
+    ArchivedParticipant
+)
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class ArchiveTestCase(TestCase):
+    """
+    Testing archive_completed()
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='archive_user')
+        self.other = User.objects.create(username='archive_other')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activities = [create_activity(self.workflow, self.user, self.other) for i in range(5)]
+        WorkflowActivity.objects.bulk_start(self.activities, self.user)
+        for activity in self.activities[:3]:
+            activity.add_comment(self.other, 'a comment')
+            for transition in self.transitions:
+                activity.progress(transition, self.user)
+        self.cutoff = datetime.datetime.today() + datetime.timedelta(seconds=1)
+
+    def test_archive_completed(self):
+        """
+        Makes sure only the history and participants of completed activities
+        are moved, in chunks, and can still be read from the archive
+        """
+        completed = self.activities[:3]
+        expected = dict(
+            (a.pk, list(a.history.values_list('id', 'state', 'note'))) for a in completed
+        )
+        self.assertEqual(3, archive_completed(before=self.cutoff, chunk_size=2))
+
+        self.assertEqual(0, WorkflowHistory.objects.filter(workflowactivity__in=completed).count())
+        self.assertEqual(0, Participant.objects.filter(workflowactivity__in=completed).count())
+        self.assertEqual(2, WorkflowHistory.objects.count())
+        self.assertEqual(6, ArchivedParticipant.objects.count())
+        for activity in completed:
+            activity = WorkflowActivity.objects.get(pk=activity.pk)
+            self.assertTrue(activity.archived_on)
+            self.assertEqual(4, activity.archived_history_count)
+            self.assertEqual(self.transitions[-1].to_state_id, activity.state_id)
+            self.assertEqual([], list(activity.get_history()))
+            self.assertEqual(
+                expected[activity.pk],
+                list(activity.get_history(include_archived=True).values_list('id', 'state', 'note'))
+            )
+            self.assertEqual(self.transitions[-1].to_state_id, activity.current_state().state_id)
+
+        # Nothing left to archive
+        self.assertEqual(0, archive_completed(before=self.cutoff))
+        self.assertEqual(12, ArchivedWorkflowHistory.objects.count())
+
+    def test_read_only(self):
+        """
+        Makes sure nothing can be added to the history of archived activities
+        """
+        archive_completed(before=self.cutoff)
+        activity = WorkflowActivity.objects.get(pk=self.activities[0].pk)
+        self.assertRaises(UnableToAddCommentToWorkflow, activity.add_comment, self.user, 'late')
+        self.assertRaises(UnableToDisableParticipant, activity.disable_participant,
+                          self.user, self.other, 'late')
+        self.assertRaises(UnableToEnableParticipant, activity.enable_participant,
+                          self.user, self.other, 'late')
+        self.assertFalse(WorkflowHistory.objects.filter(workflowactivity=activity).exists())
+        self.assertFalse(Participant.objects.filter(workflowactivity=activity).exists())
+
+    def test_in_flight(self):
+        """
+        Makes sure in flight activities and recently completed ones are kept
+        """
+        self.assertEqual(0, archive_completed(days=1))
+        self.assertEqual(0, archive_completed(before=self.cutoff, workflow=self.workflow.pk + 1))
+        activity = self.activities[3]
+        self.assertEqual(activity.history.get().pk, activity.current_state().pk)
+        self.assertEqual(list(activity.history.all()), list(activity.get_history(include_archived=True)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_workflow_history', days=0, chunk_size=1, stdout=out)
+        self.assertTrue('Archived 3 workflow activities' in out.getvalue())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the benchmark generators and runner
+"""
+from __future__ import unicode_literals
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from workflow.benchmarks.generators import generate_workflow, generate_activities
+from workflow.benchmarks.runner import percentile
+from workflow.graph import graph_cache
+from workflow.models import Workflow, WorkflowHistory
+
+
+class BenchmarkTestCase(TestCase):
+    """
+    Testing the benchmark package
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='benchmark_user')
+
+    def test_generators(self):
+        workflow = generate_workflow(self.user, states=6, transitions=9)
+        self.assertEqual(6, workflow.states.count())
+        self.assertEqual(9, workflow.transitions.count())
+        self.assertTrue(workflow.is_valid(), workflow.errors)
+        activities = generate_activities(workflow, self.user, count=3, history=4)
+        for activity in activities:
+            self.assertEqual(4, WorkflowHistory.objects.filter(workflowactivity=activity).count())
+            self.assertTrue(activity.current_state().state.is_start_state)
+        with self.assertRaises(ValueError):
+            generate_workflow(self.user, states=6, transitions=4)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(7, percentile([7], 90))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('workflow_benchmark', states=4, history=3, iterations=3, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            set(['start', 'progress', 'current_state', 'add_comment', 'is_valid', 'is_valid_cached']),
+            set(report['operations'])
+        )
+        self.assertEqual(3, report['operations']['progress']['calls'])
+        self.assertEqual(0, report['operations']['is_valid_cached']['queries'])
+        # The generated data is rolled back
+        self.assertFalse(Workflow.objects.exists())
+
+
+class LoadTestCase(TransactionTestCase):
+    """
+    Testing the load test harness against the file backed test database
+    """
+
+    def test_command(self):
+        graph_cache.clear()
+        existing = User.objects.create(username='workflow_load_0')
+        out = StringIO()
+        call_command('workflow_load_test', threads=3, activities=4, operations=10,
+                     states=4, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(3, report['config']['threads'])
+        self.assertEqual(0, report['errors']['other'], report['errors'])
+        self.assertTrue(report['operations']['start']['count'] > 0)
+        self.assertEqual(
+            report['succeeded'], sum(op['count'] for op in report['operations'].values())
+        )
+        # The generated data is deleted
+        self.assertFalse(Workflow.objects.exists())
+        # But not the users that existed before
+        self.assertEqual([existing], list(User.objects.all()))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the optimistic concurrency control of WorkflowActivity transitions
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import TestCase, TransactionTestCase
+
+from workflow.exceptions import ConcurrentWorkflowChange, UnableToProgressWorkflow
+from workflow.graph import graph_cache
+from workflow.models import Transition, WorkflowActivity, WorkflowHistory
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class VersionTestCase(TestCase):
+    """
+    Testing the version compare-and-swap of WorkflowActivity
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='version_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activity = create_activity(self.workflow, self.user)
+
+    def test_version(self):
+        """
+        Makes sure every transition increments the version but comments don't
+        """
+        self.assertEqual(0, self.activity.version)
+        self.activity.start(self.user)
+        self.assertEqual(1, self.activity.version)
+        self.activity.add_comment(self.user, 'a comment')
+        self.activity.progress(self.transitions[0], self.user, select_for_update=True)
+        self.assertEqual(2, self.activity.version)
+        self.assertEqual(2, WorkflowActivity.objects.get(pk=self.activity.pk).version)
+
+    def test_stale_version(self):
+        """
+        Makes sure a transition validated against a stale version isn't
+        recorded
+        """
+        self.activity.start(self.user)
+        stale = WorkflowActivity.objects.get(pk=self.activity.pk)
+        self.activity.progress(self.transitions[0], self.user)
+        count = WorkflowHistory.objects.count()
+        wh = WorkflowHistory(
+            workflowactivity=stale,
+            state=self.transitions[0].to_state,
+            log_type=WorkflowHistory.TRANSITION,
+            transition=self.transitions[0],
+            note='stale',
+            participant=stale.participants.get(),
+        )
+        with self.assertRaises(ConcurrentWorkflowChange):
+            wh.save()
+        self.assertEqual(count, WorkflowHistory.objects.count())
+        # progress() validates against the current state in the database
+        with self.assertRaises(UnableToProgressWorkflow):
+            stale.progress(self.transitions[0], self.user)
+        stale.progress(self.transitions[1], self.user)
+        self.assertEqual(3, stale.version)
+        self.assertTrue(stale.completed_on)
+
+    def test_comment_keeps_state(self):
+        """
+        Makes sure a comment made on a stale instance doesn't move the
+        activity back to the state it was made in
+        """
+        self.activity.start(self.user)
+        stale = WorkflowActivity.objects.get(pk=self.activity.pk)
+        stale.current_state()
+        self.activity.progress(self.transitions[0], self.user)
+        stale.add_comment(self.user, 'late comment')
+        activity = WorkflowActivity.objects.get(pk=self.activity.pk)
+        self.assertEqual(self.transitions[0].to_state_id, activity.state_id)
+        self.assertEqual(WorkflowHistory.TRANSITION, activity.current_history.log_type)
+
+
+class Rendezvous(object):
+    """
+    Blocks the given number of threads until all of them have arrived
+    """
+
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = 0
+        self.condition = threading.Condition()
+
+    def wait(self):
+        with self.condition:
+            self.arrived += 1
+            self.condition.notify_all()
+            while self.arrived < self.parties:
+                self.condition.wait(5)
+
+
+class ContentionTestCase(TransactionTestCase):
+    """
+    Testing concurrent transitions from several threads (and so database
+    connections) against the file backed test database
+    """
+    threads = 6
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='contention_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transition = Transition.objects.filter(workflow=self.workflow).order_by('id')[0]
+
+    def run_threads(self, target, args):
+        results = [None] * len(args)
+
+        def run(i):
+            try:
+                results[i] = target(*args[i])
+            except Exception as e:
+                results[i] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(args))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def describe(self, results):
+        return ', '.join(
+            '%s(%s)' % (type(r).__name__, r if isinstance(r, Exception) else r.pk) for r in results
+        )
+
+    def progress(self, activity_id, rendezvous, select_for_update=False):
+        activity = WorkflowActivity.objects.get(pk=activity_id)
+        if rendezvous:
+            rendezvous.wait()
+        return activity.progress(self.transition, self.user, select_for_update=select_for_update)
+
+    def validate_then_wait(self, rendezvous):
+        """
+        Makes every thread wait for the others between the validation of its
+        transition and its recording
+        """
+        def receiver(sender, **kwargs):
+            rendezvous.wait()
+        pre_save.connect(receiver, sender=WorkflowHistory, weak=False, dispatch_uid='validate_then_wait')
+        self.addCleanup(pre_save.disconnect, sender=WorkflowHistory, dispatch_uid='validate_then_wait')
+
+    def assert_single_winner(self, select_for_update):
+        activity = create_activity(self.workflow, self.user)
+        activity.start(self.user)
+        rendezvous = Rendezvous(self.threads)
+        if select_for_update:
+            args = (activity.pk, rendezvous, True)
+        else:
+            self.validate_then_wait(rendezvous)
+            args = (activity.pk, None)
+        results = self.run_threads(self.progress, [args] * self.threads)
+
+        won = [r for r in results if isinstance(r, WorkflowHistory)]
+        if select_for_update:
+            lost = [r for r in results if isinstance(r, (ConcurrentWorkflowChange, UnableToProgressWorkflow))]
+        else:
+            lost = [r for r in results if isinstance(r, ConcurrentWorkflowChange)]
+        self.assertEqual(1, len(won), self.describe(results))
+        self.assertEqual(self.threads - 1, len(lost), self.describe(results))
+        self.assertEqual(1, WorkflowHistory.objects.filter(
+            workflowactivity=activity, transition=self.transition).count())
+        activity = WorkflowActivity.objects.get(pk=activity.pk)
+        self.assertEqual(2, activity.version)
+        self.assertEqual(won[0].pk, activity.current_history_id)
+
+    def test_same_activity(self):
+        """
+        Makes sure exactly one of many concurrent transitions of the same
+        activity is recorded, the others failing the version check
+        """
+        self.assert_single_winner(select_for_update=False)
+
+    def test_same_activity_select_for_update(self):
+        self.assert_single_winner(select_for_update=True)
+
+    def test_distinct_activities(self):
+        """
+        Makes sure concurrent transitions of distinct activities all succeed
+        """
+        activities = [create_activity(self.workflow, self.user) for i in range(self.threads)]
+        WorkflowActivity.objects.bulk_start(activities, self.user)
+        self.validate_then_wait(Rendezvous(self.threads))
+        results = self.run_threads(self.progress, [(a.pk, None) for a in activities])
+
+        self.assertTrue(all(isinstance(r, WorkflowHistory) for r in results), self.describe(results))
+        self.assertEqual(
+            set([self.transition.to_state_id]),
+            set(WorkflowActivity.objects.values_list('state', flat=True))
+        )
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the import, export and cloning of workflow definitions
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow.definitions import export_definition, import_definition
+from workflow.exceptions import UnableToCloneWorkflow, UnableToImportWorkflow
+from workflow.graph import graph_cache
+from workflow.models import Workflow, State, Transition
+from workflow.unit_tests.utils import create_workflow
+
+
+def describe(workflow):
+    """
+    The definition of the workflow without the ids of its states
+    """
+    names = dict(State.objects.filter(workflow=workflow).values_list('pk', 'name'))
+    definition = export_definition(workflow)
+    for state in definition['states']:
+        del state['key']
+    for transition in definition['transitions']:
+        del transition['key']
+        transition['from_state'] = names[transition['from_state']]
+        transition['to_state'] = names[transition['to_state']]
+    del definition['name']
+    return definition
+
+
+class DefinitionTestCase(TestCase):
+    """
+    Testing export_definition(), import_definition() and Workflow.clone()
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='definition_user')
+        self.reviewer = User.objects.create(username='definition_reviewer')
+        self.group = Group.objects.create(name='definition_group')
+        self.workflow = create_workflow(self.user, name='big workflow', states=30)
+        states = list(State.objects.filter(workflow=self.workflow).order_by('pk'))
+        transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('pk'))
+        # A loop back and some permissions
+        Transition.objects.create(
+            name='Back', workflow=self.workflow, from_state=states[5], to_state=states[1]
+        )
+        for state in states[:10]:
+            state.users.add(self.user, self.reviewer)
+            state.groups.add(self.group)
+        for transition in transitions[:10]:
+            transition.users.add(self.reviewer)
+            transition.groups.add(self.group)
+        self.workflow.activate()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_clone(self):
+        """
+        Makes sure a clone is an identical valid workflow made with a fixed
+        number of queries
+        """
+        # Two lookups, the workflow, the states and transitions (inserted
+        # and read back), their users and groups within a savepoint
+        with self.assertNumQueries(19):
+            clone = self.workflow.clone(self.user)
+        self.assertEqual(Workflow.DEFINITION, clone.status)
+        self.assertEqual(self.workflow, clone.cloned_from)
+        self.assertEqual([clone], list(self.workflow.clones.all()))
+        self.assertEqual(describe(self.workflow), describe(clone))
+        self.assertEqual(30, clone.transitions.count())
+        self.assertTrue(clone.is_valid())
+        start = clone.get_graph().start_state
+        self.assertTrue(start.has_perm_view(self.reviewer))
+
+        draft = create_workflow(self.user, name='draft')
+        self.assertRaises(UnableToCloneWorkflow, draft.clone, self.user)
+
+    def test_import_errors(self):
+        definition = export_definition(self.workflow)
+        definition['states'][0]['users'].append('nobody')
+        self.assertRaises(UnableToImportWorkflow, import_definition, definition, self.user)
+        definition = export_definition(self.workflow)
+        definition['transitions'][0]['to_state'] = 0
+        self.assertRaises(UnableToImportWorkflow, import_definition, definition, self.user)
+        self.assertRaises(UnableToImportWorkflow, import_definition, {'format': 0}, self.user)
+        self.assertEqual(1, Workflow.objects.count())
+
+    def test_commands(self):
+        path = os.path.join(self.tmp, 'definition.json')
+        call_command('export_workflow_definition', str(self.workflow.pk), '--output=%s' % path)
+        with open(path) as f:
+            self.assertEqual(30, len(json.load(f)['states']))
+        out = StringIO()
+        call_command('import_workflow_definition', path, '--user=definition_user',
+                     '--name=imported', stdout=out)
+        imported = Workflow.objects.get(name='imported')
+        self.assertTrue('Imported workflow %d' % imported.pk in out.getvalue())
+        self.assertEqual(None, imported.cloned_from)
+        self.assertEqual(describe(self.workflow), describe(imported))
+        self.assertRaises(CommandError, call_command, 'import_workflow_definition', path,
+                          '--user=nobody')
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the delivery of workflow signals
+"""
+from __future__ import unicode_literals
+
+from unittest import skipIf, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from workflow.graph import graph_cache
+from workflow.models import Transition, WorkflowActivity, WorkflowHistory
+from workflow.signals import workflow_transitioned, workflow_started
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class Receiver(object):
+
+    def __init__(self, signal):
+        self.calls = []
+        signal.connect(self)
+        self.signal = signal
+
+    def __call__(self, sender, **kwargs):
+        self.calls.append(sender)
+
+
+class DispatchTestCase(TestCase):
+    """
+    Testing immediate signal delivery
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='dispatch_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.activity = create_activity(self.workflow, self.user)
+
+    def test_immediate(self):
+        """
+        Makes sure receivers are called straight away by default
+        """
+        receiver = Receiver(workflow_started)
+        self.addCleanup(workflow_started.disconnect, receiver)
+        self.activity.start(self.user)
+        self.assertEqual([self.activity], receiver.calls)
+
+    def test_skip_without_receivers(self):
+        """
+        Makes sure the state isn't loaded when nobody listens to
+        workflow_started / workflow_ended
+        """
+        self.activity.start(self.user)
+        current = self.activity.current_state()
+        wh = WorkflowHistory(
+            workflowactivity=self.activity,
+            state_id=current.state_id,
+            log_type=WorkflowHistory.COMMENT,
+            participant=current.participant,
+        )
+        with CaptureQueriesContext(connection) as context:
+            wh.save()
+        for query in context.captured_queries:
+            self.assertFalse('"workflow_state"' in query['sql'], query['sql'])
+
+
+    @skipIf(hasattr(transaction, 'on_commit') or hasattr(connection, 'on_commit'),
+            'Requires a Django without transaction.on_commit()')
+    @override_settings(WORKFLOW_SIGNAL_DISPATCH='on_commit')
+    def test_on_commit_unsupported(self):
+        """
+        Makes sure signals aren't silently delivered inside the transaction
+        when they can't be deferred until it commits
+        """
+        try:
+            self.activity.start(self.user)
+        except ImproperlyConfigured:
+            pass
+        else:
+            self.fail('Exception expected but not thrown')
+        # The start was rolled back
+        self.assertEqual(None, WorkflowActivity.objects.get(pk=self.activity.pk).state_id)
+
+
+@skipUnless(hasattr(transaction, 'on_commit'), 'Requires transaction.on_commit()')
+@override_settings(WORKFLOW_SIGNAL_DISPATCH='on_commit')
+class OnCommitDispatchTestCase(TransactionTestCase):
+    """
+    Testing signal delivery deferred until the transaction commits
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='dispatch_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.receiver = Receiver(workflow_transitioned)
+        self.addCleanup(workflow_transitioned.disconnect, self.receiver)
+
+    def test_on_commit(self):
+        """
+        Makes sure signals are only delivered once the transaction commits
+        """
+        activity = create_activity(self.workflow, self.user)
+        transition = Transition.objects.get(workflow=self.workflow, from_state__is_start_state=True)
+        with transaction.atomic():
+            activity.start(self.user)
+            wh = activity.progress(transition, self.user)
+            self.assertEqual([], self.receiver.calls)
+        self.assertEqual(2, len(self.receiver.calls))
+        self.assertEqual(wh, self.receiver.calls[-1])
+
+        try:
+            with transaction.atomic():
+                activity.add_comment(self.user, 'rolled back')
+                WorkflowActivity.objects.bulk_progress([activity], transition, self.user,
+                                                       send_signals=True)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(2, len(self.receiver.calls))
+
+    def test_single_batch(self):
+        """
+        Makes sure the signals of a transaction are flushed by a single hook
+        and those of a rolled back savepoint are left out
+        """
+        activity = create_activity(self.workflow, self.user)
+        other = create_activity(self.workflow, self.user)
+        transition = Transition.objects.get(workflow=self.workflow, from_state__is_start_state=True)
+        with transaction.atomic():
+            activity.start(self.user)
+            other.start(self.user)
+            try:
+                with transaction.atomic():
+                    other.progress(transition, self.user)
+                    raise ValueError
+            except ValueError:
+                pass
+            wh = activity.progress(transition, self.user)
+            flushes = [func for sids, func in connection.run_on_commit
+                       if getattr(func, '__name__', None) == 'flush']
+            self.assertEqual(1, len(flushes))
+            self.assertEqual([], self.receiver.calls)
+        self.assertEqual(3, len(self.receiver.calls))
+        self.assertEqual(wh, self.receiver.calls[-1])
+        self.assertFalse(any(
+            call.workflowactivity_id == other.pk and call.log_type == WorkflowHistory.TRANSITION and
+            call.transition_id == transition.pk for call in self.receiver.calls
+        ))
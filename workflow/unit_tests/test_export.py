@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming export of the history
+"""
+from __future__ import unicode_literals
+
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import six
+
+from workflow.archive import archive_activities
+from workflow.export import COLUMNS, export_history, history_rows
+from workflow.graph import graph_cache
+from workflow.models import Transition, WorkflowHistory
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class ExportTestCase(TestCase):
+    """
+    Testing export_history() and the export_workflow_history command
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='export_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.other = create_workflow(self.user, name='other', states=2)
+        transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activities = [create_activity(self.workflow, self.user) for i in range(3)]
+        for activity in self.activities:
+            activity.start(self.user)
+            activity.add_comment(self.user, 'Ünïcode, "quoted"')
+            activity.progress(transitions[0], self.user)
+        # Completed and archived, its history is exported with the rest
+        self.activities[0].progress(transitions[1], self.user)
+        archive_activities([self.activities[0].pk])
+        create_activity(self.other, self.user).start(self.user)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rows(self):
+        """
+        Makes sure the live and archived history are merged by id, a chunk
+        at a time
+        """
+        # Two chunks of live history (the second one is not full), one of
+        # archived history and an empty one
+        with self.assertNumQueries(4):
+            rows = list(history_rows(workflow=self.workflow, chunk_size=4))
+        self.assertEqual(10, len(rows))
+        ids = [row[0] for row in rows]
+        self.assertEqual(sorted(ids), ids)
+        archived = [row for row in rows if row[-1]]
+        self.assertEqual(4, len(archived))
+        self.assertEqual(set([self.activities[0].pk]), set(row[1] for row in archived))
+        self.assertEqual(
+            ['transition', 'comment', 'transition', 'transition'], [row[2] for row in archived]
+        )
+        self.assertEqual(11, len(list(history_rows(chunk_size=3))))
+
+        WorkflowHistory.objects.filter(workflowactivity=self.activities[1]).update(
+            created_on=datetime.datetime(2020, 1, 1)
+        )
+        self.assertEqual(3, len(list(history_rows(until=datetime.datetime(2020, 1, 2)))))
+        self.assertEqual(8, len(list(history_rows(since=datetime.datetime(2020, 1, 2)))))
+
+    def test_csv(self):
+        path = os.path.join(self.tmp, 'history.csv')
+        call_command('export_workflow_history', workflow=self.workflow.pk, output=path, chunk_size=2)
+        with io.open(path, encoding='utf-8', newline='') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(11, len(lines))
+        self.assertEqual(','.join(COLUMNS), lines[0])
+        self.assertTrue('"Ünïcode, ""quoted"""' in lines[2])
+
+    def test_stdout(self):
+        stdout = six.StringIO()
+        call_command('export_workflow_history', format='jsonl', stdout=stdout)
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(11, len(rows))
+        self.assertEqual('Ünïcode, "quoted"', rows[1]['note'])
+
+    def test_gzipped_jsonl(self):
+        path = os.path.join(self.tmp, 'history.jsonl.gz')
+        call_command(
+            'export_workflow_history', output=path, format='jsonl', gzip=True, since='2000-01-01'
+        )
+        with gzip.open(path) as f:
+            rows = [json.loads(line.decode('utf-8')) for line in f.read().splitlines()]
+        self.assertEqual(11, len(rows))
+        self.assertEqual('Ünïcode, "quoted"', rows[1]['note'])
+        self.assertEqual('export_user', rows[1]['username'])
+        self.assertEqual('State 0', rows[0]['state'])
+
+    def test_compressed_stream(self):
+        data = b''.join(export_history(compress=True, chunk_size=5))
+        text = gzip.GzipFile(fileobj=io.BytesIO(data)).read().decode('utf-8')
+        self.assertEqual(b''.join(export_history(chunk_size=5)).decode('utf-8'), text)
+        self.assertRaises(ValueError, export_history, format='xml')
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the compiled workflow graph and its cache
+"""
+from __future__ import unicode_literals
+
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from workflow.graph import WorkflowGraph, graph_cache, get_graph
+from workflow.models import State, Transition
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class GraphTestCase(TestCase):
+    """
+    Testing WorkflowGraph
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='graph_user')
+        self.workflow = create_workflow(self.user, states=3)
+
+    def test_compile(self):
+        """
+        Makes sure the adjacency lists, start and end states are compiled
+        """
+        states = list(self.workflow.states.order_by('id'))
+        graph = WorkflowGraph.compile(self.workflow)
+        self.assertEqual(states[0], graph.start_state)
+        self.assertEqual(frozenset([states[2].id]), graph.end_states)
+        self.assertEqual(1, len(graph.transitions_from(states[0].id)))
+        self.assertEqual([], graph.transitions_into(states[0].id))
+        self.assertEqual(states[1], graph.transitions_from(states[0].id)[0].to_state)
+        self.assertNotEqual(None, graph.deadline(states[0].id))
+        try:
+            graph.states = {}
+        except AttributeError:
+            pass
+        else:
+            self.fail('Exception expected but not thrown')
+
+    def test_cache_invalidation(self):
+        """
+        Makes sure the cached graph is refreshed when a state or transition
+        changes
+        """
+        graph = get_graph(self.workflow)
+        self.assertTrue(graph is get_graph(self.workflow.id))
+        state = State.objects.create(name='extra', workflow=self.workflow)
+        graph = get_graph(self.workflow)
+        self.assertTrue(state.id in graph.states)
+        transition = Transition.objects.create(
+            name='extra', workflow=self.workflow,
+            from_state=graph.start_state, to_state=state
+        )
+        graph = get_graph(self.workflow)
+        self.assertTrue(transition.id in graph.transitions)
+        transition.delete()
+        self.assertFalse(transition.id in get_graph(self.workflow).transitions)
+
+    def test_cache_expiry(self):
+        """
+        Makes sure changes the receivers don't see (made by another process
+        or with queryset.update()) are picked up once the entry expires
+        """
+        state = get_graph(self.workflow).start_state
+        State.objects.filter(pk=state.pk).update(name='renamed')
+        self.assertEqual(state.name, get_graph(self.workflow).states[state.pk].name)
+        with override_settings(WORKFLOW_CACHE_TTL=0.01):
+            graph_cache.clear()
+            graph = get_graph(self.workflow)
+            self.assertTrue(graph is get_graph(self.workflow))
+            State.objects.filter(pk=state.pk).update(name='expired')
+            time.sleep(0.02)
+            self.assertEqual('expired', get_graph(self.workflow).states[state.pk].name)
+        with override_settings(WORKFLOW_CACHE_TTL=0):
+            graph_cache.clear()
+            self.assertFalse(get_graph(self.workflow) is get_graph(self.workflow))
+
+    def test_callers_get_copies(self):
+        """
+        Makes sure the instances handed out can be modified without changing
+        the cached graph shared by every thread
+        """
+        graph = get_graph(self.workflow)
+        start = graph.start_state
+        transition = graph.transitions_from(start.id)[0]
+        transition.name = 'changed'
+        transition.to_state.name = 'changed'
+        start.name = 'changed'
+        wa = create_activity(self.workflow, self.user)
+        wa.start(self.user)
+        for available in wa.available_transitions(self.user) + [wa.progress(transition, self.user).state]:
+            available.name = 'changed'
+        graph = get_graph(self.workflow)
+        self.assertTrue(graph is get_graph(self.workflow))
+        self.assertEqual('State 0', graph.states[start.id].name)
+        self.assertNotEqual('changed', graph.transitions[transition.id].name)
+        self.assertEqual('State 1', graph.transitions[transition.id].to_state.name)
+        self.assertEqual('State 1', graph.get_state(transition.to_state_id).name)
+
+    def test_no_definition_queries_when_warm(self):
+        """
+        Once the graph is cached, progress() musn't query states or
+        transitions
+        """
+        wa = create_activity(self.workflow, self.user)
+        wa.start(self.user)
+        transition = Transition.objects.get(workflow=self.workflow, from_state__is_start_state=True)
+        get_graph(self.workflow)
+        with CaptureQueriesContext(connection) as context:
+            wa.progress(transition, self.user)
+        for query in context.captured_queries:
+            self.assertFalse('"workflow_state"' in query['sql'], query['sql'])
+            self.assertFalse('"workflow_transition"' in query['sql'], query['sql'])
+
+    def test_is_valid_reachability(self):
+        """
+        Makes sure is_valid() reports states that can't be reached or can't
+        reach an end state even when they have transitions
+        """
+        self.assertTrue(self.workflow.is_valid())
+        start = self.workflow.get_graph().start_state
+
+        # An island of two connected states: the second one has a transition
+        # into it but is still unreachable from the start state
+        island1 = State.objects.create(name='island 1', workflow=self.workflow)
+        island2 = State.objects.create(name='island 2', workflow=self.workflow, is_end_state=True)
+        bridge = Transition.objects.create(
+            name='bridge', workflow=self.workflow, from_state=island1, to_state=island2
+        )
+        self.assertFalse(self.workflow.is_valid())
+        self.assertTrue(island1.id in self.workflow.errors['states'])
+        self.assertTrue(island2.id in self.workflow.errors['states'])
+        self.assertEqual(1, len(self.workflow.has_errors(bridge)))
+        bridge.delete()
+        island1.delete()
+        island2.delete()
+        self.assertTrue(self.workflow.is_valid())
+
+        # A loop that can be entered but never left
+        loop1 = State.objects.create(name='loop 1', workflow=self.workflow)
+        loop2 = State.objects.create(name='loop 2', workflow=self.workflow)
+        for from_state, to_state in ((start, loop1), (loop1, loop2), (loop2, loop1)):
+            Transition.objects.create(
+                name='loop', workflow=self.workflow, from_state=from_state, to_state=to_state
+            )
+        self.assertFalse(self.workflow.is_valid())
+        msg = 'This state is a dead end. There is no way to reach an end state from it.'
+        self.assertEqual([msg], self.workflow.has_errors(loop1))
+        self.assertEqual([msg], self.workflow.has_errors(loop2))
+        self.assertEqual([], self.workflow.has_errors(start))
+
+    def test_is_valid_without_start_state(self):
+        """
+        Makes sure the missing start state doesn't flag every state and
+        transition as unreachable
+        """
+        states = list(self.workflow.states.order_by('id'))
+        State.objects.filter(pk=states[0].pk).update(is_start_state=False)
+        graph_cache.clear()
+        self.assertFalse(self.workflow.is_valid())
+        self.assertEqual(['There must be only one start state'], self.workflow.errors['workflow'])
+        orphaned = ('This state is orphaned. '
+                    'There is no way to get to it given the current workflow topology.')
+        self.assertEqual([orphaned], self.workflow.has_errors(states[0]))
+        self.assertEqual([], self.workflow.has_errors(states[1]))
+        self.assertEqual({}, self.workflow.errors['transitions'])
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the signal instrumentation
+"""
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow import instrumentation
+from workflow.graph import graph_cache
+from workflow.models import WorkflowActivity
+from workflow.signals import workflow_started, workflow_overdue
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+def on_started(sender, **kwargs):
+    pass
+
+
+def on_overdue(sender, **kwargs):
+    pass
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Testing the timing of signal receivers
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        instrumentation.reset()
+        self.addCleanup(instrumentation.use_settings)
+        self.user = User.objects.create(username='instrumented_user')
+        self.workflow = create_workflow(self.user, states=3)
+        workflow_started.connect(on_started)
+        self.addCleanup(workflow_started.disconnect, on_started)
+
+    def test_disabled_by_default(self):
+        create_activity(self.workflow, self.user).start(self.user)
+        self.assertEqual({}, instrumentation.get_stats())
+
+    def test_get_stats(self):
+        """
+        Makes sure the sends and receivers are counted and slow receivers
+        logged
+        """
+        handler = ListHandler()
+        logging.getLogger('workflow.signals').addHandler(handler)
+        self.addCleanup(logging.getLogger('workflow.signals').removeHandler, handler)
+
+        instrumentation.enable(threshold=0)
+        for i in range(2):
+            create_activity(self.workflow, self.user).start(self.user)
+        stats = instrumentation.get_stats()
+        self.assertEqual(2, stats['workflow_started']['calls'])
+        name = 'workflow.unit_tests.test_instrumentation.on_started'
+        receiver = stats['workflow_started']['receivers'][name]
+        self.assertEqual(2, receiver['calls'])
+        self.assertTrue(receiver['max'] <= receiver['total'])
+        self.assertEqual(2, len([m for m in handler.messages if name in m]))
+
+        instrumentation.reset()
+        self.assertEqual({}, instrumentation.get_stats())
+
+    def test_command(self):
+        """
+        Makes sure the command dumps the statistics of the command it runs
+        """
+        activity = create_activity(self.workflow, self.user)
+        activity.start(self.user)
+        WorkflowActivity.objects.update(deadline=datetime.datetime(2000, 1, 1))
+        workflow_overdue.connect(on_overdue)
+        self.addCleanup(workflow_overdue.disconnect, on_overdue)
+
+        out = StringIO()
+        call_command('workflow_signal_stats', 'scan_overdue_workflows', stdout=out)
+        self.assertTrue('Found 1 overdue' in out.getvalue())
+        self.assertTrue('test_instrumentation.on_overdue' in out.getvalue())
+        self.assertFalse(instrumentation.is_enabled())
+        # The statistics of a new process would always be empty
+        self.assertRaises(CommandError, call_command, 'workflow_signal_stats', stdout=out)
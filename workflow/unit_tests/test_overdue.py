@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the overdue activity scanner
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow.graph import graph_cache
+from workflow.models import WorkflowActivity
+from workflow.overdue import iter_overdue
+from workflow.signals import workflow_overdue
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class OverdueTestCase(TestCase):
+    """
+    Testing iter_overdue() / scan_overdue()
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='overdue_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.activities = [create_activity(self.workflow, self.user) for i in range(5)]
+        WorkflowActivity.objects.bulk_start(self.activities, self.user)
+        self.past = datetime.datetime.today() - datetime.timedelta(days=1)
+
+    def test_iter_overdue(self):
+        """
+        Makes sure only uncompleted activities past their deadline are found,
+        in deadline order, across chunks sharing the same deadline
+        """
+        self.assertEqual([], list(iter_overdue()))
+        overdue = self.activities[:4]
+        WorkflowActivity.objects.filter(pk__in=[a.pk for a in overdue]).update(deadline=self.past)
+        WorkflowActivity.objects.filter(pk=overdue[0].pk).update(
+            deadline=self.past - datetime.timedelta(hours=1)
+        )
+        overdue[3].force_stop(self.user, 'done')
+
+        chunks = list(iter_overdue(chunk_size=2))
+        self.assertEqual([2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(
+            [a.pk for a in overdue[:3]],
+            [a.pk for chunk in chunks for a in chunk]
+        )
+        later = self.past - datetime.timedelta(minutes=30)
+        self.assertEqual(1, len(list(iter_overdue(now=later))[0]))
+
+    def test_scan_overdue_command(self):
+        """
+        Makes sure the command sends the workflow_overdue signal in batches
+        """
+        received = []
+
+        def on_overdue(sender, activities, **kwargs):
+            received.append([a.pk for a in activities])
+        workflow_overdue.connect(on_overdue)
+        self.addCleanup(workflow_overdue.disconnect, on_overdue)
+
+        WorkflowActivity.objects.update(deadline=self.past)
+        out = StringIO()
+        call_command('scan_overdue_workflows', chunk_size=3, stdout=out)
+        self.assertEqual([3, 2], [len(pks) for pks in received])
+        self.assertTrue('Found 5 overdue' in out.getvalue())
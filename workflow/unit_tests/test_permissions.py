@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the precomputed permission index
+"""
+from __future__ import unicode_literals
+
+import time
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from workflow.models import Transition
+from workflow.permissions import permission_cache, user_groups, get_permission_index
+from workflow.unit_tests.utils import create_workflow
+
+
+class PermissionTestCase(TestCase):
+    """
+    Testing PermissionIndex
+    """
+
+    def setUp(self):
+        permission_cache.clear()
+        user_groups.clear()
+        self.user = User.objects.create(username='permission_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transition = Transition.objects.filter(workflow=self.workflow).order_by('id')[0]
+        self.state = self.transition.from_state
+
+    def test_has_perm_use(self):
+        """
+        Makes sure users can use a transition directly or through a group and
+        that changes are picked up
+        """
+        self.assertFalse(self.transition.has_perm_use(self.user))
+        self.transition.users.add(self.user)
+        self.assertTrue(self.transition.has_perm_use(self.user))
+        # Answered from the cache
+        with self.assertNumQueries(0):
+            self.assertTrue(self.transition.has_perm_use(self.user))
+            index = get_permission_index(self.workflow)
+            self.assertEqual(set([self.transition.id]), index.usable_transitions(self.user))
+        self.transition.users.remove(self.user)
+        self.assertFalse(self.transition.has_perm_use(self.user))
+
+        group = Group.objects.create(name='approvers')
+        self.transition.groups.add(group)
+        self.assertFalse(self.transition.has_perm_use(self.user))
+        self.user.groups.add(group)
+        self.assertTrue(self.transition.has_perm_use(self.user))
+        group.user_set.remove(self.user)
+        self.assertFalse(self.transition.has_perm_use(self.user))
+
+    def test_has_perm_view(self):
+        """
+        Makes sure users can view a state directly or through a group
+        """
+        group = Group.objects.create(name='viewers')
+        self.assertFalse(self.state.has_perm_view(self.user))
+        group.state_set.add(self.state)
+        self.user.groups.add(group)
+        self.assertTrue(self.state.has_perm_view(self.user))
+        group.delete()
+        self.assertFalse(self.state.has_perm_view(self.user))
+        self.state.users.add(self.user)
+        self.assertTrue(self.state.has_perm_view(self.user))
+
+    def test_expiry(self):
+        """
+        Makes sure permissions taken away without the receivers knowing (in
+        another process or with queryset methods) stop being granted once the
+        caches expire
+        """
+        group = Group.objects.create(name='expiring')
+        self.transition.groups.add(group)
+        self.user.groups.add(group)
+        other = Transition.objects.filter(workflow=self.workflow).order_by('id')[1]
+        other.users.add(self.user)
+        with override_settings(WORKFLOW_CACHE_TTL=0.01):
+            permission_cache.clear()
+            user_groups.clear()
+            self.assertTrue(self.transition.has_perm_use(self.user))
+            self.assertTrue(other.has_perm_use(self.user))
+            User.groups.through.objects.filter(user=self.user).delete()
+            Transition.users.through.objects.filter(user=self.user).delete()
+            self.assertTrue(self.transition.has_perm_use(self.user))
+            time.sleep(0.02)
+            self.assertFalse(self.transition.has_perm_use(self.user))
+            self.assertFalse(other.has_perm_use(self.user))
+
+        with override_settings(WORKFLOW_CACHE_TTL=0):
+            other.users.add(self.user)
+            self.assertTrue(other.has_perm_use(self.user))
+            Transition.users.through.objects.filter(user=self.user).delete()
+            self.assertFalse(other.has_perm_use(self.user))
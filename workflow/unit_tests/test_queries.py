@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Pins the number of queries and the index usage of the hot path so that
+regressions are caught
+"""
+from __future__ import unicode_literals
+
+import re
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from workflow.graph import graph_cache
+from workflow.models import (
+    State, Transition, Participant, WorkflowActivity, WorkflowModelRelation
+)
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Testing the number of queries of the WorkflowActivity methods (with the
+    WorkflowGraph cached)
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create(username='queries_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activity = create_activity(self.workflow, self.user)
+        self.workflow.get_graph()
+
+    def assertNumStatements(self, num, func, *args, **kwargs):
+        """
+        Like assertNumQueries but doesn't count the savepoints of the
+        transaction.atomic() blocks nested in the test case transaction
+        """
+        with CaptureQueriesContext(connection) as context:
+            func(*args, **kwargs)
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if not re.search(r'\bSAVEPOINT\b', query['sql'])
+        ]
+        self.assertEqual(num, len(statements), '\n'.join(statements))
+
+    def test_start(self):
+        # participants, latest version, current state, history insert,
+        # activity update
+        self.assertNumStatements(5, self.activity.start, self.user)
+
+    def test_progress(self):
+        # The participants are loaded by start()
+        self.activity.start(self.user)
+        self.assertNumStatements(3, self.activity.progress, self.transitions[0], self.user)
+        # Reaching the end state also marks the activity as completed
+        self.assertNumStatements(4, self.activity.progress, self.transitions[1], self.user)
+
+    def test_add_comment(self):
+        self.activity.start(self.user)
+        # history insert, activity update
+        self.assertNumStatements(2, self.activity.add_comment, self.user, 'a comment')
+
+    def test_force_stop(self):
+        self.activity.start(self.user)
+        self.assertNumStatements(4, self.activity.force_stop, self.user, 'a reason')
+
+    def test_prefetched_participants(self):
+        activity = WorkflowActivity.objects.prefetch_related('participants__user').get(
+            pk=self.activity.pk
+        )
+        self.assertNumStatements(4, activity.start, self.user)
+        self.assertNumStatements(0, lambda: [str(p) for p in activity.get_participants().values()])
+
+    def test_is_valid(self):
+        self.assertNumStatements(0, self.workflow.is_valid)
+        graph_cache.clear()
+        # states and transitions
+        self.assertNumStatements(2, self.workflow.is_valid)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reads the SQLite query plan')
+class IndexUsageTestCase(TestCase):
+    """
+    Testing the hot path lookups are answered from the composite indexes
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='indexes_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.activity = create_activity(self.workflow, self.user)
+        self.activity.start(self.user)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def index_columns(self, plan):
+        match = re.search(r'USING (?:COVERING )?INDEX (\w+)', plan)
+        self.assertTrue(match, plan)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA index_info(%s)' % match.group(1))
+            return [row[2] for row in cursor.fetchall()]
+
+    def test_participant(self):
+        plan = self.query_plan(Participant.objects.filter(
+            workflowactivity__in=[self.activity.pk], user=self.user, disabled=False
+        ))
+        self.assertEqual(
+            set(['workflowactivity_id', 'user_id']), set(self.index_columns(plan)[:2])
+        )
+
+    def test_latest_history(self):
+        plan = self.query_plan(self.activity.history.all()[:1])
+        self.assertEqual(['workflowactivity_id', 'created_on'], self.index_columns(plan))
+        self.assertFalse('TEMP B-TREE' in plan, plan)
+
+    def test_start_state(self):
+        plan = self.query_plan(State.objects.filter(workflow=self.workflow, is_start_state=True))
+        self.assertEqual(['workflow_id', 'is_start_state'], self.index_columns(plan))
+
+    def test_model_relation(self):
+        content_type = ContentType.objects.get_for_model(WorkflowActivity)
+        plan = self.query_plan(WorkflowModelRelation.objects.filter(content_type=content_type))
+        self.assertEqual('content_type_id', self.index_columns(plan)[0])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the resolution of the workflow of models and objects
+"""
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User, Group
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from workflow.models import Workflow, WorkflowModelRelation, WorkflowObjectRelation
+from workflow.resolver import model_workflows, prefetch_workflows
+
+
+class ResolverTestCase(TestCase):
+    """
+    Testing WorkflowModelRelation.get_workflow() and
+    WorkflowObjectRelation.get_workflow()
+    """
+
+    def setUp(self):
+        model_workflows.clear()
+        ContentType.objects.clear_cache()
+        self.user = User.objects.create(username='resolver_user')
+        self.workflow = Workflow.objects.create(name='model', label='model', created_by=self.user)
+        self.other = Workflow.objects.create(name='object', label='object', created_by=self.user)
+        self.content_type = ContentType.objects.get_for_model(User)
+
+    def test_model_workflow(self):
+        """
+        Makes sure the workflow of a model is cached until a relation changes
+        """
+        self.assertEqual(None, WorkflowModelRelation.get_workflow(User))
+        relation = WorkflowModelRelation.objects.create(
+            content_type=self.content_type, workflow=self.workflow
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.workflow, WorkflowModelRelation.get_workflow(User))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.workflow, WorkflowModelRelation.get_workflow(self.user))
+        self.assertEqual(None, WorkflowModelRelation.get_workflow(Group))
+
+        relation.workflow = self.other
+        relation.save()
+        self.assertEqual(self.other, WorkflowModelRelation.get_workflow(User))
+        relation.delete()
+        self.assertEqual(None, WorkflowModelRelation.get_workflow(User))
+
+    def test_cached_copies(self):
+        WorkflowModelRelation.objects.create(content_type=self.content_type, workflow=self.workflow)
+        workflow = WorkflowModelRelation.get_workflow(User)
+        workflow.name = 'changed'
+        self.assertEqual('model', WorkflowModelRelation.get_workflow(User).name)
+        self.workflow.name = 'renamed'
+        self.workflow.save()
+        self.assertEqual('renamed', WorkflowModelRelation.get_workflow(User).name)
+
+    def test_object_workflow(self):
+        """
+        Makes sure the workflow of an object falls back to the one of its model
+        """
+        other_user = User.objects.create(username='resolver_other')
+        WorkflowModelRelation.objects.create(content_type=self.content_type, workflow=self.workflow)
+        WorkflowObjectRelation.objects.create(
+            content_type=self.content_type, content_id=other_user.pk, workflow=self.other
+        )
+        self.assertEqual(self.other, WorkflowObjectRelation.get_workflow(other_user))
+        self.assertEqual(self.workflow, WorkflowObjectRelation.get_workflow(self.user))
+        self.assertEqual(self.workflow, WorkflowObjectRelation.get_workflow(User))
+        self.assertEqual(None, WorkflowObjectRelation.get_workflow(Group.objects.create(name='g')))
+
+    def test_prefetch_workflows(self):
+        """
+        Makes sure the workflows of many objects are read with one query per
+        content type
+        """
+        users = [User.objects.create(username='prefetch_%d' % i) for i in range(4)]
+        groups = [Group.objects.create(name='prefetch_%d' % i) for i in range(2)]
+        WorkflowModelRelation.objects.create(content_type=self.content_type, workflow=self.workflow)
+        for user in users[:2]:
+            WorkflowObjectRelation.objects.create(
+                content_type=self.content_type, content_id=user.pk, workflow=self.other
+            )
+        WorkflowObjectRelation.objects.create(
+            content_type=ContentType.objects.get_for_model(Group), content_id=groups[0].pk,
+            workflow=self.workflow
+        )
+        ContentType.objects.get_for_model(Group)
+
+        # The object and model level relations of each content type
+        with self.assertNumQueries(4):
+            objects = prefetch_workflows(users + groups)
+        self.assertEqual(users + groups, objects)
+        self.assertEqual(
+            [self.other, self.other, self.workflow, self.workflow, self.workflow, None],
+            [obj.workflow for obj in objects]
+        )
+        # The queryset and two batches of object relations, the model level
+        # relations are cached
+        with self.assertNumQueries(3):
+            objects = prefetch_workflows(User.objects.filter(username__startswith='prefetch'),
+                                         attname='wf', batch_size=3)
+        self.assertEqual(
+            [self.other, self.other, self.workflow, self.workflow],
+            [obj.wf for obj in sorted(objects, key=lambda obj: obj.pk)]
+        )
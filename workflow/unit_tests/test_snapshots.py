@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the point-in-time reconstruction of activities
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from workflow.archive import archive_activities
+from workflow.graph import graph_cache
+from workflow.models import (
+    Transition, WorkflowActivity, WorkflowHistory, WorkflowSnapshot, Participant
+)
+from workflow.snapshots import state_as_of, states_as_of, workflow_states_as_of, _history
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+class SnapshotTestCase(TestCase):
+    """
+    Testing take_snapshots() and the as-of queries
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.base = datetime.datetime(2020, 1, 1)
+        self.user = User.objects.create(username='snapshot_user')
+        self.other = User.objects.create(username='snapshot_other')
+        self.commenter = User.objects.create(username='snapshot_commenter')
+        self.workflow = create_workflow(self.user, states=4)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activity = create_activity(self.workflow, self.user, self.other)
+        self.at(0, WorkflowActivity.objects.filter(pk=self.activity.pk))
+        self.at(0, Participant.objects.all())
+
+        self.at(1, self.activity.start(self.user))
+        self.at(2, self.activity.progress(self.transitions[0], self.user))
+        self.at(3, self.activity.disable_participant(self.user, self.other, 'on holiday'))
+        call_command('snapshot_workflow_activities', stdout=StringIO())
+        WorkflowSnapshot.objects.update(taken_on=self.day(3.5))
+        self.at(4, self.activity.progress(self.transitions[1], self.user))
+        self.at(5, self.activity.enable_participant(self.user, self.other, 'back'))
+        self.at(5, self.activity.add_comment(self.commenter, 'hello'))
+        self.at(5, Participant.objects.filter(user=self.commenter))
+
+    def day(self, days):
+        return self.base + datetime.timedelta(days=days)
+
+    def at(self, days, history):
+        if isinstance(history, WorkflowHistory):
+            history = WorkflowHistory.objects.filter(pk=history.pk)
+        history.update(created_on=self.day(days))
+
+    def assert_as_of(self, days, state, users):
+        point = state_as_of(self.activity, self.day(days))
+        self.assertEqual(state.pk if state else None, point.state_id)
+        self.assertEqual(sorted(user.pk for user in users), point.active_user_ids)
+
+    def assert_timeline(self):
+        self.assertEqual(None, state_as_of(self.activity, self.day(-1)))
+        self.assert_as_of(0.5, None, [self.user, self.other])
+        self.assert_as_of(1.5, self.transitions[0].from_state, [self.user, self.other])
+        self.assert_as_of(3.2, self.transitions[0].to_state, [self.user])
+        self.assert_as_of(4.5, self.transitions[1].to_state, [self.user])
+        self.assert_as_of(6, self.transitions[1].to_state, [self.user, self.other, self.commenter])
+        self.assertFalse(state_as_of(self.activity, self.day(6)).completed)
+
+    def test_as_of(self):
+        """
+        Makes sure the state and active participants are replayed from the
+        snapshot as well as from the whole history
+        """
+        snapshot = WorkflowSnapshot.objects.get()
+        self.assertEqual(self.transitions[0].to_state_id, snapshot.state_id)
+        self.assertEqual(
+            {
+                Participant.objects.get(user=self.user).pk: (self.user.pk, False),
+                Participant.objects.get(user=self.other).pk: (self.other.pk, True),
+            },
+            snapshot.get_participants()
+        )
+        self.assert_timeline()
+        WorkflowSnapshot.objects.all().delete()
+        self.assert_timeline()
+
+    def test_archived(self):
+        """
+        Makes sure archived activities are replayed from the archive tables
+        """
+        self.at(6.5, self.activity.progress(self.transitions[2], self.user))
+        WorkflowActivity.objects.filter(pk=self.activity.pk).update(completed_on=self.day(6.5))
+        archive_activities([self.activity.pk])
+        self.assertFalse(WorkflowHistory.objects.filter(workflowactivity=self.activity).exists())
+        state = self.transitions[1].to_state
+        with self.assertNumQueries(7):
+            self.assert_as_of(4.5, state, [self.user])
+        self.assert_timeline()
+        self.assert_as_of(7, self.transitions[2].to_state, [self.user, self.other, self.commenter])
+        self.assertTrue(state_as_of(self.activity, self.day(7)).completed)
+        WorkflowSnapshot.objects.all().delete()
+        self.assert_timeline()
+
+    def test_history_bounds(self):
+        """
+        Makes sure only the history after its own snapshot is read for every
+        activity, even alongside activities without snapshot
+        """
+        fresh = create_activity(self.workflow, self.user)
+        self.at(1, fresh.start(self.user))
+        snapshots = dict((s.workflowactivity_id, s) for s in WorkflowSnapshot.objects.all())
+        rows = _history(WorkflowHistory, [self.activity.pk, fresh.pk], self.day(7), snapshots)
+        last = snapshots[self.activity.pk].last_history
+        self.assertEqual(
+            sorted(WorkflowHistory.objects.filter(workflowactivity=self.activity, id__gt=last)
+                   .values_list('id', flat=True)),
+            sorted(row[1] for row in rows if row[0] == self.activity.pk)
+        )
+        self.assertEqual(1, len([row for row in rows if row[0] == fresh.pk]))
+        self.assertEqual(4, len(rows))
+
+    def test_take_snapshots(self):
+        """
+        Makes sure only activities with new history are snapshotted
+        """
+        idle = create_activity(self.workflow, self.user)
+        out = StringIO()
+        call_command('snapshot_workflow_activities', stdout=out)
+        self.assertTrue('Took 1 workflow' in out.getvalue())
+        call_command('snapshot_workflow_activities', stdout=out)
+        self.assertTrue('Took 0 workflow' in out.getvalue())
+        self.assertFalse(WorkflowSnapshot.objects.filter(workflowactivity=idle).exists())
+
+    def test_bulk(self):
+        """
+        Makes sure the as-of query of many activities takes a fixed number of
+        queries
+        """
+        activities = [create_activity(self.workflow, self.user) for i in range(3)]
+        WorkflowActivity.objects.bulk_start(activities, self.user)
+        WorkflowActivity.objects.filter(pk__in=[a.pk for a in activities]).update(created_on=self.base)
+        # The ids of the activities and the five queries of the batch, plus
+        # one for the history of the activities without snapshot
+        with self.assertNumQueries(7):
+            points = workflow_states_as_of(self.workflow, datetime.datetime.today())
+        self.assertEqual(4, len(points))
+        self.assertEqual(self.transitions[1].to_state_id, points[self.activity.pk].state_id)
+        for activity in activities:
+            self.assertEqual(self.transitions[0].from_state_id, points[activity.pk].state_id)
+        self.assertEqual([self.activity.pk], list(states_as_of([self.activity], self.day(2))))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the published versions of workflows
+"""
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from workflow.exceptions import WorkflowException, UnableToActivateWorkflow, UnableToProgressWorkflow
+from workflow.graph import graph_cache
+from workflow.models import State, Transition, WorkflowActivity, WorkflowVersion
+from workflow.unit_tests.utils import create_workflow, create_activity
+from workflow.versions import version_cache
+
+
+class VersionTestCase(TestCase):
+    """
+    Testing WorkflowVersion and the activities pinned to them
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        version_cache.clear()
+        self.user = User.objects.create(username='version_user')
+        self.workflow = create_workflow(self.user, states=3)
+        self.states = list(State.objects.filter(workflow=self.workflow).order_by('pk'))
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('pk'))
+        self.transitions[0].users.add(self.user)
+
+    def skip_transition(self):
+        skip = Transition.objects.create(
+            name='Skip', workflow=self.workflow, from_state=self.states[0], to_state=self.states[2]
+        )
+        skip.users.add(self.user)
+        return skip
+
+    def test_publish(self):
+        self.assertRaises(UnableToActivateWorkflow, self.workflow.publish)
+        self.workflow.activate()
+        version = self.workflow.versions.get()
+        self.assertEqual(1, version.number)
+        self.assertEqual(
+            sorted(s.pk for s in self.states), sorted(s['key'] for s in version.get_definition()['states'])
+        )
+        self.assertRaises(WorkflowException, version.save)
+        self.assertEqual(2, self.workflow.publish().number)
+
+    def test_publish_validates_export(self):
+        """
+        Makes sure publish() validates the definition it freezes, not the
+        cached graph of the workflow
+        """
+        self.workflow.activate()
+        self.workflow.get_graph()
+        State.objects.filter(workflow=self.workflow).update(is_end_state=False)
+        self.assertRaises(UnableToActivateWorkflow, self.workflow.publish)
+        self.assertEqual(['There must be at least one end state'], self.workflow.errors['workflow'])
+        self.assertEqual(1, self.workflow.versions.count())
+
+    def test_pinned_activity(self):
+        """
+        Makes sure an activity keeps being validated against the version it
+        was started with while the live definition changes
+        """
+        self.workflow.activate()
+        version = self.workflow.versions.get()
+        pinned = create_activity(self.workflow, self.user)
+        pinned.start(self.user)
+        self.assertEqual(version.pk, WorkflowActivity.objects.get(pk=pinned.pk).workflow_version_id)
+
+        skip = self.skip_transition()
+        self.states[1].name = 'Renamed'
+        self.states[1].save()
+        self.assertRaises(UnableToProgressWorkflow, pinned.progress, skip, self.user)
+        self.assertEqual([self.transitions[0].pk], [t.pk for t in pinned.available_transitions(self.user)])
+        wh = pinned.progress(self.transitions[0], self.user)
+        self.assertEqual('State 1', wh.state.name)
+
+        # Activities started once the change is published pin the new version
+        latest = self.workflow.publish()
+        activity = create_activity(self.workflow, self.user)
+        activity.start(self.user)
+        self.assertEqual(latest.pk, activity.workflow_version_id)
+        self.assertEqual(
+            set([self.transitions[0].pk, skip.pk]),
+            set(t.pk for t in activity.available_transitions(self.user))
+        )
+        activity.progress(skip, self.user)
+        self.assertTrue(WorkflowActivity.objects.get(pk=activity.pk).completed_on)
+
+    def test_unpublished(self):
+        """
+        Makes sure the activities of unpublished workflows follow the live
+        definition
+        """
+        activity = create_activity(self.workflow, self.user)
+        activity.start(self.user)
+        self.assertEqual(None, activity.workflow_version_id)
+        activity.progress(self.skip_transition(), self.user)
+
+    def test_cached_forever(self):
+        self.workflow.activate()
+        version = self.workflow.versions.get()
+        with self.assertNumQueries(1):
+            graph = version.get_graph()
+        with self.assertNumQueries(0):
+            self.assertTrue(version.get_graph() is graph)
+            index = version.get_permission_index()
+        self.assertEqual(set([self.transitions[0].pk]), index.usable_transitions(self.user))
+        self.skip_transition()
+        self.assertTrue(WorkflowVersion.objects.get(pk=version.pk).get_graph() is graph)
+
+    def test_bulk(self):
+        self.workflow.activate()
+        version = self.workflow.versions.get()
+        activities = [create_activity(self.workflow, self.user) for i in range(3)]
+        WorkflowActivity.objects.bulk_start(activities, self.user)
+        self.assertEqual(
+            [version.pk] * 3,
+            list(WorkflowActivity.objects.filter(pk__in=[a.pk for a in activities])
+                 .values_list('workflow_version', flat=True))
+        )
+        skip = self.skip_transition()
+        history, failures = WorkflowActivity.objects.bulk_progress(activities, skip, self.user)
+        self.assertEqual([], history)
+        self.assertEqual(3, len(failures))
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            activities, self.transitions[0], self.user
+        )
+        self.assertEqual(3, len(history))
+        self.assertEqual({}, failures)
+
+    def test_rewired_transition(self):
+        """
+        Makes sure a transition is validated against the state it leaves from
+        in the pinned version even after it is changed in the live definition
+        """
+        unpinned = create_activity(self.workflow, self.user)
+        unpinned.start(self.user)
+        self.workflow.activate()
+        pinned, moved, bulk = [create_activity(self.workflow, self.user) for i in range(3)]
+        for activity in (pinned, moved, bulk):
+            activity.start(self.user)
+        moved.progress(self.transitions[0], self.user)
+        bulk.progress(self.transitions[0], self.user)
+
+        # The second transition now leaves from the start state
+        self.transitions[1].from_state = self.states[0]
+        self.transitions[1].save()
+        self.assertRaises(UnableToProgressWorkflow, pinned.progress, self.transitions[1], self.user)
+        self.assertEqual(self.states[0].pk, WorkflowActivity.objects.get(pk=pinned.pk).state_id)
+        history, failures = WorkflowActivity.objects.bulk_progress([pinned], self.transitions[1], self.user)
+        self.assertEqual([pinned.pk], list(failures))
+
+        # Pinned activities still use it from where it left in their version
+        wh = moved.progress(self.transitions[1], self.user)
+        self.assertEqual(self.states[2], wh.state)
+        # And unpinned ones from where it leaves now, in the same batch
+        history, failures = WorkflowActivity.objects.bulk_progress(
+            [bulk, unpinned], self.transitions[1], self.user
+        )
+        self.assertEqual({}, failures)
+        self.assertEqual([bulk.pk, unpinned.pk], [wh.workflowactivity_id for wh in history])
+        for activity in WorkflowActivity.objects.filter(pk__in=[bulk.pk, unpinned.pk]):
+            self.assertEqual(self.states[2].pk, activity.state_id)
+            self.assertNotEqual(None, activity.completed_on)
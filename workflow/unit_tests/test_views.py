@@ -3,10 +3,180 @@
 View tests for Workflows
 """
 import datetime
+import json
 
 from django.conf import settings
+from django.contrib.auth.models import User, Permission
+from django.core.urlresolvers import reverse
 from django.test.client import Client
 from django.test import TestCase
+from django.test.utils import override_settings
 
-from workflow.models import Workflow
+from workflow.archive import archive_activities
+from workflow.graph import graph_cache
+from workflow.models import Workflow, WorkflowActivity, Transition
 from workflow.views import *
+from workflow.unit_tests.utils import create_workflow, create_activity
+
+
+@override_settings(
+    ROOT_URLCONF='workflow.urls',
+    MIDDLEWARE_CLASSES=(
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ),
+)
+class APITestCase(TestCase):
+    """
+    Testing the JSON endpoints
+    """
+
+    def setUp(self):
+        graph_cache.clear()
+        self.user = User.objects.create_user('api_user', password='secret')
+        self.outsider = User.objects.create_user('api_outsider', password='secret')
+        self.manager = User.objects.create_user('api_manager', password='secret')
+        self.manager.user_permissions.add(Permission.objects.get(codename='can_manage_workflows'))
+        self.workflow = create_workflow(self.user, states=3)
+        self.transitions = list(Transition.objects.filter(workflow=self.workflow).order_by('id'))
+        self.activities = [create_activity(self.workflow, self.user) for i in range(3)]
+        self.other = create_activity(self.workflow, self.outsider)
+        # Ties on created_on are broken by id
+        WorkflowActivity.objects.update(created_on=datetime.datetime(2020, 1, 1))
+        self.client = Client()
+        self.client.login(username='api_user', password='secret')
+
+    def get(self, name, *args, **params):
+        headers = dict((key, params.pop(key)) for key in list(params) if key.startswith('HTTP_'))
+        return self.client.get(reverse(name, args=args), params, **headers)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.get('workflow_activity_list')
+        self.assertEqual(302, response.status_code)
+
+    def test_workflows(self):
+        response = self.get('workflow_list')
+        self.assertEqual([self.workflow.pk], [w['id'] for w in json.loads(response.content.decode())['results']])
+        data = json.loads(self.get('workflow_detail', self.workflow.pk).content.decode())
+        self.assertEqual(3, len(data['states']))
+        self.assertEqual(
+            [(t.from_state_id, t.to_state_id) for t in self.transitions],
+            [(t['from_state'], t['to_state']) for t in data['transitions']]
+        )
+        self.assertEqual(404, self.get('workflow_detail', 0).status_code)
+
+    def test_keyset_pagination(self):
+        """
+        Makes sure the pages follow each other, latest first
+        """
+        ids = sorted((a.pk for a in self.activities), reverse=True)
+        data = json.loads(self.get('workflow_activity_list', limit=2).content.decode())
+        self.assertEqual(ids[:2], [a['id'] for a in data['results']])
+        self.assertTrue(data['next'])
+        # A new activity doesn't shift the next page
+        create_activity(self.workflow, self.user)
+        data = json.loads(self.get('workflow_activity_list', limit=2, cursor=data['next']).content.decode())
+        self.assertEqual(ids[2:], [a['id'] for a in data['results']])
+        self.assertEqual(None, data['next'])
+
+        self.assertEqual(400, self.get('workflow_activity_list', cursor='garbage').status_code)
+        self.assertEqual(400, self.get('workflow_activity_list', limit='x').status_code)
+        self.assertEqual(400, self.get('workflow_activity_list', workflow='x').status_code)
+
+    def test_visibility(self):
+        """
+        Makes sure activities are only visible to their participants and to
+        the workflow managers
+        """
+        data = json.loads(self.get('workflow_activity_list').content.decode())
+        self.assertEqual(3, len(data['results']))
+        self.assertEqual(404, self.get('workflow_activity_detail', self.other.pk).status_code)
+        self.assertEqual(404, self.get('workflow_activity_history', self.other.pk).status_code)
+        self.client.login(username='api_manager', password='secret')
+        data = json.loads(self.get('workflow_activity_list', workflow=self.workflow.pk).content.decode())
+        self.assertEqual(4, len(data['results']))
+        self.assertEqual(200, self.get('workflow_activity_detail', self.other.pk).status_code)
+
+    def test_archived_visibility(self):
+        """
+        Makes sure the participants of archived activities still see them
+        """
+        activity = self.activities[0]
+        activity.start(self.user)
+        for transition in self.transitions:
+            activity.progress(transition, self.user)
+        self.assertEqual(1, archive_activities([activity.pk]))
+        data = json.loads(self.get('workflow_activity_history', activity.pk).content.decode())
+        self.assertEqual(3, len(data['results']))
+        self.assertEqual(200, self.get('workflow_activity_detail', activity.pk).status_code)
+        data = json.loads(self.get('workflow_activity_list').content.decode())
+        self.assertEqual(3, len(data['results']))
+        self.client.login(username='api_outsider', password='secret')
+        self.assertEqual(404, self.get('workflow_activity_history', activity.pk).status_code)
+
+    def test_history(self):
+        activity = self.activities[0]
+        activity.start(self.user)
+        activity.progress(self.transitions[0], self.user)
+        activity.add_comment(self.user, 'hello')
+        data = json.loads(self.get('workflow_activity_history', activity.pk, limit=2).content.decode())
+        self.assertEqual(['hello', 'To state 1'], [h['note'] or h['transition']['name'] for h in data['results']])
+        self.assertEqual('api_user', data['results'][0]['participant']['username'])
+        data = json.loads(self.get(
+            'workflow_activity_history', activity.pk, limit=2, cursor=data['next']).content.decode())
+        self.assertEqual([None], [h['transition'] for h in data['results']])
+        self.assertEqual('State 0', data['results'][0]['state']['name'])
+
+        data = json.loads(self.get('workflow_activity_detail', activity.pk).content.decode())
+        self.assertEqual('State 1', data['state']['name'])
+        self.assertEqual([{'user': self.user.pk, 'username': 'api_user', 'disabled': False}],
+                         data['participants'])
+
+    def test_conditional_get(self):
+        """
+        Makes sure unchanged activities get a 304 until their history changes
+        """
+        activity = self.activities[0]
+        activity.start(self.user)
+        response = self.get('workflow_activity_history', activity.pk)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        self.assertEqual(304, self.get('workflow_activity_history', activity.pk,
+                                       HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(304, self.get('workflow_activity_history', activity.pk,
+                                       HTTP_IF_MODIFIED_SINCE=last_modified).status_code)
+        # Other pages have their own ETag
+        self.assertEqual(200, self.get('workflow_activity_history', activity.pk, limit=1,
+                                       HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(200, self.get('workflow_activity_detail', activity.pk,
+                                       HTTP_IF_NONE_MATCH=etag).status_code)
+        # The session, the user and its permissions, then the activity and
+        # the latest history and participant: the page isn't rendered
+        with self.assertNumQueries(7):
+            self.client.get(reverse('workflow_activity_history', args=(activity.pk,)),
+                            HTTP_IF_NONE_MATCH=etag)
+
+        activity.add_comment(self.user, 'changed')
+        self.assertEqual(200, self.get('workflow_activity_history', activity.pk,
+                                       HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(404, self.get('workflow_activity_history', self.other.pk,
+                                       HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_history_export(self):
+        """
+        Makes sure the audit trail is streamed to the workflow managers only
+        """
+        self.activities[0].start(self.user)
+        self.activities[1].start(self.user)
+        self.assertEqual(403, self.get('workflow_history_export').status_code)
+        self.client.login(username='api_manager', password='secret')
+        response = self.get('workflow_history_export', workflow=self.workflow.pk)
+        self.assertTrue(response.streaming)
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual(3, len(b''.join(response.streaming_content).splitlines()))
+        response = self.get('workflow_history_export', format='jsonl', gzip='1')
+        self.assertEqual('application/gzip', response['Content-Type'])
+        self.assertTrue('workflow-history.jsonl.gz' in response['Content-Disposition'])
+        self.assertEqual(400, self.get('workflow_history_export', format='xml').status_code)
+        self.assertEqual(400, self.get('workflow_history_export', since='yesterday').status_code)
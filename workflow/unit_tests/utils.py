@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the workflow unit tests
+"""
+from __future__ import unicode_literals
+
+from workflow.models import Workflow, State, Transition, WorkflowActivity, Participant
+
+
+def create_workflow(user, name='linear workflow', states=3):
+    """
+    Creates a linear workflow: the first state is the start state, the last
+    one is the end state and each state has a single transition to the next.
+    """
+    workflow = Workflow.objects.create(name=name, label=name, created_by=user)
+    previous = None
+    for i in range(states):
+        state = State.objects.create(
+            name='State %d' % i,
+            workflow=workflow,
+            is_start_state=(i == 0),
+            is_end_state=(i == states - 1),
+            estimation_value=1,
+        )
+        if previous is not None:
+            Transition.objects.create(
+                name='To state %d' % i,
+                workflow=workflow,
+                from_state=previous,
+                to_state=state,
+            )
+        previous = state
+    return workflow
+
+
+def create_activity(workflow, user, *participants):
+    """
+    Creates a WorkflowActivity with the user (and any other user given) as
+    its participants
+    """
+    wa = WorkflowActivity.objects.create(workflow=workflow, created_by=user)
+    for u in (user,) + participants:
+        Participant.objects.create(workflowactivity=wa, user=u)
+    return wa
@@ -1,5 +1,13 @@
 from django.conf.urls import url
 
-urlpatterns = [
+from workflow import views
 
+urlpatterns = [
+    url(r'^workflows/$', views.workflow_list, name='workflow_list'),
+    url(r'^workflows/(?P<pk>\d+)/$', views.workflow_detail, name='workflow_detail'),
+    url(r'^activities/$', views.activity_list, name='workflow_activity_list'),
+    url(r'^activities/(?P<pk>\d+)/$', views.activity_detail, name='workflow_activity_detail'),
+    url(r'^activities/(?P<pk>\d+)/history/$', views.activity_history,
+        name='workflow_activity_history'),
+    url(r'^export/history/$', views.history_export, name='workflow_history_export'),
 ]
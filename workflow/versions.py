@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled graphs and permission indexes of published WorkflowVersions.
+
+A WorkflowVersion is the definition of a workflow frozen when it was activated
+(or published again). Activities pin the latest version when they are started
+and are validated against it from then on, whatever happens to the State and
+Transition rows of the workflow afterwards.
+
+Versions are never changed once created so what is compiled from them is
+cached per process for good: nothing needs to be invalidated when the live
+definition is edited, in this process or in any other.
+"""
+from __future__ import unicode_literals
+
+from django.apps import apps
+
+from workflow.graph import DefinitionCache, WorkflowGraph
+from workflow.permissions import PermissionIndex
+
+# The items of a definition that aren't fields of the State / Transition model
+REFERENCES = ('key', 'users', 'groups', 'from_state', 'to_state')
+
+
+def _fields(item):
+    return dict((name, value) for name, value in item.items() if name not in REFERENCES)
+
+
+def definition_graph(workflow_id, definition):
+    """
+    Returns the WorkflowGraph of a definition exported without natural keys.
+    Its states and transitions are unsaved instances with the ids of the rows
+    they were exported from.
+    """
+    State = apps.get_model('workflow', 'State')
+    Transition = apps.get_model('workflow', 'Transition')
+    states = [
+        State(id=item['key'], workflow_id=workflow_id, **_fields(item))
+        for item in definition['states']
+    ]
+    transitions = [
+        Transition(
+            id=item['key'], workflow_id=workflow_id, from_state_id=item['from_state'],
+            to_state_id=item['to_state'], **_fields(item)
+        ) for item in definition['transitions']
+    ]
+    return WorkflowGraph(workflow_id, states, transitions)
+
+
+class CompiledVersion(object):
+    """
+    The WorkflowGraph and PermissionIndex of a WorkflowVersion, compiled from
+    its frozen definition (see definition_graph)
+    """
+
+    def __init__(self, version_id, workflow_id, definition):
+        self.version_id = version_id
+        self.graph = definition_graph(workflow_id, definition)
+        self.permissions = PermissionIndex(
+            workflow_id,
+            [(user, item['key']) for item in definition['transitions'] for user in item['users']],
+            [(group, item['key']) for item in definition['transitions'] for group in item['groups']],
+            [(user, item['key']) for item in definition['states'] for user in item['users']],
+            [(group, item['key']) for item in definition['states'] for group in item['groups']],
+        )
+
+    @classmethod
+    def compile(cls, version_id):
+        """
+        Compiles the given WorkflowVersion (or version id) with one query
+        """
+        WorkflowVersion = apps.get_model('workflow', 'WorkflowVersion')
+        version = WorkflowVersion.objects.get(pk=version_id)
+        return cls(version.pk, version.workflow_id, version.get_definition())
+
+
+version_cache = DefinitionCache(CompiledVersion.compile, ttl=None)
+
+
+def get_version_graph(version):
+    """
+    Returns the (cached) WorkflowGraph of the given WorkflowVersion or
+    version id
+    """
+    return version_cache.get(version).graph
+
+
+def get_version_permission_index(version):
+    """
+    Returns the (cached) PermissionIndex of the given WorkflowVersion or
+    version id
+    """
+    return version_cache.get(version).permissions
@@ -1,9 +1,310 @@
 # -*- coding: utf-8 -*-
+"""
+Read only JSON endpoints for workflows, activities and their history.
+
+Lists are paginated with an opaque cursor on (created_on, id), latest first:
+every response carries the cursor of its next page (or null) that is passed
+back as the cursor parameter, so pages cost the same wherever they are and
+don't shift when new rows are inserted.
+
+The activity and history endpoints answer conditional GETs: their ETag and
+Last-Modified headers are based on the latest history row of the activity
+(and its participants) so that polling clients get cheap 304 responses.
+
+Activities are visible to their participants and to the users with the
+can_manage_workflows permission, who may also download the whole audit
+trail with history_export.
+"""
 from __future__ import unicode_literals
 
-from django.template import Context, loader
+import base64
+import hashlib
+
+from django.contrib.auth.decorators import login_required, permission_required
+from django.db.models import Q, Max, Count
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.views.decorators.http import require_GET, condition
+
+from workflow.export import FORMATS, export_history, parse_when
+from workflow.models import Workflow, WorkflowActivity, Participant
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_on, pk):
+    value = '%s|%d' % (created_on.isoformat(), pk)
+    return force_text(base64.urlsafe_b64encode(force_bytes(value)))
+
+
+def decode_cursor(cursor):
+    try:
+        created_on, pk = force_text(base64.urlsafe_b64decode(force_bytes(cursor))).split('|')
+        created_on = parse_datetime(created_on)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if created_on is None:
+        raise InvalidCursor(cursor)
+    return created_on, pk
+
+
+def paginate(request, queryset):
+    """
+    Returns the page of the queryset selected by the cursor and limit
+    parameters of the request and the cursor of the next page (or None)
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise InvalidCursor(request.GET['limit'])
+    queryset = queryset.order_by('-created_on', '-pk')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        created_on, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_on__lt=created_on) | Q(created_on=created_on, pk__lt=pk)
+        )
+    # One more row tells whether there is a next page
+    items = list(queryset[:limit + 1])
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1].created_on, items[-1].pk)
+    return items, None
+
+
+def page_response(request, queryset, serialize):
+    try:
+        items, next_cursor = paginate(request, queryset)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+    return JsonResponse({'results': [serialize(item) for item in items], 'next': next_cursor})
+
+
+def visible_activities(user):
+    """
+    Returns the activities the user may see through the API (participants of
+    archived activities are only found in the archive)
+    """
+    activities = WorkflowActivity.objects.all()
+    if not user.has_perm('workflow.can_manage_workflows'):
+        activities = activities.filter(
+            Q(participants__user=user) | Q(archived_participants__user=user)
+        ).distinct()
+    return activities
+
+
+def _named(instance):
+    return {'id': instance.pk, 'name': instance.name} if instance is not None else None
+
+
+def serialize_workflow(workflow):
+    return {
+        'id': workflow.pk,
+        'name': workflow.name,
+        'label': workflow.label,
+        'slug': workflow.slug,
+        'description': workflow.description,
+        'status': workflow.status,
+        'created_on': workflow.created_on,
+    }
+
+
+def serialize_activity(activity):
+    return {
+        'id': activity.pk,
+        'workflow': _named(activity.workflow),
+        'created_by': activity.created_by_id,
+        'created_on': activity.created_on,
+        'completed_on': activity.completed_on,
+        'state': _named(activity.state),
+        'deadline': activity.deadline,
+        'version': activity.version,
+        'workflow_version': activity.workflow_version_id,
+        'archived_on': activity.archived_on,
+    }
+
+
+def serialize_history(item):
+    return {
+        'id': item.pk,
+        'log_type': item.log_type,
+        'state': _named(item.state),
+        'transition': _named(item.transition),
+        'note': item.note,
+        'participant': {
+            'user': item.participant.user_id,
+            'username': item.participant.user.username,
+        },
+        'created_on': item.created_on,
+        'deadline': item.deadline,
+    }
+
+
+def activity_changes(request, pk):
+    """
+    Returns the visible activity and a (latest history id, latest history
+    date, number of participants, latest participant id) tuple. Both are
+    computed once per request: they are needed by the ETag, the
+    Last-Modified and the view functions.
+    """
+    cache = request.__dict__.setdefault('_workflow_activity_changes', {})
+    if pk not in cache:
+        activity = (visible_activities(request.user).filter(pk=pk)
+                    .select_related('workflow', 'state').first())
+        changes = None
+        if activity is not None:
+            history = activity.get_history(include_archived=True).order_by().aggregate(
+                latest=Max('id'), modified=Max('created_on')
+            )
+            participants = Participant.objects.filter(workflowactivity=activity).aggregate(
+                count=Count('id'), latest=Max('id')
+            )
+            changes = (history['latest'], history['modified'],
+                       participants['count'], participants['latest'])
+        cache[pk] = (activity, changes)
+    return cache[pk]
+
+
+def activity_etag(request, pk):
+    activity, changes = activity_changes(request, pk)
+    if activity is None:
+        return None
+    key = '%s|%s|%s|%s' % (request.path, request.GET.urlencode(), activity.version, changes)
+    return hashlib.md5(force_bytes(key)).hexdigest()
+
+
+def activity_last_modified(request, pk):
+    activity, changes = activity_changes(request, pk)
+    if activity is None:
+        return None
+    return changes[1] or activity.created_on
+
+
+@require_GET
+@login_required
+def workflow_list(request):
+    """
+    Lists the workflows, latest first
+    """
+    workflows = Workflow.objects.all()
+    if 'status' in request.GET:
+        if not request.GET['status'].isdigit():
+            return JsonResponse({'error': 'Invalid status'}, status=400)
+        workflows = workflows.filter(status=request.GET['status'])
+    return page_response(request, workflows, serialize_workflow)
+
+
+@require_GET
+@login_required
+def workflow_detail(request, pk):
+    """
+    Returns the workflow with its states and transitions
+    """
+    workflow = get_object_or_404(Workflow, pk=pk)
+    data = serialize_workflow(workflow)
+    data['states'] = [
+        {
+            'id': state.pk,
+            'name': state.name,
+            'is_start_state': state.is_start_state,
+            'is_end_state': state.is_end_state,
+        } for state in workflow.states.all()
+    ]
+    data['transitions'] = [
+        {
+            'id': transition.pk,
+            'name': transition.name,
+            'from_state': transition.from_state_id,
+            'to_state': transition.to_state_id,
+        } for transition in workflow.transitions.all()
+    ]
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+def activity_list(request):
+    """
+    Lists the activities visible to the user, latest first, optionally only
+    those of a workflow or in a state
+    """
+    activities = visible_activities(request.user).select_related('workflow', 'state')
+    for name in ('workflow', 'state'):
+        if name in request.GET:
+            if not request.GET[name].isdigit():
+                return JsonResponse({'error': 'Invalid %s' % name}, status=400)
+            activities = activities.filter(**{name: request.GET[name]})
+    return page_response(request, activities, serialize_activity)
+
+
+@require_GET
+@login_required
+@condition(etag_func=activity_etag, last_modified_func=activity_last_modified)
+def activity_detail(request, pk):
+    """
+    Returns the activity with its participants
+    """
+    activity, changes = activity_changes(request, pk)
+    if activity is None:
+        raise Http404('No WorkflowActivity matches the given query.')
+    data = serialize_activity(activity)
+    data['participants'] = [
+        {'user': p.user_id, 'username': p.user.username, 'disabled': p.disabled}
+        for p in sorted(activity.get_participants().values(), key=lambda p: p.pk)
+    ]
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+@condition(etag_func=activity_etag, last_modified_func=activity_last_modified)
+def activity_history(request, pk):
+    """
+    Lists the history of the activity (archived or not), latest first
+    """
+    activity, changes = activity_changes(request, pk)
+    if activity is None:
+        raise Http404('No WorkflowActivity matches the given query.')
+    history = activity.get_history(include_archived=True).select_related(
+        'state', 'transition', 'participant__user'
+    )
+    return page_response(request, history, serialize_history)
+
 
-from workflow.models import Workflow
+@require_GET
+@login_required
+@permission_required('workflow.can_manage_workflows', raise_exception=True)
+def history_export(request):
+    """
+    Streams the history of the activities (of a workflow, from since until
+    until) as CSV or JSON lines, gzipped if the gzip parameter is set
+    """
+    format = request.GET.get('format', 'csv')
+    workflow = request.GET.get('workflow')
+    if format not in FORMATS or (workflow is not None and not workflow.isdigit()):
+        return JsonResponse({'error': 'Invalid format or workflow'}, status=400)
+    try:
+        since, until = [
+            parse_when(request.GET[name]) if request.GET.get(name) else None
+            for name in ('since', 'until')
+        ]
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    compress = bool(request.GET.get('gzip'))
+    response = StreamingHttpResponse(
+        export_history(format=format, compress=compress, workflow=workflow, since=since, until=until),
+        content_type='application/gzip' if compress else (
+            'text/csv' if format == 'csv' else 'application/x-ndjson'
+        )
+    )
+    filename = 'workflow-history.%s%s' % (format, '.gz' if compress else '')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response